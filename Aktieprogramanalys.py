@@ -3,8 +3,50 @@ AKTIEANALYSPROGRAM
 Allt i en fil 
 """
 
+import argparse
+import asyncio
+import contextlib
+import csv
+import functools
+import hashlib
+import io
+import json
+import locale
+import mmap
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+
 class Aktie:
-    """Klass som representerar en aktie"""
+    """
+    Klass som representerar en aktie
+    
+    P/E-talet lagras alltid som float. Negativa P/E-tal lagras som NaN med
+    flaggan P_E_NEGATIVT satt, och egenskapen p_e_tal ger då "negativt".
+    
+    Klassvariabeln kursversion räknas upp varje gång någon akties kurser
+    ändras, så att cachar byggda på kurserna vet när de är inaktuella.
+    """
+    __slots__ = ("namn", "soliditet", "p_e_varde", "flaggor", "p_s_tal",
+                 "_historiska_kurser", "datum", "_statistik")
+    
+    # Flaggbitar i flaggor
+    P_E_NEGATIVT = 1
+    
+    kursversion = 0
+    
     def __init__(self, namn, soliditet, p_e_tal, p_s_tal):
         """
         Initierar en Aktie-instans
@@ -17,9 +59,43 @@ class Aktie:
         """
         self.namn = namn
         self.soliditet = soliditet
+        self.flaggor = 0
         self.p_e_tal = p_e_tal
         self.p_s_tal = p_s_tal
         self.historiska_kurser = []
+        self.datum = []
+        self._statistik = None
+    
+    @property
+    def historiska_kurser(self):
+        """Aktiens kurser, äldst först"""
+        return self._historiska_kurser
+    
+    @historiska_kurser.setter
+    def historiska_kurser(self, kurser):
+        self._historiska_kurser = kurser
+        Aktie.kursversion += 1
+    
+    @property
+    def p_e_tal(self):
+        """P/E-tal som float, eller "negativt" för negativa tal"""
+        if self.flaggor & Aktie.P_E_NEGATIVT:
+            return "negativt"
+        return self.p_e_varde
+    
+    @p_e_tal.setter
+    def p_e_tal(self, p_e_tal):
+        if p_e_tal == "negativt":
+            self.p_e_varde = np.nan
+            self.flaggor |= Aktie.P_E_NEGATIVT
+        else:
+            self.p_e_varde = float(p_e_tal)
+            self.flaggor &= ~Aktie.P_E_NEGATIVT
+    
+    @property
+    def p_e_negativt(self):
+        """True om företaget går med förlust"""
+        return bool(self.flaggor & Aktie.P_E_NEGATIVT)
     
     def berakna_avkastning(self):
         """
@@ -30,8 +106,12 @@ class Aktie:
         """
         if len(self.historiska_kurser) < 2:
             return 0.0
-        forsta = self.historiska_kurser[0]
-        sista = self.historiska_kurser[-1]
+        statistik = self._aktuell_statistik()
+        if statistik is not None:
+            forsta, sista = statistik.forsta, statistik.sista
+        else:
+            forsta = float(self.historiska_kurser[0])
+            sista = float(self.historiska_kurser[-1])
         avkastning = (sista / forsta) - 1
         return round(avkastning * 100, 2)
     
@@ -42,9 +122,12 @@ class Aktie:
         Returns:
             float: Lägsta kursvärdet, eller 0.0 om ingen kursdata finns
         """
-        if not self.historiska_kurser:
+        if len(self.historiska_kurser) == 0:
             return 0.0
-        return min(self.historiska_kurser)
+        statistik = self._aktuell_statistik()
+        if statistik is not None:
+            return statistik.lagsta
+        return float(np.min(self.historiska_kurser))
     
     def hamta_hogsta_kurs(self):
         """
@@ -53,9 +136,12 @@ class Aktie:
         Returns:
             float: Högsta kursvärdet, eller 0.0 om ingen kursdata finns
         """
-        if not self.historiska_kurser:
+        if len(self.historiska_kurser) == 0:
             return 0.0
-        return max(self.historiska_kurser)
+        statistik = self._aktuell_statistik()
+        if statistik is not None:
+            return statistik.hogsta
+        return float(np.max(self.historiska_kurser))
     
     def berakna_betavarde(self, marknads_avkastning):
         """
@@ -71,313 +157,2960 @@ class Aktie:
             return 0.0
         egen = self.berakna_avkastning() / 100
         return round(egen / marknads_avkastning, 2)
-
-
-def las_fundamenta(filnamn):
-    """
-    Läser aktiefundamenta från textfil
     
-    Args:
-        filnamn (str): Sökväg till filen med fundamenta
+    def tidsserie(self):
+        """
+        Returnerar aktiens kurser som en datumindexerad tidsserie
         
-    Returns:
-        dict: Dictionary med aktienamn som nyckel och Aktie-objekt som värde
-    """
-    aktier = {}
-    try:
-        with open(filnamn, 'r') as f:
-            rader = [rad.strip() for rad in f]
-    except FileNotFoundError:
-        print(f"Fel: {filnamn} hittades inte")
-        return aktier
+        Returns:
+            TidsSerie: Historiska kurser med datum som index
+        """
+        return TidsSerie(_datum_for(self), self.historiska_kurser)
     
-    i = 0
-    while i < len(rader):
-        if i + 3 >= len(rader):
-            break
-        namn = rader[i]
-        try:
-            soliditet = float(rader[i+1])
-            p_e_tal = rader[i+2]
-            if p_e_tal != "negativt":
-                p_e_tal = float(p_e_tal)
-            p_s_tal = float(rader[i+3])
-            aktier[namn] = Aktie(namn, soliditet, p_e_tal, p_s_tal)
-        except ValueError:
-            print(f"Varning: Felaktig data för {namn}, hoppar över")
-        i += 4
-    return aktier
+    def _aktuell_statistik(self):
+        """Returnerar den löpande statistiken om den gäller för nuvarande kurser"""
+        statistik = self._statistik
+        if statistik is None or statistik.kalla is not self.historiska_kurser:
+            return None
+        if statistik.antal != len(self.historiska_kurser):
+            return None
+        return statistik
+    
+    def lopande_statistik(self, fonster=None):
+        """
+        Returnerar aktiens löpande statistik, som byggs upp vid behov
+        
+        Första gången (eller om kurserna har bytts ut) byggs statistiken
+        från historiska_kurser i O(n), därefter uppdateras den i O(1) av
+        lagg_till_kurs.
+        
+        Args:
+            fonster (int): Antal kurser i fönstret för glidande lägsta/högsta kurs
+            
+        Returns:
+            LopandeStatistik: Statistiken
+        """
+        statistik = self._aktuell_statistik()
+        if statistik is None or statistik.fonster != fonster:
+            if not isinstance(self.historiska_kurser, list):
+                # Samma kurser i ny form, räknas inte som en ändring
+                self._historiska_kurser = [float(k) for k in self.historiska_kurser]
+            statistik = LopandeStatistik(fonster)
+            for kurs in self.historiska_kurser:
+                statistik.lagg_till(kurs)
+            statistik.kalla = self.historiska_kurser
+            self._statistik = statistik
+        return statistik
+    
+    def lagg_till_kurs(self, kurs, datum=None, marknads_avkastning=None):
+        """
+        Lägger till en ny kurs och uppdaterar de löpande nyckeltalen i O(1)
+        
+        Är kurserna en vy in i ett KursLager kopieras de först till en lista,
+        aktien följer då inte längre lagret.
+        
+        Args:
+            kurs (float): Ny kurs
+            datum (str eller datetime64): Kursens datum (valfritt)
+            marknads_avkastning (float): Marknadens avkastning sedan förra kursen,
+                                         som decimaltal, för löpande beta (valfritt)
+        """
+        fonster = self._statistik.fonster if self._statistik is not None else None
+        datum_lista = list(_datum_for(self)) if not isinstance(self.datum, list) else self.datum
+        statistik = self.lopande_statistik(fonster)
+        statistik.lagg_till(kurs, marknads_avkastning)
+        self.historiska_kurser.append(float(kurs))
+        Aktie.kursversion += 1
+        datum_lista.append(_NAT if datum is None else np.datetime64(datum, 'D'))
+        self.datum = datum_lista
 
 
-def las_kurser(filnamn, aktier):
+class LopandeStatistik:
     """
-    Läser historiska kurser och länkar till respektive aktie
+    Löpande nyckeltal för en kursserie som uppdateras i O(1) per ny kurs
     
-    Args:
-        filnamn (str): Sökväg till filen med kursdata
-        aktier (dict): Dictionary med Aktie-objekt
+    Håller första, sista, lägsta och högsta kurs samt summor för en
+    regressionsbeta. Med ett fönster hålls även lägsta och högsta kurs
+    bland de senaste kurserna, med monotona köer (amorterat O(1)).
     """
-    try:
-        with open(filnamn, 'r') as f:
-            nuvarande = None
-            for rad in f:
-                rad = rad.strip()
-                if not rad:
-                    continue
-                if rad in aktier:
-                    nuvarande = aktier[rad]
-                elif nuvarande and " " in rad:
-                    try:
-                        # Ta bort datum och hämta kursvärdet
-                        kurs = float(rad.split()[-1])
-                        nuvarande.historiska_kurser.append(kurs)
-                    except ValueError:
-                        continue
-    except FileNotFoundError:
-        print(f"Fel: {filnamn} hittades inte")
+    def __init__(self, fonster=None):
+        """
+        Initierar en tom LopandeStatistik
+        
+        Args:
+            fonster (int): Antal kurser i fönstret för glidande lägsta/högsta kurs
+        """
+        self.fonster = fonster
+        self.kalla = None
+        self.antal = 0
+        self.forsta = None
+        self.sista = None
+        self.lagsta = None
+        self.hogsta = None
+        self._min_ko = deque()
+        self._max_ko = deque()
+        # Antal, summa x, summa y, summa xy och summa x² för beta
+        self._beta_summor = [0, 0.0, 0.0, 0.0, 0.0]
+    
+    def lagg_till(self, kurs, marknads_avkastning=None):
+        """
+        Lägger till en kurs
+        
+        Args:
+            kurs (float): Ny kurs
+            marknads_avkastning (float): Marknadens avkastning sedan förra kursen (valfritt)
+        """
+        kurs = float(kurs)
+        if self.antal == 0:
+            self.forsta = self.lagsta = self.hogsta = kurs
+        else:
+            if marknads_avkastning is not None and self.sista != 0:
+                x = marknads_avkastning
+                y = kurs / self.sista - 1
+                summor = self._beta_summor
+                summor[0] += 1
+                summor[1] += x
+                summor[2] += y
+                summor[3] += x * y
+                summor[4] += x * x
+            self.lagsta = min(self.lagsta, kurs)
+            self.hogsta = max(self.hogsta, kurs)
+        
+        if self.fonster:
+            # Köerna hålls monotona, så första elementet är fönstrets min/max
+            while self._min_ko and self._min_ko[-1][1] >= kurs:
+                self._min_ko.pop()
+            self._min_ko.append((self.antal, kurs))
+            while self._max_ko and self._max_ko[-1][1] <= kurs:
+                self._max_ko.pop()
+            self._max_ko.append((self.antal, kurs))
+            gransen = self.antal - self.fonster
+            while self._min_ko[0][0] <= gransen:
+                self._min_ko.popleft()
+            while self._max_ko[0][0] <= gransen:
+                self._max_ko.popleft()
+        
+        self.sista = kurs
+        self.antal += 1
+    
+    def avkastning(self):
+        """Returnerar avkastningen som decimaltal, 0.0 om färre än 2 kurser"""
+        if self.antal < 2:
+            return 0.0
+        return (self.sista / self.forsta) - 1
+    
+    def fonster_lagsta(self):
+        """Returnerar lägsta kurs i fönstret, eller None utan fönster eller kurser"""
+        return self._min_ko[0][1] if self._min_ko else None
+    
+    def fonster_hogsta(self):
+        """Returnerar högsta kurs i fönstret, eller None utan fönster eller kurser"""
+        return self._max_ko[0][1] if self._max_ko else None
+    
+    def beta(self):
+        """
+        Returnerar löpande regressionsbeta mot marknaden
+        
+        Returns:
+            float: kov(aktie, marknad) / var(marknad), eller None om det inte går
+        """
+        antal, sx, sy, sxy, sxx = self._beta_summor
+        if antal < 2:
+            return None
+        varians = sxx - sx * sx / antal
+        if varians <= 0:
+            return None
+        return (sxy - sx * sy / antal) / varians
+
+
+_NAT = np.datetime64('NaT', 'D')
 
 
-def las_omx(filnamn):
+def _avrunda(varden, decimaler=2):
     """
-    Läser OMX-index historiska värden
+    Avrundar en array exakt som Pythons round(x, decimaler)
+    
+    np.round skalar upp med 10**decimaler innan avrundningen och kan då
+    avrunda åt andra hållet än round() när värdet ligger nära en halva.
+    De få värdena nära en halva avrundas därför om med round().
     
     Args:
-        filnamn (str): Sökväg till filen med OMX-data
+        varden (array): Värden att avrunda
+        decimaler (int): Antal decimaler
         
     Returns:
-        list: Lista med OMX-värden som float
+        array: Avrundade värden
     """
-    omx = []
-    try:
-        with open(filnamn, 'r') as f:
-            for rad in f:
-                rad = rad.strip()
-                if rad and " " in rad:
-                    try:
-                        varde = float(rad.split()[-1])
-                        omx.append(varde)
-                    except ValueError:
-                        continue
-    except FileNotFoundError:
-        print(f"Fel: {filnamn} hittades inte")
-    return omx
+    resultat = np.round(varden, decimaler)
+    skalat = np.abs(varden) * 10.0 ** decimaler
+    with np.errstate(invalid='ignore'):
+        nara_halva = np.abs(skalat - np.floor(skalat) - 0.5) < 1e-6
+    for i in np.flatnonzero(nara_halva):
+        resultat[i] = round(float(varden[i]), decimaler)
+    return resultat
 
 
-def visa_meny():
-    """
-    Visar huvudmenyn och hanterar användarens val
-    
-    Returns:
-        int: Vald meny-alternativ (1-4)
+def _tolka_datum(texter):
     """
-    print("\n" + "_" * 40)
-    print("MENY")
-    print("_" * 40)
-    print("1. Fundamental analys (Vid långsiktigt aktieinnehav)")
-    print("2. Teknisk analys (Vid kort aktieinnehav)")
-    print("3. Rangordning av aktier med avseende på dess betavärde")
-    print("4. Avsluta")
-    print("_" * 40)
+    Tolkar datumtexter till en datetime64[D]-array
     
-    while True:
-        try:
-            val = int(input("Vilket alternativ vill du välja? "))
-            if 1 <= val <= 4:
-                return val
-            else:
-                print("Fel! Välj mellan 1 och 4")
-        except ValueError:
-            print("Fel! Ange en siffra mellan 1 och 4")
-
-
-def valj_aktie(aktier, analys_typ):
-    """
-    Låter användaren välja en aktie från listan
+    Texter som inte går att tolka som datum blir NaT, kursen på raden
+    behålls ändå precis som innan datumen lästes in.
     
     Args:
-        aktier (dict): Dictionary med tillgängliga aktier
-        analys_typ (str): Typ av analys ("fundamental" eller "teknisk")
+        texter (list): Datumtexter, t.ex. "2024-01-31"
         
     Returns:
-        Aktie: Vald Aktie-instans, eller None om avbrutet
+        array: Datum som datetime64[D]
     """
-    namn_lista = list(aktier.keys())
-    
-    print(f"\nEn {analys_typ} analys kan utföras för följande aktier:")
-    for i, namn in enumerate(namn_lista, 1):
-        print(f"{i}. {namn}")
-    
-    while True:
-        try:
-            val = int(input(f"Vilken aktie vill du göra {analys_typ} analys på? "))
-            if 1 <= val <= len(namn_lista):
-                return aktier[namn_lista[val-1]]
-            else:
-                print(f"Felaktigt val! Välj mellan 1 och {len(namn_lista)}")
-        except ValueError:
-            print("Fel! Ange en siffra")
-        except KeyboardInterrupt:
-            return None
+    try:
+        return np.array(texter, dtype='datetime64[D]')
+    except ValueError:
+        resultat = np.full(len(texter), _NAT)
+        for i, text in enumerate(texter):
+            try:
+                resultat[i] = np.datetime64(text, 'D')
+            except ValueError:
+                continue
+        return resultat
 
 
-def gor_langsiktig_analys(aktier):
-    """
-    Gör fundamental analys av en aktie baserat på fundamenta
-    
-    Args:
-        aktier (dict): Dictionary med tillgängliga aktier
-    """
-    if not aktier:
-        print("Inga aktier!")
-        return
-    
-    aktie = valj_aktie(aktier, "fundamental")
-    if not aktie:
-        return
-    
-    print("\n" + "_" * 40)
-    print(f"Fundamental analys för {aktie.namn}")
-    print("_" * 40)
-    
-    # Använd kommatecken för procentenligt svenskt format
-    soliditet_str = str(aktie.soliditet).replace('.', ',')
-    print(f"företagets soliditet är {soliditet_str} %")
-    print(f"företagets p/e-tal är {aktie.p_e_tal}")
-    
-    # Formatera P/S-tal med kommatecken
-    p_s_str = str(aktie.p_s_tal).replace('.', ',')
-    print(f"företagets p/s-tal är {p_s_str}")
-    
-    print("\nBedömning:")
-    if aktie.soliditet > 50:
-        print("Mycket stark soliditet (>50%) - Företaget har goda marginaler")
-    elif aktie.soliditet > 30:
-        print("Godkänd soliditet (30-50%) - Företaget har stabil ekonomi")
-    else:
-        print("Låg soliditet (<30%) - Företaget har smala marginaler")
-    
-    if aktie.p_e_tal == "negativt":
-        print("Företaget går med förlust - inget P/E-tal kan beräknas")
-    elif isinstance(aktie.p_e_tal, (int, float)):
-        if aktie.p_e_tal < 15:
-            print("Bra P/E-tal (<15) - Aktien kan vara undervärderad")
-        elif aktie.p_e_tal < 25:
-            print("Normalt P/E-tal (15-25) - Aktien är rimligt värderad")
-        else:
-            print("Högt P/E-tal (>25) - Aktien kan vara övervärderad")
+def _datum_for(aktie):
+    """Returnerar aktiens datum som array, NaT om de inte hör ihop med kurserna"""
+    if len(aktie.datum) != len(aktie.historiska_kurser):
+        return np.full(len(aktie.historiska_kurser), _NAT)
+    return np.asarray(aktie.datum, dtype='datetime64[D]')
 
 
-def gor_kortsiktig_analys(aktier, marknad):
+class TidsSerie:
     """
-    Gör teknisk analys av en aktie baserat på kursutveckling
+    Tidsserie med värden indexerade av datum
     
-    Args:
-        aktier (dict): Dictionary med tillgängliga aktier
-        marknad (float): Marknadens totala avkastning som decimaltal
+    Datumen (datetime64[D]) sorteras när alla är giltiga så att intervall
+    kan slås upp med binärsökning. Finns ogiltiga datum (NaT) behålls
+    filens ordning, eftersom en felaktig rad annars skulle hamna sist.
+    Serien beter sig som en lista med värdena, så len(), indexering och
+    iteration fungerar som för en vanlig lista.
     """
-    if not aktier:
-        print("Inga aktier!")
-        return
-    
-    aktie = valj_aktie(aktier, "teknisk")
-    if not aktie:
-        return
+    def __init__(self, datum, varden):
+        """
+        Initierar en TidsSerie, osorterade giltiga datum sorteras (stabilt)
+        
+        Args:
+            datum (array): Datum för varje värde, eller None om de saknas
+            varden (array): Värdena
+        """
+        varden = np.asarray(varden, dtype=np.float64)
+        if datum is None:
+            datum = np.full(len(varden), _NAT)
+        datum = np.asarray(datum, dtype='datetime64[D]')
+        # Permutation från filens ordning till datumordning, None om samma.
+        # sorterad anger om intervall kan använda binärsökning, vilket
+        # kräver att alla datum är giltiga.
+        self.ordning = None
+        self.sorterad = not np.isnat(datum).any()
+        if self.sorterad and not (datum[1:] >= datum[:-1]).all():
+            self.ordning = np.argsort(datum, kind='stable')
+            datum = datum[self.ordning]
+            varden = varden[self.ordning]
+        self.datum = datum
+        self.varden = varden
     
-    if len(aktie.historiska_kurser) < 2:
-        print(f"Inte tillräckligt med kursdata för {aktie.namn}")
-        return
+    @classmethod
+    def _sorterad(cls, datum, varden):
+        """Skapar en TidsSerie av redan sorterade arrayer utan att kontrollera dem"""
+        serie = cls.__new__(cls)
+        serie.datum = datum
+        serie.varden = varden
+        serie.ordning = None
+        serie.sorterad = True
+        return serie
     
-    print("\n" + "_" * 40)
-    print(f"Teknisk analys för {aktie.namn}")
-    print("_" * 40)
+    def i_filordning(self):
+        """
+        Returnerar datum och värden i den ordning de lästes in
+        
+        Returns:
+            tuple: (datum, varden)
+        """
+        if self.ordning is None:
+            return self.datum, self.varden
+        datum = np.empty_like(self.datum)
+        varden = np.empty_like(self.varden)
+        datum[self.ordning] = self.datum
+        varden[self.ordning] = self.varden
+        return datum, varden
     
-    avkastning = aktie.berakna_avkastning()
-    beta = aktie.berakna_betavarde(marknad)
-    lagsta = aktie.hamta_lagsta_kurs()
-    hogsta = aktie.hamta_hogsta_kurs()
+    def __len__(self):
+        return len(self.varden)
     
-    # Formatera med kommatecken enligt svenskt format
-    avkastning_str = str(avkastning).replace('.', ',')
-    beta_str = str(beta).replace('.', ',')
-    lagsta_str = str(lagsta).replace('.', ',')
-    hogsta_str = str(hogsta).replace('.', ',')
+    def __getitem__(self, i):
+        return self.varden[i]
     
-    print(f"kursutveckling(30 senaste dagarna) {avkastning_str} %")
-    print(f"betavärde {beta_str}")
-    print(f"lägsta kurs(30 senaste dagarna) {lagsta_str}")
-    print(f"högsta kurs(30 senaste dagarna) {hogsta_str}")
+    def __iter__(self):
+        return iter(self.varden)
     
-    print("\nBedömning:")
-    if avkastning > 10:
-        print("Stark avkastning (>10%) - Mycket positiv utveckling")
-    elif avkastning > 0:
-        print("Positiv avkastning (0-10%) - God utveckling")
-    else:
-        print("Negativ avkastning - Nedåtgående trend")
+    def intervall(self, start=None, slut=None):
+        """
+        Returnerar delserien mellan två datum med binärsökning, O(log n)
+        
+        Args:
+            start (str eller datetime64): Första datum (inklusive), None för början
+            slut (str eller datetime64): Sista datum (inklusive), None för slutet
+            
+        Returns:
+            TidsSerie: Delserien, som vyer in i den här serien när datumen är sorterade
+        """
+        if not self.sorterad:
+            med = ~np.isnat(self.datum)
+            if start is not None:
+                med &= self.datum >= np.datetime64(start, 'D')
+            if slut is not None:
+                med &= self.datum <= np.datetime64(slut, 'D')
+            return TidsSerie(self.datum[med], self.varden[med])
+        i = 0 if start is None else np.searchsorted(self.datum, np.datetime64(start, 'D'), side='left')
+        j = len(self) if slut is None else np.searchsorted(self.datum, np.datetime64(slut, 'D'), side='right')
+        return TidsSerie._sorterad(self.datum[i:j], self.varden[i:j])
     
-    if beta > 1.5:
-        print("Hög risk (beta > 1,5) - Volatil aktie, stora svängningar")
-    elif beta > 0.8:
-        print("Normal risk (beta 0,8-1,5) - Normal volatilitet")
-    else:
-        print("Låg risk (beta < 0,8) - Stabil aktie, små svängningar")
-
-
-def rangordna_efter_risk(aktier, marknad):
-    """
+    def senaste(self, dagar):
+        """
+        Returnerar delserien för de senaste dagarna räknat från det senaste
+        giltiga datumet, även när serien är i filens ordning
+        
+        Args:
+            dagar (int): Antal kalenderdagar
+            
+        Returns:
+            TidsSerie: Delserien
+        """
+        giltiga = self.datum[~np.isnat(self.datum)]
+        if len(giltiga) == 0:
+            return self
+        sista = giltiga.max()
+        return self.intervall(sista - (dagar - 1), sista)
+
+
+class KursLager:
+    """
+    Kolumnlager med de historiska kurserna för alla aktier
+
+    Alla kurser ligger i en sammanhängande float64-array. Kurserna för
+    aktie nummer i finns i varden[offset[i]:offset[i+1]], och varje
+    Aktie-objekts historiska_kurser är en vy in i samma array. Datumen
+    ligger på samma sätt i en parallell datetime64-array.
+    """
+    def __init__(self, namn, varden, offset, datum=None):
+        """
+        Initierar ett KursLager
+
+        Args:
+            namn (list): Aktienamn i lagrets ordning
+            varden (array): Alla kurser efter varandra
+            offset (array): Startindex för varje aktie, längd len(namn) + 1
+            datum (array): Datum för varje kurs, eller None om de saknas
+        """
+        self.namn = list(namn)
+        self.varden = np.ascontiguousarray(varden, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.int64)
+        if datum is None:
+            datum = np.full(len(self.varden), _NAT)
+        self.datum = np.ascontiguousarray(datum, dtype='datetime64[D]')
+        # Aktie.kursversion när lagret senast kopplades till aktierna
+        self.kursversion = None
+        self.index = {n: i for i, n in enumerate(self.namn)}
+        # Sökordning för intervall(), byggs första gången den behövs
+        self._nycklar = None
+
+    @classmethod
+    def fran_aktier(cls, aktier):
+        """
+        Bygger ett KursLager från aktiernas nuvarande historiska kurser
+
+        Args:
+            aktier (dict): Dictionary med Aktie-objekt
+
+        Returns:
+            KursLager: Nytt lager med aktierna i samma ordning som i aktier
+        """
+        namn = list(aktier.keys())
+        langder = [len(aktier[n].historiska_kurser) for n in namn]
+        offset = np.zeros(len(namn) + 1, dtype=np.int64)
+        np.cumsum(langder, out=offset[1:])
+        varden = np.empty(offset[-1], dtype=np.float64)
+        datum = np.empty(offset[-1], dtype='datetime64[D]')
+        for i, n in enumerate(namn):
+            varden[offset[i]:offset[i+1]] = aktier[n].historiska_kurser
+            datum[offset[i]:offset[i+1]] = _datum_for(aktier[n])
+        return cls(namn, varden, offset, datum)
+
+    def koppla(self, aktier):
+        """
+        Låter varje aktie i lagret se sina kurser som en vy in i lagret
+
+        Args:
+            aktier (dict): Dictionary med Aktie-objekt
+        """
+        for i, n in enumerate(self.namn):
+            if n in aktier:
+                aktier[n].historiska_kurser = self.varden[self.offset[i]:self.offset[i+1]]
+                aktier[n].datum = self.datum[self.offset[i]:self.offset[i+1]]
+        self.kursversion = Aktie.kursversion
+
+    def aktuellt(self):
+        """True om ingen akties kurser har ändrats sedan lagret kopplades"""
+        return self.kursversion == Aktie.kursversion
+
+    def langder(self):
+        """Returnerar antalet kurser per aktie"""
+        return np.diff(self.offset)
+
+    def _intervallnycklar(self):
+        """
+        Bygger sökordningen för intervall() en gång per lager
+
+        Aktier vars datum är giltiga och stigande får nyckeln
+        (aktienummer, dag), som är stigande över hela lagret så att
+        varje akties intervall hittas med binärsökning. Övriga aktier får
+        bara aktienumret och filtreras i stället kurs för kurs.
+
+        Returns:
+            tuple: (nycklar, bas, osorterad) där bas är första dagen och
+                   osorterad anger aktierna som måste filtreras
+        """
+        if self._nycklar is None:
+            antal = len(self.namn)
+            aktie = np.repeat(np.arange(antal, dtype=np.int64), self.langder())
+            nat = np.isnat(self.datum)
+            dagar = self.datum.astype(np.int64)
+            bas = int(dagar[~nat].min()) if (~nat).any() else 0
+            fel = nat.copy()
+            fel[1:] |= dagar[1:] < dagar[:-1]
+            # En minskning mellan två aktier räknas inte
+            borjan = self.offset[1:-1][self.langder()[1:] > 0]
+            fel[borjan] = nat[borjan]
+            osorterad = self._reducera(np.logical_or, fel)
+            relativ = np.where(osorterad[aktie], 0, dagar - bas + 1)
+            self._nycklar = ((aktie << 32) + relativ, bas, osorterad)
+        return self._nycklar
+
+    def intervall(self, start=None, slut=None):
+        """
+        Returnerar ett nytt lager med bara kurserna mellan två datum
+
+        Varje akties intervall slås upp med binärsökning. Aktier med
+        ogiltiga (NaT) eller osorterade datum filtreras kurs för kurs.
+
+        Args:
+            start (str eller datetime64): Första datum (inklusive), None för början
+            slut (str eller datetime64): Sista datum (inklusive), None för slutet
+
+        Returns:
+            KursLager: Lager med samma aktier, så att t.ex. avkastning() gäller perioden
+        """
+        nycklar, bas, osorterad = self._intervallnycklar()
+        aktie = np.arange(len(self.namn), dtype=np.int64) << 32
+        grans = (1 << 32) - 1
+        if start is None:
+            fran = self.offset[:-1]
+        else:
+            dag = np.clip(int(np.datetime64(start, 'D').astype(np.int64)) - bas + 1, 1, grans)
+            fran = np.searchsorted(nycklar, aktie + dag, side='left')
+        if slut is None:
+            till = self.offset[1:]
+        else:
+            dag = np.clip(int(np.datetime64(slut, 'D').astype(np.int64)) - bas + 1, 0, grans)
+            till = np.searchsorted(nycklar, aktie + dag, side='right')
+        antal = np.where(osorterad, 0, np.maximum(till - fran, 0))
+
+        # Sorterade aktier: sammanhängande bitar [fran, till)
+        summa = np.cumsum(antal)
+        valda = np.arange(summa[-1] if len(summa) else 0, dtype=np.int64)
+        valda += np.repeat(fran - (summa - antal), antal)
+
+        # Övriga aktier: filtrera deras kurser
+        if osorterad.any():
+            langd = np.where(osorterad, self.langder(), 0)
+            summa_o = np.cumsum(langd)
+            kandidater = np.arange(summa_o[-1], dtype=np.int64)
+            kandidater += np.repeat(self.offset[:-1] - (summa_o - langd), langd)
+            datum = self.datum[kandidater]
+            med = ~np.isnat(datum)
+            if start is not None:
+                med &= datum >= np.datetime64(start, 'D')
+            if slut is not None:
+                med &= datum <= np.datetime64(slut, 'D')
+            kandidater = kandidater[med]
+            antal = antal + np.bincount(np.searchsorted(self.offset, kandidater, side='right') - 1,
+                                        minlength=len(self.namn))
+            valda = np.sort(np.concatenate([valda, kandidater]))
+
+        offset = np.zeros(len(self.offset), dtype=np.int64)
+        np.cumsum(antal, out=offset[1:])
+        return KursLager(self.namn, self.varden[valda], offset, self.datum[valda])
+
+    def justerad_matris(self, index):
+        """
+        Ställer upp alla aktiers kurser mot datumen i en annan tidsserie
+
+        Varje kurs slås upp bland indexets datum med binärsökning, för alla
+        aktier på en gång. Datum som saknas hos en aktie blir NaN.
+
+        Args:
+            index (TidsSerie): Serien vars datum används, t.ex. OMX
+
+        Returns:
+            array: Matris med en rad per aktie och en kolumn per datum i index
+        """
+        matris = np.full((len(self.namn), len(index)), np.nan)
+        if len(index) == 0 or len(self.varden) == 0:
+            return matris
+        index_datum = index.datum
+        ordning = None
+        if not index.sorterad:
+            # Index i filens ordning: slå upp bland de sorterade datumen
+            ordning = np.argsort(index_datum, kind='stable')
+            index_datum = index_datum[ordning]
+        pos = np.minimum(np.searchsorted(index_datum, self.datum), len(index) - 1)
+        traff = index_datum[pos] == self.datum
+        if ordning is not None:
+            pos = ordning[pos]
+        rad = np.repeat(np.arange(len(self.namn)), self.langder())
+        matris[rad[traff], pos[traff]] = self.varden[traff]
+        return matris
+
+    def dagliga_avkastningar(self, index):
+        """
+        Beräknar dagliga avkastningar för alla aktier och för index
+
+        Avkastningarna räknas mellan på varandra följande datum i index.
+        Saknas kursen någon av de två dagarna blir avkastningen NaN.
+
+        Args:
+            index (TidsSerie): Marknadsindex, t.ex. OMX
+
+        Returns:
+            tuple: (matris, marknad) där matris har en rad per aktie och en
+                   kolumn per datum i index utom det första
+        """
+        kurser = self.justerad_matris(index)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            matris = kurser[:, 1:] / kurser[:, :-1] - 1
+            marknad = index.varden[1:] / index.varden[:-1] - 1
+        return matris, marknad
+
+    @staticmethod
+    def _beta_fran_summor(antal, sx, sy, sxy, sxx):
+        """Beräknar beta = kov(x, y) / var(x) från summor, NaN om det inte går"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kovarians = sxy - sx * sy / antal
+            varians = sxx - sx * sx / antal
+            beta = kovarians / varians
+        beta[(antal < 2) | ~(varians > 0)] = np.nan
+        return beta
+
+    def regressionsbetor(self, index):
+        """
+        Beräknar regressionsbeta mot index för alla aktier i ett svep
+
+        Beta = kov(r_aktie, r_index) / var(r_index) över alla dagar där både
+        aktien och index har en daglig avkastning.
+
+        Args:
+            index (TidsSerie): Marknadsindex, t.ex. OMX
+
+        Returns:
+            array: Beta per aktie, NaN om det finns för lite data
+        """
+        matris, marknad = self.dagliga_avkastningar(index)
+        giltig = ~np.isnan(matris) & ~np.isnan(marknad)
+        x = np.where(giltig, marknad, 0.0)
+        y = np.where(giltig, matris, 0.0)
+        return self._beta_fran_summor(giltig.sum(axis=1), x.sum(axis=1), y.sum(axis=1),
+                                      np.einsum('ij,ij->i', x, y), np.einsum('ij,ij->i', x, x))
+
+    def rullande_betor(self, index, fonster=(30, 90, 250), minsta_antal=None):
+        """
+        Beräknar rullande regressionsbeta för alla aktier och fönsterstorlekar
+
+        Kumulativa summor räknas en gång, sedan fås summorna för varje fönster
+        som skillnader, så varje fönsterstorlek kostar O(n) oavsett längd.
+
+        Args:
+            index (TidsSerie): Marknadsindex, t.ex. OMX
+            fonster (tuple): Fönsterstorlekar i antal handelsdagar
+            minsta_antal (int): Minsta antal giltiga dagar i fönstret (standard: hela fönstret)
+
+        Returns:
+            dict: Fönsterstorlek -> matris med en rad per aktie och en kolumn
+                  per datum i index utom det första, NaN innan fönstret är fullt
+        """
+        matris, marknad = self.dagliga_avkastningar(index)
+        giltig = ~np.isnan(matris) & ~np.isnan(marknad)
+        x = np.where(giltig, marknad, 0.0)
+        y = np.where(giltig, matris, 0.0)
+        
+        def kumulativ(a):
+            summa = np.zeros((a.shape[0], a.shape[1] + 1))
+            np.cumsum(a, axis=1, out=summa[:, 1:])
+            return summa
+        
+        summor = [kumulativ(a) for a in (giltig.astype(np.float64), x, y, x * y, x * x)]
+        resultat = {}
+        for langd in fonster:
+            beta = np.full(matris.shape, np.nan)
+            if langd <= matris.shape[1]:
+                antal, sx, sy, sxy, sxx = (c[:, langd:] - c[:, :-langd] for c in summor)
+                krav = langd if minsta_antal is None else minsta_antal
+                beta[:, langd - 1:] = np.where(antal >= krav, self._beta_fran_summor(antal, sx, sy, sxy, sxx), np.nan)
+            resultat[langd] = beta
+        return resultat
+
+    def avkastning(self):
+        """
+        Beräknar avkastning i procent för alla aktier i ett svep
+
+        Returns:
+            array: Avkastning i procent, 0.0 för aktier med färre än 2 kurser
+        """
+        resultat = np.zeros(len(self.namn))
+        ok = self.langder() >= 2
+        forsta = self.varden[self.offset[:-1][ok]]
+        sista = self.varden[self.offset[1:][ok] - 1]
+        resultat[ok] = _avrunda(((sista / forsta) - 1) * 100)
+        return resultat
+
+    def _reducera(self, ufunc, varden=None):
+        """Kör ufunc.reduceat över varje icke-tom aktie, 0 för tomma"""
+        if varden is None:
+            varden = self.varden
+        resultat = np.zeros(len(self.namn), dtype=varden.dtype)
+        ok = self.langder() > 0
+        if ok.any():
+            resultat[ok] = ufunc.reduceat(varden, self.offset[:-1][ok])
+        return resultat
+
+    def _per_block(self, funktion, max_element=1 << 22):
+        """
+        Kör funktion på kurserna uppställda som en matris, ett block aktier i taget
+
+        Varje rad i matrisen är en akties kurser från kolumn 0, resten fylls
+        med NaN. Blocken begränsas till ungefär max_element element.
+
+        Args:
+            funktion (callable): Tar en matris och returnerar en lika stor matris
+            max_element (int): Ungefärligt största antal element per block
+
+        Returns:
+            array: Resultatet för varje kurs, i samma ordning som varden
+        """
+        resultat = np.full(len(self.varden), np.nan)
+        langder = self.langder()
+        if len(self.varden) == 0:
+            return resultat
+        rader_per_block = max(1, max_element // int(langder.max()))
+        for i in range(0, len(self.namn), rader_per_block):
+            j = min(i + rader_per_block, len(self.namn))
+            start, slut = self.offset[i], self.offset[j]
+            if start == slut:
+                continue
+            rad = np.repeat(np.arange(j - i), langder[i:j])
+            kolumn = np.arange(start, slut) - np.repeat(self.offset[i:j], langder[i:j])
+            matris = np.full((j - i, int(langder[i:j].max())), np.nan)
+            matris[rad, kolumn] = self.varden[start:slut]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                resultat[start:slut] = funktion(matris)[rad, kolumn]
+        return resultat
+
+    def _sista(self, varden):
+        """Returnerar sista värdet per aktie ur en array i lagrets ordning, NaN för tomma"""
+        resultat = np.full(len(self.namn), np.nan)
+        ok = self.langder() > 0
+        resultat[ok] = varden[self.offset[1:][ok] - 1]
+        return resultat
+
+    def glidande_medel(self, fonster=20):
+        """
+        Beräknar glidande medelvärde för alla aktier med kumulativa summor, O(n)
+
+        Args:
+            fonster (int): Antal kurser i medelvärdet
+
+        Returns:
+            array: Medelvärdet som slutar vid varje kurs, NaN innan fönstret är fullt
+        """
+        def medel(matris):
+            return _fonstersumma(matris, fonster) / fonster
+        return self._per_block(medel)
+
+    def rullande_volatilitet(self, fonster=20):
+        """
+        Beräknar rullande volatilitet (standardavvikelse för dagliga avkastningar)
+
+        Args:
+            fonster (int): Antal dagliga avkastningar i fönstret, minst 2
+
+        Returns:
+            array: Volatilitet i procent per dag för fönstret som slutar vid
+                   varje kurs, NaN innan fönstret är fullt
+        """
+        def volatilitet(matris):
+            avkastning = np.zeros_like(matris)
+            avkastning[:, 1:] = matris[:, 1:] / matris[:, :-1] - 1
+            summa = _fonstersumma(avkastning, fonster)
+            kvadrat = _fonstersumma(avkastning * avkastning, fonster)
+            varians = np.maximum((kvadrat - summa * summa / fonster) / (fonster - 1), 0.0)
+            resultat = np.sqrt(varians) * 100
+            # Första kursen saknar avkastning
+            resultat[:, :fonster] = np.nan
+            return resultat
+        return self._per_block(volatilitet)
+
+    def rsi(self, fonster=14):
+        """
+        Beräknar RSI för alla aktier
+
+        Uppgångar och nedgångar medelvärdesbildas med glidande medelvärde
+        (Cutlers RSI), så att allt kan räknas med kumulativa summor.
+
+        Args:
+            fonster (int): Antal kursförändringar i fönstret
+
+        Returns:
+            array: RSI (0-100) vid varje kurs, NaN innan fönstret är fullt
+        """
+        def rsi_matris(matris):
+            forandring = np.zeros_like(matris)
+            forandring[:, 1:] = np.diff(matris, axis=1)
+            upp = _fonstersumma(np.maximum(forandring, 0.0), fonster)
+            ned = _fonstersumma(np.maximum(-forandring, 0.0), fonster)
+            totalt = upp + ned
+            resultat = np.where(totalt > 0, 100 * upp / totalt, 50.0)
+            resultat[:, :fonster] = np.nan
+            return resultat
+        return self._per_block(rsi_matris)
+
+    def nedgang(self):
+        """
+        Beräknar nedgången från högsta kursen hittills för alla aktier
+
+        Returns:
+            array: Nedgång i procent (0 eller negativ) vid varje kurs
+        """
+        def nedgang(matris):
+            return (matris / np.fmax.accumulate(matris, axis=1) - 1) * 100
+        return self._per_block(nedgang)
+
+    def max_nedgang(self):
+        """Returnerar största nedgången från en topp i procent per aktie, 0.0 utan kurser"""
+        return self._reducera(np.fmin, self.nedgang())
+
+    def indikatorer(self, medel=20, volatilitet=20, rsi=14):
+        """
+        Beräknar de senaste tekniska indikatorerna för alla aktier
+
+        Args:
+            medel (int): Fönster för glidande medelvärde
+            volatilitet (int): Fönster för volatilitet
+            rsi (int): Fönster för RSI
+
+        Returns:
+            dict: Indikatornamn -> array med ett värde per aktie i lagrets
+                  ordning (NaN om kursdatan är för kort)
+        """
+        return {
+            "kurs": self._sista(self.varden),
+            "glidande_medel": self._sista(self.glidande_medel(medel)),
+            "volatilitet": self._sista(self.rullande_volatilitet(volatilitet)),
+            "rsi": self._sista(self.rsi(rsi)),
+            "max_nedgang": np.where(self.langder() > 0, self.max_nedgang(), np.nan),
+        }
+
+    def lagsta(self):
+        """Returnerar lägsta kurs för alla aktier (0.0 om kursdata saknas)"""
+        return self._reducera(np.minimum)
+
+    def hogsta(self):
+        """Returnerar högsta kurs för alla aktier (0.0 om kursdata saknas)"""
+        return self._reducera(np.maximum)
+
+    def betavarden(self, marknads_avkastning):
+        """
+        Beräknar betavärde för alla aktier i ett svep
+
+        Args:
+            marknads_avkastning (float): Marknadens totala avkastning som decimaltal
+
+        Returns:
+            array: Betavärden, samma definition som Aktie.berakna_betavarde
+        """
+        if marknads_avkastning == 0:
+            return np.zeros(len(self.namn))
+        return _avrunda((self.avkastning() / 100) / marknads_avkastning)
+
+
+class FundamentaIndex:
+    """
+    Sorterade index över fundamenta för snabb screening
+
+    För varje nyckeltal sparas värdena sorterade tillsammans med aktiernas
+    positioner. Ett intervallvillkor blir då två binärsökningar, och flera
+    villkor kombineras genom snitt av positionsmängderna. P/E-tal som är
+    "negativt" eller saknas (NaN) finns inte med i P/E-indexet.
+    """
+    # Nyckeltal och det attribut på Aktie som indexeras
+    KOLUMNER = {"soliditet": "soliditet", "p_e_tal": "p_e_varde", "p_s_tal": "p_s_tal"}
+
+    def __init__(self, aktier):
+        """
+        Bygger index för alla aktier
+
+        Args:
+            aktier (dict): Dictionary med aktienamn som nyckel och Aktie-objekt som värde
+        """
+        self.aktier = list(aktier.values())
+        self._varden = {}
+        self._positioner = {}
+        for kolumn, attribut in self.KOLUMNER.items():
+            par = []
+            for i, aktie in enumerate(self.aktier):
+                varde = getattr(aktie, attribut)
+                if not np.isnan(varde):
+                    par.append((varde, i))
+            par.sort()
+            self._varden[kolumn] = [varde for varde, _ in par]
+            self._positioner[kolumn] = [i for _, i in par]
+
+    def _intervall(self, kolumn, lagsta=None, hogsta=None, inklusive=False):
+        """Returnerar positionerna för aktier med lagsta < värde < hogsta"""
+        if kolumn not in self._varden:
+            raise ValueError(f"Okänt nyckeltal: {kolumn}")
+        varden = self._varden[kolumn]
+        start, slut = 0, len(varden)
+        if lagsta is not None:
+            start = (bisect_left if inklusive else bisect_right)(varden, lagsta)
+        if hogsta is not None:
+            slut = (bisect_right if inklusive else bisect_left)(varden, hogsta)
+        return self._positioner[kolumn][start:max(start, slut)]
+
+    def intervall(self, kolumn, lagsta=None, hogsta=None, inklusive=False):
+        """
+        Hämtar aktier vars nyckeltal ligger inom ett intervall
+
+        Args:
+            kolumn (str): "soliditet", "p_e_tal" eller "p_s_tal"
+            lagsta (float): Undre gräns, None för obegränsad
+            hogsta (float): Övre gräns, None för obegränsad
+            inklusive (bool): Tillåt värden lika med gränserna
+
+        Returns:
+            list: Aktie-objekt sorterade efter nyckeltalet
+        """
+        return [self.aktier[i] for i in self._intervall(kolumn, lagsta, hogsta, inklusive)]
+
+    def sok(self, inklusive=False, **villkor):
+        """
+        Hämtar aktier som uppfyller alla villkor
+
+        Exempel: sok(soliditet=(40, None), p_e_tal=(0, 15), p_s_tal=(None, 2))
+        motsvarar soliditet > 40 och 0 < P/E < 15 och P/S < 2.
+
+        Args:
+            inklusive (bool): Tillåt värden lika med gränserna
+            **villkor: Nyckeltal med (lagsta, hogsta), None för obegränsad
+
+        Returns:
+            list: Aktie-objekt i samma ordning som de lästes in
+        """
+        if not villkor:
+            return list(self.aktier)
+        traffar = sorted((self._intervall(kolumn, lagsta, hogsta, inklusive)
+                          for kolumn, (lagsta, hogsta) in villkor.items()), key=len)
+        # Börja med den minsta mängden så att snitten blir billiga
+        gemensamma = set(traffar[0])
+        for positioner in traffar[1:]:
+            if not gemensamma:
+                break
+            gemensamma.intersection_update(positioner)
+        return [self.aktier[i] for i in sorted(gemensamma)]
+
+
+class PortfoljRisk:
+    """
+    Kovarians, korrelation och portföljrisk för dagliga avkastningar
+
+    Avkastningarna ställs upp mot indexets datum (t.ex. OMX). Saknas en
+    kurs räknas kovariansen för varje par över de dagar där båda aktierna
+    har en avkastning. Matrisen räknas block för block med matrisprodukter,
+    så minnesbehovet styrs av blockstorleken i stället för antalet aktier i
+    kvadrat.
+    """
+    def __init__(self, lager, index):
+        """
+        Förbereder avkastningarna för alla aktier i lagret
+
+        Args:
+            lager (KursLager): Kurslager med aktierna
+            index (TidsSerie): Marknadsindex vars datum används som kalender
+        """
+        self.namn = list(lager.namn)
+        matris, _ = lager.dagliga_avkastningar(index)
+        giltig = ~np.isnan(matris)
+        self._x = np.where(giltig, matris, 0.0)
+        self._m = giltig.astype(np.float64)
+        self._x2 = self._x * self._x
+        self._fullstandig = bool(giltig.all())
+
+    def __len__(self):
+        return len(self.namn)
+
+    def _summor(self, i0, i1):
+        """Parvisa antal och summor för raderna i0:i1 mot alla aktier"""
+        x, m = self._x[i0:i1], self._m[i0:i1]
+        antal = m @ self._m.T
+        sx = x @ self._m.T
+        sy = m @ self._x.T
+        sxy = x @ self._x.T
+        return antal, sx, sy, sxy
+
+    def _kovarians_block(self, i0, i1):
+        """Kovarians för raderna i0:i1 mot alla aktier, NaN med färre än 2 gemensamma dagar"""
+        antal, sx, sy, sxy = self._summor(i0, i1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kovarians = (sxy - sx * sy / antal) / (antal - 1)
+        kovarians[antal < 2] = np.nan
+        return kovarians
+
+    def _korrelation_block(self, i0, i1):
+        """Korrelation för raderna i0:i1 mot alla aktier, över parets gemensamma dagar"""
+        antal, sx, sy, sxy = self._summor(i0, i1)
+        sxx = self._x2[i0:i1] @ self._m.T
+        syy = self._m[i0:i1] @ self._x2.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kovarians = sxy - sx * sy / antal
+            korrelation = kovarians / np.sqrt((sxx - sx * sx / antal) * (syy - sy * sy / antal))
+        korrelation[antal < 2] = np.nan
+        return np.clip(korrelation, -1.0, 1.0)
+
+    def block(self, storlek=1024, korrelation=False):
+        """
+        Går igenom kovarians- eller korrelationsmatrisen block för block
+
+        Args:
+            storlek (int): Antal rader per block
+            korrelation (bool): Ge korrelation i stället för kovarians
+
+        Yields:
+            tuple: (i0, i1, block) där block är raderna i0:i1 av matrisen
+        """
+        berakna = self._korrelation_block if korrelation else self._kovarians_block
+        for i0 in range(0, len(self.namn), storlek):
+            i1 = min(i0 + storlek, len(self.namn))
+            yield i0, i1, berakna(i0, i1)
+
+    def kovarians(self, storlek=1024, utfil=None, korrelation=False):
+        """
+        Bygger hela kovariansmatrisen
+
+        Args:
+            storlek (int): Antal rader per block
+            utfil (str): .npy-fil att skriva matrisen till via minnesmappning,
+                         None för att hålla den i minnet
+            korrelation (bool): Ge korrelation i stället för kovarians
+
+        Returns:
+            array: N x N-matris i lagrets ordning
+        """
+        n = len(self.namn)
+        if utfil is None:
+            resultat = np.empty((n, n))
+        else:
+            resultat = np.lib.format.open_memmap(utfil, mode='w+', dtype=np.float64, shape=(n, n))
+        for i0, i1, block in self.block(storlek, korrelation):
+            resultat[i0:i1] = block
+        if utfil is not None:
+            resultat.flush()
+        return resultat
+
+    def korrelation(self, storlek=1024, utfil=None):
+        """Bygger hela korrelationsmatrisen, se kovarians"""
+        return self.kovarians(storlek, utfil, korrelation=True)
+
+    def _viktvektor(self, vikter):
+        """Gör om vikter (dict med namn eller array i lagrets ordning) till en array"""
+        if isinstance(vikter, dict):
+            vektor = np.zeros(len(self.namn))
+            position = {n: i for i, n in enumerate(self.namn)}
+            for namn, vikt in vikter.items():
+                if namn not in position:
+                    raise ValueError(f"Okänd aktie i portföljen: {namn}")
+                vektor[position[namn]] = vikt
+            return vektor
+        vektor = np.asarray(vikter, dtype=np.float64)
+        if vektor.shape != (len(self.namn),):
+            raise ValueError(f"Vikterna måste vara {len(self.namn)} stycken")
+        return vektor
+
+    def kovarians_ganger(self, vikter, storlek=1024):
+        """
+        Beräknar kovariansmatrisen gånger viktvektorn utan att spara matrisen
+
+        Med fullständig kursdata räknas produkten direkt från avkastningarna
+        i O(N*T). Annars räknas den blockvis och par utan tillräckligt många
+        gemensamma dagar räknas som okorrelerade.
+
+        Args:
+            vikter (dict eller array): Portföljvikter
+            storlek (int): Antal rader per block
+
+        Returns:
+            array: Kovariansmatrisen gånger vikterna
+        """
+        w = self._viktvektor(vikter)
+        if self._fullstandig:
+            antal_dagar = self._x.shape[1]
+            if antal_dagar < 2:
+                return np.zeros(len(self.namn))
+            centrerad = self._x - self._x.mean(axis=1, keepdims=True)
+            return centrerad @ (centrerad.T @ w) / (antal_dagar - 1)
+        resultat = np.empty(len(self.namn))
+        for i0, i1, block in self.block(storlek):
+            resultat[i0:i1] = np.nan_to_num(block) @ w
+        return resultat
+
+    def varians(self, vikter, storlek=1024):
+        """
+        Beräknar portföljens varians w' * kovarians * w för dagliga avkastningar
+
+        Args:
+            vikter (dict eller array): Portföljvikter
+            storlek (int): Antal rader per block
+
+        Returns:
+            float: Portföljvariansen
+        """
+        w = self._viktvektor(vikter)
+        return float(w @ self.kovarians_ganger(w, storlek))
+
+    def riskbidrag(self, vikter, storlek=1024):
+        """
+        Beräknar portföljens volatilitet och varje akties bidrag till den
+
+        Marginell risk är derivatan av volatiliteten med avseende på vikten,
+        (kovarians * w) / volatilitet. Bidraget är vikten gånger den
+        marginella risken, och bidragen summerar till volatiliteten.
+
+        Args:
+            vikter (dict eller array): Portföljvikter
+            storlek (int): Antal rader per block
+
+        Returns:
+            dict: "volatilitet" (float), "marginell" och "bidrag" (arrayer i lagrets ordning)
+        """
+        w = self._viktvektor(vikter)
+        kovarians_w = self.kovarians_ganger(w, storlek)
+        volatilitet = float(np.sqrt(max(w @ kovarians_w, 0.0)))
+        if volatilitet > 0:
+            marginell = kovarians_w / volatilitet
+        else:
+            marginell = np.zeros(len(self.namn))
+        return {"volatilitet": volatilitet, "marginell": marginell, "bidrag": w * marginell}
+
+
+def _fonstersumma(matris, fonster):
+    """
+    Summerar glidande fönster längs varje rad med kumulativa summor, O(n)
+
+    Args:
+        matris (array): Tvådimensionell array
+        fonster (int): Fönsterstorlek
+
+    Returns:
+        array: Summan av fönstret som slutar i varje kolumn, NaN innan det är fullt
+    """
+    rader, kolumner = matris.shape
+    summa = np.zeros((rader, kolumner + 1))
+    np.cumsum(matris, axis=1, out=summa[:, 1:])
+    resultat = np.full(matris.shape, np.nan)
+    if fonster <= kolumner:
+        resultat[:, fonster - 1:] = summa[:, fonster:] - summa[:, :-fonster]
+    return resultat
+
+
+# Mätning av anrop och inlästa rader. Avstängd som standard: funktionerna
+# byts bara ut mot mätande varianter när aktivera_matning anropas, så
+# mätningen kostar ingenting när den inte används.
+_matning = None
+
+# Funktioner och metoder som mäts, modulnivå respektive (klass, metod)
+MATTA_FUNKTIONER = [
+    "las_fundamenta", "las_fundamenta_filer", "las_kurser", "las_kurser_bulk",
+    "las_kurser_filer", "las_omx", "las_omx_bulk", "ladda_data",
+    "gor_langsiktig_analys", "gor_kortsiktig_analys", "rangordning",
+    "rangordna_efter_risk", "skriv_batchrapport", "screena", "visa_portfoljrisk",
+]
+MATTA_METODER = [
+    ("Aktie", "berakna_avkastning"), ("Aktie", "hamta_lagsta_kurs"),
+    ("Aktie", "hamta_hogsta_kurs"), ("Aktie", "berakna_betavarde"),
+    ("Aktie", "lagg_till_kurs"), ("KursLager", "avkastning"),
+    ("KursLager", "betavarden"), ("KursLager", "indikatorer"),
+    ("KursLager", "regressionsbetor"), ("KursLager", "rullande_betor"),
+    ("KursIntag", "tillampa"), ("AnalysServer", "svara"),
+]
+
+
+class Matning:
+    """
+    Samlar antal anrop, sammanlagd tid och tolkade/avvisade rader per funktion
+    """
+    
+    def __init__(self):
+        # namn -> [antal anrop, sekunder]
+        self.anrop = {}
+        # namn -> [tolkade rader, avvisade rader]
+        self.rader = {}
+        self._original = []
+    
+    def anrop_klart(self, namn, sekunder):
+        """Registrerar ett avslutat anrop"""
+        post = self.anrop.get(namn)
+        if post is None:
+            post = self.anrop[namn] = [0, 0.0]
+        post[0] += 1
+        post[1] += sekunder
+    
+    def rakna_rader(self, namn, tolkade, avvisade):
+        """Registrerar tolkade och avvisade rader för en inläsning"""
+        post = self.rader.get(namn)
+        if post is None:
+            post = self.rader[namn] = [0, 0]
+        post[0] += tolkade
+        post[1] += avvisade
+    
+    def sammanfattning(self):
+        """
+        Returnerar mätningarna som en struktur som går att göra om till JSON
+        
+        Returns:
+            dict: {"anrop": {namn: {"antal", "sekunder"}},
+                   "rader": {namn: {"tolkade", "avvisade"}}}
+        """
+        return {
+            "anrop": {namn: {"antal": antal, "sekunder": sekunder}
+                      for namn, (antal, sekunder) in sorted(self.anrop.items())},
+            "rader": {namn: {"tolkade": tolkade, "avvisade": avvisade}
+                      for namn, (tolkade, avvisade) in sorted(self.rader.items())},
+        }
+    
+    def prometheus(self):
+        """
+        Returnerar mätningarna i Prometheus textformat
+        
+        Returns:
+            str: Mätvärdena, ett per rad
+        """
+        rader = []
+        for matvarde, hjalp, data, index in (
+                ("aktie_anrop_totalt", "Antal anrop", self.anrop, 0),
+                ("aktie_anrop_sekunder_totalt", "Sammanlagd tid i sekunder", self.anrop, 1),
+                ("aktie_rader_tolkade_totalt", "Antal tolkade rader", self.rader, 0),
+                ("aktie_rader_avvisade_totalt", "Antal avvisade rader", self.rader, 1)):
+            rader.append(f"# HELP {matvarde} {hjalp}")
+            rader.append(f"# TYPE {matvarde} counter")
+            for namn, varden in sorted(data.items()):
+                rader.append(f'{matvarde}{{funktion="{namn}"}} {varden[index]}')
+        return "\n".join(rader) + "\n"
+    
+    def skriv(self, fil=None):
+        """Skriver en läsbar tabell över mätningarna"""
+        fil = fil if fil is not None else sys.stdout
+        print(f"{'Funktion':<36} {'Anrop':>8} {'Sekunder':>10} {'ms/anrop':>10}", file=fil)
+        for namn, (antal, sekunder) in sorted(self.anrop.items(), key=lambda p: -p[1][1]):
+            print(f"{namn:<36} {antal:>8} {sekunder:>10.4f} {1000 * sekunder / antal:>10.4f}", file=fil)
+        if self.rader:
+            print(f"\n{'Inläsning':<36} {'Tolkade':>12} {'Avvisade':>10}", file=fil)
+            for namn, (tolkade, avvisade) in sorted(self.rader.items()):
+                print(f"{namn:<36} {tolkade:>12} {avvisade:>10}", file=fil)
+    
+    def spara(self, filnamn):
+        """Sparar mätningarna, i Prometheus textformat om filen inte slutar på .json"""
+        with open(filnamn, 'w', encoding='utf-8') as f:
+            if filnamn.endswith(".json"):
+                json.dump(self.sammanfattning(), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(self.prometheus())
+
+
+def _matt(funktion, namn, matning):
+    """Returnerar en variant av funktionen som mäter anropen"""
+    @functools.wraps(funktion)
+    def mattad(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return funktion(*args, **kwargs)
+        finally:
+            matning.anrop_klart(namn, time.perf_counter() - start)
+    return mattad
+
+
+def aktivera_matning():
+    """
+    Slår på mätningen genom att byta ut de mätta funktionerna
+    
+    Returns:
+        Matning: Den aktiva mätningen (samma om den redan är påslagen)
+    """
+    global _matning
+    if _matning is not None:
+        return _matning
+    matning = Matning()
+    moduldata = globals()
+    for namn in MATTA_FUNKTIONER:
+        original = moduldata[namn]
+        matning._original.append((None, namn, original))
+        moduldata[namn] = _matt(original, namn, matning)
+    for klassnamn, namn in MATTA_METODER:
+        klass = moduldata[klassnamn]
+        original = klass.__dict__[namn]
+        matning._original.append((klass, namn, original))
+        setattr(klass, namn, _matt(original, f"{klassnamn}.{namn}", matning))
+    _matning = matning
+    return matning
+
+
+def avaktivera_matning():
+    """
+    Slår av mätningen och återställer de ursprungliga funktionerna
+    
+    Returns:
+        Matning: Den avslutade mätningen, eller None om ingen var påslagen
+    """
+    global _matning
+    matning = _matning
+    if matning is None:
+        return None
+    moduldata = globals()
+    for klass, namn, original in reversed(matning._original):
+        if klass is None:
+            moduldata[namn] = original
+        else:
+            setattr(klass, namn, original)
+    matning._original = []
+    _matning = None
+    return matning
+
+
+def _rakna_rader(namn, tolkade, avvisade):
+    """Registrerar inlästa rader om mätningen är påslagen"""
+    if _matning is not None:
+        _matning.rakna_rader(namn, tolkade, avvisade)
+
+
+# Öka när innehållet i cachefilerna ändras så att gamla cachar ignoreras
+CACHE_VERSION = 4
+
+
+def _cachefil(filnamn):
+    """Returnerar sökvägen till cachefilen för en källfil"""
+    return filnamn + ".cache.npz"
+
+
+def _kallsignatur(filnamn):
+    """
+    Returnerar källfilens signatur (cacheversion, storlek och ändringstid)
+    
+    Args:
+        filnamn (str): Sökväg till källfilen
+        
+    Returns:
+        array: Signaturen, eller None om filen inte finns
+    """
+    try:
+        st = os.stat(filnamn)
+    except OSError:
+        return None
+    return np.array([CACHE_VERSION, st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def _namnnyckel(aktier):
+    """Returnerar en nyckel för vilka aktier (och i vilken ordning) som finns"""
+    return hashlib.sha1("\n".join(aktier).encode("utf-8")).hexdigest()
+
+
+def _las_cache(filnamn, nyckel=""):
+    """
+    Läser cachen för en källfil om den finns och fortfarande gäller
+    
+    Cachen gäller bara om källfilens storlek och ändringstid är desamma
+    som när cachen skrevs och nyckeln stämmer.
+    
+    Args:
+        filnamn (str): Sökväg till källfilen
+        nyckel (str): Extra nyckel som cachen måste ha skrivits med
+        
+    Returns:
+        dict: Arrayerna i cachen, eller None om cachen saknas eller är inaktuell
+    """
+    signatur = _kallsignatur(filnamn)
+    if signatur is None:
+        return None
+    try:
+        with np.load(_cachefil(filnamn), allow_pickle=False) as data:
+            if not np.array_equal(data["signatur"], signatur) or str(data["nyckel"]) != nyckel:
+                return None
+            return {k: data[k] for k in data.files}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def _skriv_cache(filnamn, signatur, nyckel="", **arrayer):
+    """
+    Skriver cachen för en källfil
+    
+    Args:
+        filnamn (str): Sökväg till källfilen
+        signatur (array): Källfilens signatur, tagen innan filen lästes
+        nyckel (str): Extra nyckel som måste stämma när cachen läses
+        **arrayer: Arrayer som ska sparas
+    """
+    if signatur is None:
+        return
+    tmp = _cachefil(filnamn) + ".tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            np.savez(f, signatur=signatur, nyckel=np.array(nyckel), **arrayer)
+        os.replace(tmp, _cachefil(filnamn))
+    except OSError:
+        # Cachen är bara en optimering, t.ex. en skrivskyddad katalog är inget fel
+        pass
+
+
+def _kurslager_fran_cache(filnamn, aktier, matningsnamn):
+    """
+    Hämtar kurslagret för en kursfil från cachen och kopplar aktierna till det
+    
+    Raderna räknas som vid en vanlig inläsning, med antalet avvisade rader
+    som sparades i cachen.
+    
+    Args:
+        filnamn (str): Sökväg till kursfilen
+        aktier (dict): Dictionary med Aktie-objekt
+        matningsnamn (str): Namnet raderna räknas under
+        
+    Returns:
+        KursLager: Lagret, eller None om det inte fanns någon giltig cache
+    """
+    if any(len(a.historiska_kurser) for a in aktier.values()):
+        return None
+    data = _las_cache(filnamn, _namnnyckel(aktier))
+    if data is None:
+        return None
+    lager = KursLager(data["namn"].tolist(), data["varden"], data["offset"], data["datum"])
+    _rakna_rader(matningsnamn, len(lager.varden), int(data["avvisade"]))
+    lager.koppla(aktier)
+    return lager
+
+
+def _spara_kurslager(filnamn, signatur, aktier, lager, avvisade):
+    """Sparar ett nyinläst kurslager och antalet avvisade rader i cachen för kursfilen"""
+    _skriv_cache(filnamn, signatur, _namnnyckel(aktier),
+                 namn=np.array(lager.namn, dtype=str), varden=lager.varden,
+                 offset=lager.offset, datum=lager.datum, avvisade=np.int64(avvisade))
+
+
+def _tolka_fundamentafil(filnamn, cache=False):
+    """
+    Läser en fundamentafil till kompakta arrayer
+    
+    Används både direkt och i arbetsprocesser, varningarna returneras
+    därför i stället för att skrivas ut. Varningarna sparas i cachen så
+    att de kommer med även när filen inte tolkas om.
+    
+    Args:
+        filnamn (str): Sökväg till filen med fundamenta
+        cache (bool): Använd och skriv en binär cache bredvid filen
+        
+    Returns:
+        tuple: (arrayer, varningar), eller None om filen inte finns
+    """
+    if cache:
+        data = _las_cache(filnamn)
+        if data is not None:
+            return data, data.pop("varningar").tolist()
+    signatur = _kallsignatur(filnamn)
+    
+    try:
+        with open(filnamn, 'r') as f:
+            rader = [rad.strip() for rad in f]
+    except FileNotFoundError:
+        return None
+    
+    aktier = {}
+    varningar = []
+    i = 0
+    while i < len(rader):
+        if i + 3 >= len(rader):
+            break
+        namn = rader[i]
+        try:
+            soliditet = float(rader[i+1])
+            p_e_tal = rader[i+2]
+            if p_e_tal != "negativt":
+                p_e_tal = float(p_e_tal)
+            p_s_tal = float(rader[i+3])
+            aktier[namn] = Aktie(namn, soliditet, p_e_tal, p_s_tal)
+        except ValueError:
+            varningar.append(f"Varning: Felaktig data för {namn}, hoppar över")
+        i += 4
+    
+    arrayer = {
+        "namn": np.array(list(aktier), dtype=str),
+        "soliditet": np.array([a.soliditet for a in aktier.values()], dtype=np.float64),
+        "p_e_tal": np.array([a.p_e_varde for a in aktier.values()], dtype=np.float64),
+        "p_e_negativt": np.array([a.p_e_negativt for a in aktier.values()], dtype=bool),
+        "p_s_tal": np.array([a.p_s_tal for a in aktier.values()], dtype=np.float64),
+    }
+    if cache:
+        _skriv_cache(filnamn, signatur, varningar=np.array(varningar, dtype=str), **arrayer)
+    return arrayer, varningar
+
+
+def _lagg_till_fundamenta(aktier, arrayer):
+    """Skapar Aktie-objekt från arrayerna och lägger dem i aktier"""
+    for namn, soliditet, p_e_tal, negativt, p_s_tal in zip(
+            arrayer["namn"].tolist(), arrayer["soliditet"].tolist(), arrayer["p_e_tal"].tolist(),
+            arrayer["p_e_negativt"].tolist(), arrayer["p_s_tal"].tolist()):
+        aktier[namn] = Aktie(namn, soliditet, "negativt" if negativt else p_e_tal, p_s_tal)
+
+
+def las_fundamenta(filnamn, cache=False):
+    """
+    Läser aktiefundamenta från textfil
+    
+    Args:
+        filnamn (str): Sökväg till filen med fundamenta
+        cache (bool): Använd och skriv en binär cache bredvid filen
+        
+    Returns:
+        dict: Dictionary med aktienamn som nyckel och Aktie-objekt som värde
+    """
+    return las_fundamenta_filer([filnamn], processer=1, cache=cache)
+
+
+def _karta(funktion, processer, *argument):
+    """
+    Kör funktion för varje uppsättning argument, i en processpool om det lönar sig
+    
+    Resultaten kommer alltid i samma ordning som argumenten.
+    
+    Args:
+        funktion (callable): Funktion på modulnivå (måste gå att pickla)
+        processer (int): Antal processer, None för en per kärna
+        *argument: Iterabler med argument, som för map()
+        
+    Returns:
+        list: Resultaten
+    """
+    argument = [list(a) for a in argument]
+    antal = len(argument[0])
+    if processer is None:
+        processer = os.cpu_count() or 1
+    processer = min(processer, antal)
+    if processer <= 1:
+        return list(map(funktion, *argument))
+    with ProcessPoolExecutor(max_workers=processer) as pool:
+        return list(pool.map(funktion, *argument))
+
+
+def las_fundamenta_filer(filnamn_lista, processer=None, cache=False):
+    """
+    Läser fundamenta från flera filer, parallellt i en processpool
+    
+    Filerna tolkas var för sig i arbetsprocesser som returnerar arrayer.
+    Resultaten slås ihop i filernas ordning, så en aktie som finns i flera
+    filer får värdena från den sista, precis som om filerna lästs efter
+    varandra.
+    
+    Args:
+        filnamn_lista (list): Sökvägar till filerna med fundamenta
+        processer (int): Antal processer, None för en per kärna
+        cache (bool): Använd och skriv en binär cache bredvid varje fil
+        
+    Returns:
+        dict: Dictionary med aktienamn som nyckel och Aktie-objekt som värde
+    """
+    aktier = {}
+    for filnamn, resultat in zip(filnamn_lista, _karta(_tolka_fundamentafil, processer,
+                                                       filnamn_lista, repeat(cache, len(filnamn_lista)))):
+        if resultat is None:
+            print(f"Fel: {filnamn} hittades inte")
+            continue
+        arrayer, varningar = resultat
+        _rakna_rader("las_fundamenta_filer", len(arrayer["namn"]), len(varningar))
+        for varning in varningar:
+            print(varning)
+        _lagg_till_fundamenta(aktier, arrayer)
+    return aktier
+
+
+def las_kurser(filnamn, aktier, cache=False):
+    """
+    Läser historiska kurser och länkar till respektive aktie
+    
+    Args:
+        filnamn (str): Sökväg till filen med kursdata
+        aktier (dict): Dictionary med Aktie-objekt
+        cache (bool): Använd och skriv en binär cache bredvid filen
+        
+    Returns:
+        KursLager: Lager med alla kurser, som aktierna nu är kopplade till
+    """
+    if cache:
+        lager = _kurslager_fran_cache(filnamn, aktier, "las_kurser")
+        if lager is not None:
+            return lager
+    signatur = _kallsignatur(filnamn)
+    fran_borjan = not any(len(a.historiska_kurser) for a in aktier.values())
+    
+    kurser = {}
+    avvisade = 0
+    try:
+        with open(filnamn, 'r') as f:
+            nuvarande = None
+            for rad in f:
+                rad = rad.strip()
+                if not rad:
+                    continue
+                if rad in aktier:
+                    if rad not in kurser:
+                        kurser[rad] = ([], [])
+                    nuvarande = kurser[rad]
+                elif nuvarande is not None and " " in rad:
+                    try:
+                        # Dela upp raden i datum och kursvärde
+                        falt = rad.split()
+                        kurs = float(falt[-1])
+                        nuvarande[0].append(kurs)
+                        nuvarande[1].append(falt[0])
+                    except ValueError:
+                        avvisade += 1
+                        continue
+    except FileNotFoundError:
+        print(f"Fel: {filnamn} hittades inte")
+    _rakna_rader("las_kurser", sum(len(k) for k, _ in kurser.values()), avvisade)
+    
+    for namn, (nya_kurser, nya_datum) in kurser.items():
+        aktie = aktier[namn]
+        aktie.datum = np.concatenate([_datum_for(aktie), _tolka_datum(nya_datum)])
+        aktie.historiska_kurser = list(aktie.historiska_kurser) + nya_kurser
+    lager = KursLager.fran_aktier(aktier)
+    lager.koppla(aktier)
+    if cache and fran_borjan:
+        _spara_kurslager(filnamn, signatur, aktier, lager, avvisade)
+    return lager
+
+
+# Bytevärden som str.strip()/str.split() räknar som blanktecken
+_BLANKTECKEN = np.array([chr(c).isspace() for c in range(256)]) & (np.arange(256) < 128)
+_BLOCKSTORLEK = 1024 * 1024
+
+
+def _las_block(filnamn, blockstorlek=_BLOCKSTORLEK):
+    """
+    Minnesmappar en fil och delar den i block som slutar på hela rader
+    
+    Args:
+        filnamn (str): Sökväg till filen
+        blockstorlek (int): Ungefärlig storlek på varje block i byte
+        
+    Yields:
+        array: Blocket som uint8-array
+    """
+    with open(filnamn, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < len(mm):
+                if pos + blockstorlek >= len(mm):
+                    slut = len(mm)
+                else:
+                    slut = mm.rfind(b"\n", pos, pos + blockstorlek) + 1
+                    if slut <= pos:
+                        # Raden är längre än ett block, ta hela raden
+                        slut = mm.find(b"\n", pos + blockstorlek) + 1 or len(mm)
+                yield np.frombuffer(mm[pos:slut], dtype=np.uint8)
+                pos = slut
+
+
+def _tolka_decimaltal(tecken, langd):
+    """
+    Tolkar decimaltal av formen [+-]siffror[.siffror] ur en teckenmatris
+    
+    Mantissan byggs som ett heltal och delas med en tiopotens. Båda är
+    exakta för högst 15 siffror, så resultatet blir detsamma som med float().
+    
+    Args:
+        tecken (array): uint8-matris med ett tecken per rad och ett fält per
+                        kolumn, utfylld med nollor
+        langd (array): Fältets längd per kolumn
+        
+    Returns:
+        tuple: (varden, ok) där ok anger vilka fält som kunde tolkas
+    """
+    n = tecken.shape[1]
+    ok = np.ones(n, dtype=bool)
+    mantissa = np.zeros(n)
+    antal_siffror = np.zeros(n, dtype=np.int8)
+    decimaler = np.zeros(n, dtype=np.int8)
+    punkt_sedd = np.zeros(n, dtype=bool)
+    for k, rad in enumerate(tecken):
+        siffra = (rad - 48) <= 9
+        punkt = rad == 46
+        tillatet = siffra | punkt | (langd <= k)
+        if k == 0:
+            tillatet |= (rad == 43) | (rad == 45)
+        else:
+            # Högst en decimalpunkt
+            tillatet &= ~(punkt & punkt_sedd)
+        ok &= tillatet
+        mantissa = np.where(siffra, mantissa * 10 + (rad - 48), mantissa)
+        antal_siffror += siffra
+        decimaler += siffra & punkt_sedd
+        punkt_sedd |= punkt
+    ok &= (antal_siffror >= 1) & (antal_siffror <= 15)
+    varden = mantissa / 10.0 ** decimaler
+    np.negative(varden, out=varden, where=tecken[0] == 45)
+    return varden, ok
+
+
+_DAGAR_I_MANAD = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int32)
+
+
+def _tolka_iso_datum(tecken, langd):
+    """
+    Tolkar datum på formen ÅÅÅÅ-MM-DD ur en teckenmatris
+    
+    Dagnumret räknas fram med heltalsaritmetik (days_from_civil), vilket
+    är mycket snabbare än att tolka texterna med datetime64.
+    
+    Args:
+        tecken (array): uint8-matris med tio rader (ett tecken per rad) och
+                        ett fält per kolumn
+        langd (array): Fältets längd per kolumn
+        
+    Returns:
+        tuple: (datum, ok) där ok anger vilka fält som var giltiga datum
+    """
+    ok = (langd == 10) & (tecken[4] == 45) & (tecken[7] == 45)
+    for k in (0, 1, 2, 3, 5, 6, 8, 9):
+        ok &= (tecken[k] - 48) <= 9
+    siffra = [tecken[k].astype(np.int32) - 48 for k in range(10)]
+    ar = ((siffra[0] * 10 + siffra[1]) * 10 + siffra[2]) * 10 + siffra[3]
+    manad = siffra[5] * 10 + siffra[6]
+    dag = siffra[8] * 10 + siffra[9]
+    
+    skottar = (ar % 4 == 0) & ((ar % 100 != 0) | (ar % 400 == 0))
+    dagar_i_manad = _DAGAR_I_MANAD[np.clip(manad, 1, 12) - 1] + (skottar & (manad == 2))
+    ok &= (manad >= 1) & (manad <= 12) & (dag >= 1) & (dag <= dagar_i_manad)
+    
+    # Dagar sedan 1970-01-01, med året räknat från mars
+    ar = ar - (manad <= 2)
+    era = ar // 400
+    ar_i_era = ar - era * 400
+    dag_i_ar = (153 * (manad + np.where(manad > 2, -3, 9)) + 2) // 5 + dag - 1
+    dag_i_era = ar_i_era * 365 + ar_i_era // 4 - ar_i_era // 100 + dag_i_ar
+    datum = (era.astype(np.int64) * 146097 + dag_i_era - 719468).view('datetime64[D]')
+    datum[~ok] = _NAT
+    return datum, ok
+
+
+# Längre fält än så här kan inte vara decimaltal med högst 15 siffror och
+# tolkas med float() i stället, så att ett enda långt felaktigt fält inte
+# gör teckenmatrisen bred för alla rader
+_MAX_FALTBREDD = 32
+
+
+def _samla_tecken(buf, start, langd, bredd):
+    """
+    Hämtar ett fält per rad ur blocket till en teckenmatris
+    
+    Args:
+        buf (array): Block som uint8-array
+        start (array): Fältens startindex i blocket
+        langd (array): Fältens längd
+        bredd (int): Antal tecken som hämtas per fält
+        
+    Returns:
+        array: uint8-matris (bredd, antal fält), utfylld med nollor efter fältets slut
+    """
+    utfylld = np.concatenate([buf, np.zeros(bredd, dtype=np.uint8)])
+    tecken = np.empty((bredd, len(start)), dtype=np.uint8)
+    for k in range(bredd):
+        np.take(utfylld, start + k, out=tecken[k])
+        tecken[k] *= langd > k
+    return tecken
+
+
+def _analysera_block(buf):
+    """
+    Delar ett block i rader och tolkar första och sista fältet på varje rad
+    
+    Raderna strippas och tolkas på samma sätt som i las_kurser, men för
+    hela blocket på en gång i stället för rad för rad.
+    
+    Args:
+        buf (array): Block som uint8-array
+        
+    Returns:
+        tuple: (start, slut, ar_kurs, kurs, datum, felaktig) per rad, där
+               start:slut är den strippade raden, ar_kurs anger giltiga
+               kursrader, kurs och datum innehåller kursvärde och datum för
+               dessa och felaktig anger rader med mellanslag vars sista fält
+               inte är ett tal
+    """
+    radslut = np.flatnonzero(buf == 10)
+    if len(buf) and buf[-1] != 10:
+        radslut = np.append(radslut, len(buf))
+    start = np.zeros(len(radslut), dtype=np.int64)
+    start[1:] = radslut[:-1] + 1
+    slut = radslut.astype(np.int64)
+    
+    # Strippa blanktecken i början och slutet av varje rad
+    idx = np.flatnonzero(start < slut)
+    while len(idx):
+        idx = idx[_BLANKTECKEN[buf[start[idx]]]]
+        start[idx] += 1
+        idx = idx[start[idx] < slut[idx]]
+    idx = np.flatnonzero(start < slut)
+    while len(idx):
+        idx = idx[_BLANKTECKEN[buf[slut[idx] - 1]]]
+        slut[idx] -= 1
+        idx = idx[start[idx] < slut[idx]]
+    
+    # En kursrad innehåller ett mellanslag, kursen är sista fältet
+    mellanslag = np.flatnonzero(buf == 32)
+    j = np.searchsorted(mellanslag, slut) - 1
+    ar_kurs = (j >= 0) & (start < slut)
+    ar_kurs[ar_kurs] = mellanslag[j[ar_kurs]] >= start[ar_kurs]
+    
+    kandidater = np.flatnonzero(ar_kurs)
+    falt_start = mellanslag[j[kandidater]] + 1
+    falt_langd = slut[kandidater] - falt_start
+    
+    kurs = np.zeros(len(start))
+    giltig = np.zeros(len(kandidater), dtype=bool)
+    if len(kandidater):
+        bredd = min(int(falt_langd.max()), _MAX_FALTBREDD)
+        tecken = _samla_tecken(buf, falt_start, falt_langd, bredd)
+        varden, giltig = _tolka_decimaltal(tecken, falt_langd)
+        giltig &= falt_langd <= bredd
+        kurs[kandidater] = varden
+        
+        # Övriga fält (t.ex. "1e5", tabbar, för långa eller felaktiga
+        # värden) tolkas ett i taget precis som i las_kurser
+        for i in np.flatnonzero(~giltig):
+            rad = buf[start[kandidater[i]]:slut[kandidater[i]]].tobytes()
+            try:
+                kurs[kandidater[i]] = float(rad.split()[-1])
+                giltig[i] = True
+            except ValueError:
+                continue
+    felaktig = np.zeros(len(start), dtype=bool)
+    felaktig[kandidater[~giltig]] = True
+    ar_kurs[felaktig] = False
+    
+    # Datumet är första fältet på kursraden
+    kandidater = kandidater[giltig]
+    datum = np.full(len(start), _NAT)
+    if len(kandidater):
+        datum_start = start[kandidater]
+        datum_langd = mellanslag[np.searchsorted(mellanslag, datum_start)] - datum_start
+        tecken = _samla_tecken(buf, datum_start, datum_langd, 10)
+        iso_datum, ok = _tolka_iso_datum(tecken, datum_langd)
+        datum[kandidater] = iso_datum
+        for i in np.flatnonzero(~ok):
+            rad = buf[start[kandidater[i]]:slut[kandidater[i]]].tobytes()
+            datum[kandidater[i]] = _tolka_datum([rad.split()[0].decode('latin-1')])[0]
+    return start, slut, ar_kurs, kurs, datum, felaktig
+
+
+def _rapportera_hastighet(filnamn, starttid):
+    """Skriver ut hur snabbt en fil lästes in i MB/s"""
+    sekunder = max(time.perf_counter() - starttid, 1e-9)
+    megabyte = os.path.getsize(filnamn) / (1024 * 1024)
+    megabyte_str = str(round(megabyte, 1)).replace('.', ',')
+    sekunder_str = str(round(sekunder, 3)).replace('.', ',')
+    hastighet_str = str(round(megabyte / sekunder, 1)).replace('.', ',')
+    print(f"{filnamn}: {megabyte_str} MB på {sekunder_str} s ({hastighet_str} MB/s)")
+
+
+def _tolka_kursfil(filnamn, namn_lista, kodning, cache=False):
+    """
+    Tolkar en kursfil blockvis till kompakta arrayer
+    
+    Används både direkt och i arbetsprocesser. Kurserna sorteras per aktie
+    (stabilt, så varje akties kurser behåller filens ordning).
+    
+    Args:
+        filnamn (str): Sökväg till filen med kursdata
+        namn_lista (list): Aktienamn att leta efter, i lagrets ordning
+        kodning (str): Teckenkodning för aktienamnen i filen
+        cache (bool): Använd och skriv en binär cache bredvid filen
+        
+    Returns:
+        tuple: (varden, datum, antal, avvisade) där antal är antalet kurser
+               per aktie och avvisade antalet kursrader som inte gick att
+               tolka, eller None om filen inte finns
+    """
+    if cache:
+        data = _las_cache(filnamn, _namnnyckel(namn_lista))
+        if data is not None:
+            return data["varden"], data["datum"], np.diff(data["offset"]), int(data["avvisade"])
+    signatur = _kallsignatur(filnamn)
+    namn_index = {n.encode(kodning): i for i, n in enumerate(namn_lista)}
+    
+    id_delar = []
+    kurs_delar = []
+    datum_delar = []
+    nuvarande = -1
+    avvisade = 0
+    try:
+        for buf in _las_block(filnamn):
+            start, slut, ar_kurs, kurs, datum, felaktig = _analysera_block(buf)
+            
+            # Rubrikrader med aktienamn, i radordning
+            rubrik_rad = []
+            rubrik_id = []
+            for rad in np.flatnonzero(~ar_kurs & (start < slut)):
+                i = namn_index.get(buf[start[rad]:slut[rad]].tobytes())
+                if i is not None:
+                    rubrik_rad.append(rad)
+                    rubrik_id.append(i)
+            
+            # Varje kursrad hör till närmast föregående rubrik
+            felaktig[rubrik_rad] = False
+            kursrader = np.flatnonzero(ar_kurs | felaktig)
+            forre = np.searchsorted(rubrik_rad, kursrader) - 1
+            ids = np.full(len(kursrader), nuvarande, dtype=np.int64)
+            ids[forre >= 0] = np.array(rubrik_id, dtype=np.int64)[forre[forre >= 0]]
+            behall = ids >= 0
+            avvisade += int(np.count_nonzero(felaktig[kursrader[behall]]))
+            behall &= ar_kurs[kursrader]
+            id_delar.append(ids[behall])
+            kurs_delar.append(kurs[kursrader[behall]])
+            datum_delar.append(datum[kursrader[behall]])
+            if rubrik_id:
+                nuvarande = rubrik_id[-1]
+    except FileNotFoundError:
+        return None
+    
+    ids = np.concatenate(id_delar) if id_delar else np.zeros(0, dtype=np.int64)
+    varden = np.concatenate(kurs_delar) if kurs_delar else np.zeros(0)
+    datum = np.concatenate(datum_delar) if datum_delar else np.zeros(0, dtype='datetime64[D]')
+    ordning = np.argsort(ids, kind='stable')
+    antal = np.bincount(ids, minlength=len(namn_lista))
+    varden, datum = varden[ordning], datum[ordning]
+    if cache:
+        offset = np.zeros(len(namn_lista) + 1, dtype=np.int64)
+        np.cumsum(antal, out=offset[1:])
+        _skriv_cache(filnamn, signatur, _namnnyckel(namn_lista),
+                     namn=np.array(namn_lista, dtype=str), varden=varden,
+                     offset=offset, datum=datum, avvisade=np.int64(avvisade))
+    return varden, datum, antal, avvisade
+
+
+def _bygg_kurslager(aktier, namn_lista, delar):
+    """
+    Slår ihop tolkade kursfiler till ett KursLager och kopplar aktierna till det
+    
+    Args:
+        aktier (dict): Dictionary med Aktie-objekt
+        namn_lista (list): Aktienamn i lagrets ordning
+        delar (list): Resultat från _tolka_kursfil per fil, i filernas ordning
+        
+    Returns:
+        KursLager: Lager med alla kurser, kurser som redan fanns behålls först
+    """
+    fran_borjan = not any(len(a.historiska_kurser) for a in aktier.values())
+    if len(delar) == 1:
+        varden, datum, antal = delar[0][:3]
+    else:
+        # Varje akties kurser i filernas ordning
+        ids = np.concatenate([np.repeat(np.arange(len(namn_lista)), d[2]) for d in delar])
+        ordning = np.argsort(ids, kind='stable')
+        varden = np.concatenate([d[0] for d in delar])[ordning]
+        datum = np.concatenate([d[1] for d in delar])[ordning]
+        antal = np.sum([d[2] for d in delar], axis=0)
+    offset = np.zeros(len(namn_lista) + 1, dtype=np.int64)
+    np.cumsum(antal, out=offset[1:])
+    lager = KursLager(namn_lista, varden, offset, datum)
+    
+    # Behåll eventuella kurser som redan fanns, som las_kurser gör
+    if not fran_borjan:
+        for i, namn in enumerate(namn_lista):
+            if antal[i]:
+                aktie = aktier[namn]
+                delen = slice(offset[i], offset[i+1])
+                aktie.datum = np.concatenate([_datum_for(aktie), lager.datum[delen]])
+                aktie.historiska_kurser = np.concatenate([aktie.historiska_kurser, lager.varden[delen]])
+        lager = KursLager.fran_aktier(aktier)
+    lager.koppla(aktier)
+    return lager
+
+
+def _namn_som_kurs(aktier):
+    """
+    True om något namn slutar med ett ord som ser ut som en kurs
+    
+    Sådana namn går inte att skilja från kursrader blockvis, då används
+    den radvisa inläsningen.
+    """
+    for namn in aktier:
+        if " " in namn:
+            try:
+                float(namn.split()[-1])
+                return True
+            except ValueError:
+                pass
+    return False
+
+
+def las_kurser_bulk(filnamn, aktier, visa_hastighet=False, cache=False):
+    """
+    Läser historiska kurser blockvis från en minnesmappad fil
+    
+    Ger samma resultat som las_kurser men tolkar kurserna ett block i
+    taget direkt till arrayer, vilket är flera gånger snabbare för stora filer.
+    
+    Args:
+        filnamn (str): Sökväg till filen med kursdata
+        aktier (dict): Dictionary med Aktie-objekt
+        visa_hastighet (bool): Skriv ut inläsningshastigheten i MB/s
+        cache (bool): Använd och skriv en binär cache bredvid filen
+        
+    Returns:
+        KursLager: Lager med alla kurser, som aktierna nu är kopplade till
+    """
+    if cache:
+        lager = _kurslager_fran_cache(filnamn, aktier, "las_kurser_bulk")
+        if lager is not None:
+            return lager
+    if _namn_som_kurs(aktier):
+        return las_kurser(filnamn, aktier, cache=cache)
+    signatur = _kallsignatur(filnamn)
+    fran_borjan = not any(len(a.historiska_kurser) for a in aktier.values())
+    namn_lista = list(aktier.keys())
+    
+    starttid = time.perf_counter()
+    delen = _tolka_kursfil(filnamn, namn_lista, locale.getpreferredencoding(False))
+    if delen is None:
+        print(f"Fel: {filnamn} hittades inte")
+        delen = (np.zeros(0), np.zeros(0, dtype='datetime64[D]'), np.zeros(len(namn_lista), dtype=np.int64), 0)
+    _rakna_rader("las_kurser_bulk", int(delen[2].sum()), delen[3])
+    lager = _bygg_kurslager(aktier, namn_lista, [delen])
+    if cache and fran_borjan:
+        _spara_kurslager(filnamn, signatur, aktier, lager, delen[3])
+    
+    if visa_hastighet and os.path.exists(filnamn):
+        _rapportera_hastighet(filnamn, starttid)
+    return lager
+
+
+def las_kurser_filer(filnamn_lista, aktier, processer=None, cache=False):
+    """
+    Läser historiska kurser från flera filer, parallellt i en processpool
+    
+    Varje fil tolkas blockvis i en arbetsprocess som returnerar arrayer,
+    inte listor med float-objekt. Resultaten slås ihop i filernas ordning,
+    så varje aktie får sina kurser i samma ordning som om filerna lästs
+    efter varandra med las_kurser.
+    
+    Args:
+        filnamn_lista (list): Sökvägar till filerna med kursdata
+        aktier (dict): Dictionary med Aktie-objekt
+        processer (int): Antal processer, None för en per kärna
+        cache (bool): Använd och skriv en binär cache bredvid varje fil
+        
+    Returns:
+        KursLager: Lager med alla kurser, som aktierna nu är kopplade till
+    """
+    if _namn_som_kurs(aktier):
+        lager = KursLager.fran_aktier(aktier)
+        for filnamn in filnamn_lista:
+            lager = las_kurser(filnamn, aktier)
+        return lager
+    
+    namn_lista = list(aktier.keys())
+    antal_filer = len(filnamn_lista)
+    resultat = _karta(_tolka_kursfil, processer, filnamn_lista, repeat(namn_lista, antal_filer),
+                      repeat(locale.getpreferredencoding(False), antal_filer),
+                      repeat(cache, antal_filer))
+    delar = []
+    for filnamn, delen in zip(filnamn_lista, resultat):
+        if delen is None:
+            print(f"Fel: {filnamn} hittades inte")
+        else:
+            _rakna_rader("las_kurser_filer", int(delen[2].sum()), delen[3])
+            delar.append(delen)
+    if not delar:
+        delar.append((np.zeros(0), np.zeros(0, dtype='datetime64[D]'), np.zeros(len(namn_lista), dtype=np.int64), 0))
+    return _bygg_kurslager(aktier, namn_lista, delar)
+
+
+def las_omx(filnamn, cache=False):
+    """
+    Läser OMX-index historiska värden
+    
+    Args:
+        filnamn (str): Sökväg till filen med OMX-data
+        cache (bool): Använd och skriv en binär cache bredvid filen
+        
+    Returns:
+        TidsSerie: OMX-värden med datum som index
+    """
+    if cache:
+        data = _las_cache(filnamn)
+        if data is not None:
+            _rakna_rader("las_omx", len(data["varden"]), int(data["avvisade"]))
+            return TidsSerie(data["datum"], data["varden"])
+    signatur = _kallsignatur(filnamn)
+    
+    omx = []
+    datum = []
+    avvisade = 0
+    try:
+        with open(filnamn, 'r') as f:
+            for rad in f:
+                rad = rad.strip()
+                if rad and " " in rad:
+                    try:
+                        falt = rad.split()
+                        varde = float(falt[-1])
+                        omx.append(varde)
+                        datum.append(falt[0])
+                    except ValueError:
+                        avvisade += 1
+                        continue
+    except FileNotFoundError:
+        print(f"Fel: {filnamn} hittades inte")
+    _rakna_rader("las_omx", len(omx), avvisade)
+    serie = TidsSerie(_tolka_datum(datum), omx)
+    if cache:
+        datum, varden = serie.i_filordning()
+        _skriv_cache(filnamn, signatur, varden=varden, datum=datum, avvisade=np.int64(avvisade))
+    return serie
+
+
+def las_omx_bulk(filnamn, visa_hastighet=False, cache=False):
+    """
+    Läser OMX-index blockvis från en minnesmappad fil
+    
+    Ger samma värden som las_omx men tolkar hela block på en gång.
+    
+    Args:
+        filnamn (str): Sökväg till filen med OMX-data
+        visa_hastighet (bool): Skriv ut inläsningshastigheten i MB/s
+        cache (bool): Använd och skriv en binär cache bredvid filen
+        
+    Returns:
+        TidsSerie: OMX-värden med datum som index
+    """
+    if cache:
+        data = _las_cache(filnamn)
+        if data is not None:
+            _rakna_rader("las_omx_bulk", len(data["varden"]), int(data["avvisade"]))
+            return TidsSerie(data["datum"], data["varden"])
+    signatur = _kallsignatur(filnamn)
+    
+    starttid = time.perf_counter()
+    delar = []
+    datum_delar = []
+    avvisade = 0
+    try:
+        for buf in _las_block(filnamn):
+            _, _, ar_kurs, kurs, datum, felaktig = _analysera_block(buf)
+            delar.append(kurs[ar_kurs])
+            datum_delar.append(datum[ar_kurs])
+            avvisade += int(np.count_nonzero(felaktig))
+    except FileNotFoundError:
+        print(f"Fel: {filnamn} hittades inte")
+        return TidsSerie(None, [])
+    _rakna_rader("las_omx_bulk", sum(len(d) for d in delar), avvisade)
+    
+    omx = TidsSerie(np.concatenate(datum_delar) if datum_delar else None,
+                    np.concatenate(delar) if delar else [])
+    if cache:
+        datum, varden = omx.i_filordning()
+        _skriv_cache(filnamn, signatur, varden=varden, datum=datum, avvisade=np.int64(avvisade))
+    if visa_hastighet:
+        _rapportera_hastighet(filnamn, starttid)
+    return omx
+
+
+# Kantfall för test_las_kurser_bulk: tabbar, exponenter, tecken, decimaler
+# utan heltals- eller decimaldel, nan/inf, namn med mellanslag, CRLF, fält
+# längre än _MAX_FALTBREDD och rader som ska hoppas över
+_KANTFALL_KURSER = (
+    b"2023-12-31 99\n"
+    b"Alfa\r\n"
+    b"2024-01-01 100\r\n"
+    b"2024-01-02\t101.5\r\n"
+    b"2024-01-03 1e2\n"
+    b"2024-01-04 +5\n"
+    b"2024-01-05 .5\n"
+    b"2024-01-06 5.\n"
+    b"2024-01-07 nan\n"
+    b"2024-01-08 inf\n"
+    b"2024-01-09 -Infinity\n"
+    b"2024-01-10 n/a\n"
+    b"\n"
+    b"  2024-01-11   102  \t\n"
+    b"2024-01-12 1,5\n"
+    b"trasigrad\n"
+    b"Beta B\r\n"
+    b"2024-01-01\t 50\r\n"
+    b"2024-01-02 5E-1\n"
+    b"xx 51\n"
+    b"Gamma\n"
+    b"Delta 7\n"
+    b"2024-01-14 " + b"9" * 40 + b".5\n"
+    b"2024-01-15 " + b"x" * 5000 + b"\n"
+    b"Alfa\n"
+    b"2024-01-13 103"
+)
+_KANTFALL_ALFA = [100.0, 100.0, 5.0, 0.5, 5.0, np.nan, np.inf, -np.inf, 102.0, 103.0]
+
+
+def test_las_kurser_bulk():
+    """
+    Testar att blockvis inläsning ger samma resultat som radvis
+    
+    las_kurser_bulk jämförs med las_kurser och las_omx_bulk med las_omx på
+    en fil med kantfall, inklusive felaktiga rader som ska hoppas över.
+    
+    Returns:
+        bool: True om alla jämförelser stämmer
+    """
+    def nya_aktier():
+        return {n: Aktie(n, 50.0, 10.0, 1.0) for n in ("Alfa", "Beta B", "Gamma")}
+    
+    def lika(a, b):
+        return (np.array_equal(a.varden, b.varden, equal_nan=True)
+                and np.array_equal(a.datum, b.datum, equal_nan=True))
+    
+    with tempfile.TemporaryDirectory() as katalog:
+        filnamn = os.path.join(katalog, "kurser.txt")
+        with open(filnamn, 'wb') as f:
+            f.write(_KANTFALL_KURSER)
+        radvis = las_kurser(filnamn, nya_aktier())
+        blockvis = las_kurser_bulk(filnamn, nya_aktier())
+        omx_radvis = las_omx(filnamn)
+        omx_blockvis = las_omx_bulk(filnamn)
+    
+    alfa = blockvis.varden[blockvis.offset[0]:blockvis.offset[1]]
+    resultat = {
+        "las_kurser_bulk = las_kurser": lika(blockvis, radvis)
+                                        and np.array_equal(blockvis.offset, radvis.offset),
+        "las_omx_bulk = las_omx": lika(omx_blockvis, omx_radvis),
+        "kurser för Alfa": np.array_equal(alfa, _KANTFALL_ALFA, equal_nan=True),
+    }
+    
+    print("\nTest av blockvis inläsning")
+    for namn, ok in resultat.items():
+        print(f"Verifiering {namn}: {ok}")
+    return all(resultat.values())
+
+
+def visa_meny():
+    """
+    Visar huvudmenyn och hanterar användarens val
+    
+    Returns:
+        int: Vald meny-alternativ (1-4)
+    """
+    print("\n" + "_" * 40)
+    print("MENY")
+    print("_" * 40)
+    print("1. Fundamental analys (Vid långsiktigt aktieinnehav)")
+    print("2. Teknisk analys (Vid kort aktieinnehav)")
+    print("3. Rangordning av aktier med avseende på dess betavärde")
+    print("4. Avsluta")
+    print("_" * 40)
+    
+    while True:
+        try:
+            val = int(input("Vilket alternativ vill du välja? "))
+            if 1 <= val <= 4:
+                return val
+            else:
+                print("Fel! Välj mellan 1 och 4")
+        except ValueError:
+            print("Fel! Ange en siffra mellan 1 och 4")
+
+
+def valj_aktie(aktier, analys_typ):
+    """
+    Låter användaren välja en aktie från listan
+    
+    Args:
+        aktier (dict): Dictionary med tillgängliga aktier
+        analys_typ (str): Typ av analys ("fundamental" eller "teknisk")
+        
+    Returns:
+        Aktie: Vald Aktie-instans, eller None om avbrutet
+    """
+    namn_lista = list(aktier.keys())
+    
+    print(f"\nEn {analys_typ} analys kan utföras för följande aktier:")
+    for i, namn in enumerate(namn_lista, 1):
+        print(f"{i}. {namn}")
+    
+    while True:
+        try:
+            val = int(input(f"Vilken aktie vill du göra {analys_typ} analys på? "))
+            if 1 <= val <= len(namn_lista):
+                return aktier[namn_lista[val-1]]
+            else:
+                print(f"Felaktigt val! Välj mellan 1 och {len(namn_lista)}")
+        except ValueError:
+            print("Fel! Ange en siffra")
+        except KeyboardInterrupt:
+            return None
+
+
+def gor_langsiktig_analys(aktier):
+    """
+    Gör fundamental analys av en aktie baserat på fundamenta
+    
+    Args:
+        aktier (dict): Dictionary med tillgängliga aktier
+    """
+    if not aktier:
+        print("Inga aktier!")
+        return
+    
+    aktie = valj_aktie(aktier, "fundamental")
+    if not aktie:
+        return
+    
+    print("\n" + "_" * 40)
+    print(f"Fundamental analys för {aktie.namn}")
+    print("_" * 40)
+    
+    # Använd kommatecken för procentenligt svenskt format
+    soliditet_str = str(aktie.soliditet).replace('.', ',')
+    print(f"företagets soliditet är {soliditet_str} %")
+    print(f"företagets p/e-tal är {aktie.p_e_tal}")
+    
+    # Formatera P/S-tal med kommatecken
+    p_s_str = str(aktie.p_s_tal).replace('.', ',')
+    print(f"företagets p/s-tal är {p_s_str}")
+    
+    print("\nBedömning:")
+    print(bedom_soliditet(aktie.soliditet))
+    p_e_bedomning = bedom_p_e_tal(aktie.p_e_tal)
+    if p_e_bedomning is not None:
+        print(p_e_bedomning)
+
+
+def bedom_soliditet(soliditet):
+    """
+    Bedömer soliditeten
+    
+    Args:
+        soliditet (float): Soliditet i procent
+        
+    Returns:
+        str: Bedömningstext
+    """
+    if soliditet > 50:
+        return "Mycket stark soliditet (>50%) - Företaget har goda marginaler"
+    elif soliditet > 30:
+        return "Godkänd soliditet (30-50%) - Företaget har stabil ekonomi"
+    else:
+        return "Låg soliditet (<30%) - Företaget har smala marginaler"
+
+
+def bedom_p_e_tal(p_e_tal):
+    """
+    Bedömer P/E-talet
+    
+    Args:
+        p_e_tal (float eller str): P/E-tal eller "negativt"
+        
+    Returns:
+        str: Bedömningstext, eller None om P/E-talet inte går att bedöma
+    """
+    if p_e_tal == "negativt":
+        return "Företaget går med förlust - inget P/E-tal kan beräknas"
+    elif isinstance(p_e_tal, (int, float)):
+        if p_e_tal < 15:
+            return "Bra P/E-tal (<15) - Aktien kan vara undervärderad"
+        elif p_e_tal < 25:
+            return "Normalt P/E-tal (15-25) - Aktien är rimligt värderad"
+        else:
+            return "Högt P/E-tal (>25) - Aktien kan vara övervärderad"
+    return None
+
+
+def periodtext(aktie):
+    """
+    Beskriver perioden som aktiens kursdata täcker
+    
+    Args:
+        aktie (Aktie): Aktien
+        
+    Returns:
+        str: T.ex. "2024-01-02 till 2024-02-29", eller "hela perioden" om datum saknas
+    """
+    datum = _datum_for(aktie)
+    if len(datum) == 0 or np.isnat(datum[0]) or np.isnat(datum[-1]):
+        return "hela perioden"
+    return f"{datum[0]} till {datum[-1]}"
+
+
+def gor_kortsiktig_analys(aktier, marknad):
+    """
+    Gör teknisk analys av en aktie baserat på kursutveckling
+    
+    Args:
+        aktier (dict): Dictionary med tillgängliga aktier
+        marknad (float): Marknadens totala avkastning som decimaltal
+    """
+    if not aktier:
+        print("Inga aktier!")
+        return
+    
+    aktie = valj_aktie(aktier, "teknisk")
+    if not aktie:
+        return
+    
+    if len(aktie.historiska_kurser) < 2:
+        print(f"Inte tillräckligt med kursdata för {aktie.namn}")
+        return
+    
+    print("\n" + "_" * 40)
+    print(f"Teknisk analys för {aktie.namn}")
+    print("_" * 40)
+    
+    avkastning = aktie.berakna_avkastning()
+    beta = aktie.berakna_betavarde(marknad)
+    lagsta = aktie.hamta_lagsta_kurs()
+    hogsta = aktie.hamta_hogsta_kurs()
+    
+    # Formatera med kommatecken enligt svenskt format
+    avkastning_str = str(avkastning).replace('.', ',')
+    beta_str = str(beta).replace('.', ',')
+    lagsta_str = str(lagsta).replace('.', ',')
+    hogsta_str = str(hogsta).replace('.', ',')
+    
+    period = periodtext(aktie)
+    print(f"kursutveckling({period}) {avkastning_str} %")
+    print(f"betavärde {beta_str}")
+    print(f"lägsta kurs({period}) {lagsta_str}")
+    print(f"högsta kurs({period}) {hogsta_str}")
+    
+    # Tekniska indikatorer, räknas med samma motor som för alla aktier
+    indikatorer = {namn: float(varden[0]) for namn, varden
+                   in KursLager.fran_aktier({aktie.namn: aktie}).indikatorer().items()}
+    for rad in indikatortext(indikatorer, period):
+        print(rad)
+    
+    print("\nBedömning:")
+    print(bedom_avkastning(avkastning))
+    print(bedom_risk(beta))
+    for rad in bedom_indikatorer(indikatorer):
+        print(rad)
+
+
+def _svenskt(tal):
+    """Formaterar ett tal med två decimaler och decimalkomma"""
+    return str(round(tal, 2)).replace('.', ',')
+
+
+def indikatortext(indikatorer, period):
+    """
+    Beskriver de tekniska indikatorer som går att beräkna
+    
+    Args:
+        indikatorer (dict): Senaste indikatorvärden från KursLager.indikatorer
+        period (str): Perioden som kursdatan täcker
+        
+    Returns:
+        list: Textrader, indikatorer som är NaN utelämnas
+    """
+    rader = []
+    if not np.isnan(indikatorer["glidande_medel"]):
+        rader.append(f"glidande medelvärde(20 dagar) {_svenskt(indikatorer['glidande_medel'])}")
+    if not np.isnan(indikatorer["volatilitet"]):
+        rader.append(f"volatilitet(20 dagar) {_svenskt(indikatorer['volatilitet'])} % per dag")
+    if not np.isnan(indikatorer["rsi"]):
+        rader.append(f"RSI(14 dagar) {_svenskt(indikatorer['rsi'])}")
+    if not np.isnan(indikatorer["max_nedgang"]):
+        rader.append(f"största nedgång({period}) {_svenskt(indikatorer['max_nedgang'])} %")
+    return rader
+
+
+def bedom_indikatorer(indikatorer):
+    """
+    Bedömer trend, RSI och nedgång
+    
+    Args:
+        indikatorer (dict): Senaste indikatorvärden från KursLager.indikatorer
+        
+    Returns:
+        list: Bedömningstexter för de indikatorer som går att beräkna
+    """
+    rader = []
+    if not np.isnan(indikatorer["glidande_medel"]):
+        rader.append(bedom_trend(indikatorer["kurs"], indikatorer["glidande_medel"]))
+    if not np.isnan(indikatorer["rsi"]):
+        rader.append(bedom_rsi(indikatorer["rsi"]))
+    if not np.isnan(indikatorer["max_nedgang"]):
+        rader.append(bedom_nedgang(indikatorer["max_nedgang"]))
+    return rader
+
+
+def bedom_trend(kurs, medel):
+    """
+    Bedömer trenden utifrån kursen och det glidande medelvärdet
+    
+    Args:
+        kurs (float): Senaste kurs
+        medel (float): Glidande medelvärde
+        
+    Returns:
+        str: Bedömningstext
+    """
+    if kurs > medel:
+        return "Kursen över glidande medelvärde - Uppåtgående trend"
+    else:
+        return "Kursen under glidande medelvärde - Nedåtgående trend"
+
+
+def bedom_rsi(rsi):
+    """
+    Bedömer RSI
+    
+    Args:
+        rsi (float): RSI (0-100)
+        
+    Returns:
+        str: Bedömningstext
+    """
+    if rsi > 70:
+        return "Överköpt (RSI > 70) - Risk för nedgång"
+    elif rsi >= 30:
+        return "Neutral RSI (30-70) - Varken överköpt eller översåld"
+    else:
+        return "Översåld (RSI < 30) - Möjlig uppgång"
+
+
+def bedom_nedgang(nedgang):
+    """
+    Bedömer största nedgången från en topp
+    
+    Args:
+        nedgang (float): Största nedgång i procent (0 eller negativ)
+        
+    Returns:
+        str: Bedömningstext
+    """
+    if nedgang < -30:
+        return "Stor nedgång (>30%) - Kraftiga kursfall har förekommit"
+    elif nedgang < -10:
+        return "Måttlig nedgång (10-30%) - Normala kurssvängningar"
+    else:
+        return "Liten nedgång (<10%) - Stabil kursutveckling"
+
+
+def bedom_avkastning(avkastning):
+    """
+    Bedömer kursutvecklingen
+    
+    Args:
+        avkastning (float): Avkastning i procent
+        
+    Returns:
+        str: Bedömningstext
+    """
+    if avkastning > 10:
+        return "Stark avkastning (>10%) - Mycket positiv utveckling"
+    elif avkastning > 0:
+        return "Positiv avkastning (0-10%) - God utveckling"
+    else:
+        return "Negativ avkastning - Nedåtgående trend"
+
+
+def bedom_risk(beta):
+    """
+    Bedömer risken utifrån betavärdet
+    
+    Args:
+        beta (float): Betavärde
+        
+    Returns:
+        str: Bedömningstext
+    """
+    if beta > 1.5:
+        return "Hög risk (beta > 1,5) - Volatil aktie, stora svängningar"
+    elif beta > 0.8:
+        return "Normal risk (beta 0,8-1,5) - Normal volatilitet"
+    else:
+        return "Låg risk (beta < 0,8) - Stabil aktie, små svängningar"
+
+
+class BetaRangordning:
+    """
+    Rangordning av aktierna efter betavärde, högst först
+    
+    Betavärdena beräknas en gång per marknadsavkastning och kursversion.
+    Topp- och bottenlistor tas fram med partitionering i O(n) utan att hela
+    listan sorteras. Den fullständiga rangordningen sorteras först när den
+    behövs och sparas sedan, så bläddring kostar bara en skivning. Allt
+    byggs om automatiskt när någon kurs eller marknadsavkastningen ändras.
+    """
+    def __init__(self, aktier, lager=None):
+        """
+        Initierar rangordningen
+        
+        Args:
+            aktier (dict): Dictionary med tillgängliga aktier
+            lager (KursLager): Kurslager för att beräkna alla betavärden i ett svep (valfritt)
+        """
+        self.aktier = aktier
+        self.lager = lager
+        self._nyckel = None
+        self._namn = []
+        self._betor = np.zeros(0)
+        self._ordning = None
+    
+    def _uppdatera(self, marknad):
+        """Beräknar om betavärdena om kurserna eller marknaden har ändrats"""
+        nyckel = (marknad, Aktie.kursversion, len(self.aktier))
+        if nyckel == self._nyckel:
+            return
+        if self.lager is not None and self.lager.aktuellt():
+            med = np.flatnonzero(self.lager.langder() >= 2)
+            self._namn = [self.lager.namn[i] for i in med]
+            self._betor = self.lager.betavarden(marknad)[med]
+        else:
+            self._namn = [namn for namn, aktie in self.aktier.items()
+                          if len(aktie.historiska_kurser) >= 2]
+            self._betor = np.array([self.aktier[namn].berakna_betavarde(marknad)
+                                    for namn in self._namn], dtype=np.float64)
+        self._ordning = None
+        self._nyckel = nyckel
+    
+    def _rader(self, index, rang):
+        """Returnerar (rang, namn, betavärde) för positionerna i index"""
+        return [(int(r), self._namn[i], float(self._betor[i])) for r, i in zip(rang, index)]
+    
+    def _sortera(self, index):
+        """Sorterar positioner i rangordning: högst beta först, lika behåller ordningen"""
+        return index[np.lexsort((index, -self._betor[index]))]
+    
+    def __len__(self):
+        return len(self._namn)
+    
+    def alla(self, marknad):
+        """
+        Returnerar hela rangordningen
+        
+        Args:
+            marknad (float): Marknadens totala avkastning som decimaltal
+            
+        Returns:
+            array: Positioner i rangordning (sparas tills något ändras)
+        """
+        self._uppdatera(marknad)
+        if self._ordning is None:
+            self._ordning = self._sortera(np.arange(len(self._namn)))
+        return self._ordning
+    
+    def sida(self, marknad, start, antal):
+        """
+        Hämtar en del av rangordningen utan att sortera om
+        
+        Args:
+            marknad (float): Marknadens totala avkastning som decimaltal
+            start (int): Första rang att ta med, räknat från 0
+            antal (int): Antal rader
+            
+        Returns:
+            list: (rang, namn, betavärde) med rang räknat från 1
+        """
+        ordning = self.alla(marknad)[start:start + antal]
+        return self._rader(ordning, range(start + 1, start + 1 + len(ordning)))
+    
+    def topp(self, marknad, k):
+        """
+        Hämtar de k aktierna med högst betavärde
+        
+        Args:
+            marknad (float): Marknadens totala avkastning som decimaltal
+            k (int): Antal aktier
+            
+        Returns:
+            list: (rang, namn, betavärde) i rangordning
+        """
+        self._uppdatera(marknad)
+        n = len(self._namn)
+        k = max(0, min(k, n))
+        if self._ordning is not None or k == n:
+            return self.sida(marknad, 0, k)
+        if k == 0:
+            return []
+        # k:te högsta betavärdet; vid lika värden går de tidigare aktierna före
+        grans = np.partition(self._betor, n - k)[n - k]
+        over = np.flatnonzero(self._betor > grans)
+        lika = np.flatnonzero(self._betor == grans)[:k - len(over)]
+        return self._rader(self._sortera(np.concatenate([over, lika])), range(1, k + 1))
+    
+    def botten(self, marknad, k):
+        """
+        Hämtar de k aktierna med lägst betavärde
+        
+        Args:
+            marknad (float): Marknadens totala avkastning som decimaltal
+            k (int): Antal aktier
+            
+        Returns:
+            list: (rang, namn, betavärde) i rangordning, lägst beta sist
+        """
+        self._uppdatera(marknad)
+        n = len(self._namn)
+        k = max(0, min(k, n))
+        if self._ordning is not None or k == n:
+            return self.sida(marknad, n - k, k)
+        if k == 0:
+            return []
+        grans = np.partition(self._betor, k - 1)[k - 1]
+        under = np.flatnonzero(self._betor < grans)
+        lika = np.flatnonzero(self._betor == grans)
+        lika = lika[len(lika) - (k - len(under)):]
+        return self._rader(self._sortera(np.concatenate([under, lika])), range(n - k + 1, n + 1))
+
+
+def rangordning(aktier, marknad, lager=None):
+    """
+    Beräknar rangordningen av aktierna efter betavärde, högst först
+    
+    Args:
+        aktier (dict): Dictionary med tillgängliga aktier
+        marknad (float): Marknadens totala avkastning som decimaltal
+        lager (KursLager): Kurslager för att beräkna alla betavärden i ett svep (valfritt)
+        
+    Returns:
+        list: (namn, betavärde) för aktier med minst två kurser
+    """
+    rang = BetaRangordning(aktier, lager)
+    return [(namn, beta) for _, namn, beta in rang.sida(marknad, 0, len(aktier))]
+
+
+def rangordna_efter_risk(aktier, marknad, lager=None, rang=None, topp=None, botten=None):
+    """
     Rangordnar aktier efter risk (betavärde)
     
     Args:
         aktier (dict): Dictionary med tillgängliga aktier
         marknad (float): Marknadens totala avkastning som decimaltal
+        lager (KursLager): Kurslager för att beräkna alla betavärden i ett svep (valfritt)
+        rang (BetaRangordning): Sparad rangordning att återanvända (valfritt)
+        topp (int): Visa bara de topp aktierna med högst beta (valfritt)
+        botten (int): Visa bara de botten aktierna med lägst beta (valfritt)
+    """
+    if not aktier:
+        print("Inga aktier!")
+        return
+    
+    if rang is None:
+        rang = BetaRangordning(aktier, lager)
+    if topp is None and botten is None:
+        lista = rang.sida(marknad, 0, len(aktier))
+    else:
+        lista = rang.topp(marknad, topp or 0)
+        # Hoppa över rader som redan finns i topplistan
+        lista += [rad for rad in rang.botten(marknad, botten or 0) if rad[0] > len(lista)]
+    if not len(rang):
+        print("Ingen tillräcklig kursdata för att beräkna betavärden!")
+        return
+    
+    print("\n" + "_" * 50)
+    print("Rangordning av aktier med avseende på dess betavärde")
+    print("_" * 50)
+    
+    for i, namn, risk in lista:
+        risk_str = str(risk).replace('.', ',')
+        print(f"{i}. {namn} {risk_str}")
+
+
+# Kolumner i batchrapporten
+RAPPORTFALT = [
+    "namn", "soliditet", "p_e_tal", "p_s_tal",
+    "bedomning_soliditet", "bedomning_p_e_tal",
+    "period", "avkastning", "betavarde", "lagsta_kurs", "hogsta_kurs",
+    "bedomning_avkastning", "bedomning_risk", "riskrang",
+    "glidande_medel", "volatilitet", "rsi", "max_nedgang",
+    "bedomning_trend", "bedomning_rsi", "bedomning_nedgang",
+]
+
+
+def batchrapport_rader(aktier, marknad, lager=None):
+    """
+    Gör fundamental och teknisk analys samt riskrangordning för alla aktier
+    
+    Raderna skapas en i taget, så hela rapporten behöver aldrig finnas i
+    minnet. Bara betavärdena för rangordningen och de tekniska
+    indikatorerna beräknas i förväg, för alla aktier i ett svep.
+    
+    Args:
+        aktier (dict): Dictionary med tillgängliga aktier
+        marknad (float): Marknadens totala avkastning som decimaltal
+        lager (KursLager): Kurslager för att beräkna alla betavärden i ett svep (valfritt)
+        
+    Yields:
+        dict: En rad per aktie med nycklarna i RAPPORTFALT
+    """
+    risk = {namn: (rang, beta) for rang, (namn, beta)
+            in enumerate(rangordning(aktier, marknad, lager), 1)}
+    if lager is None or not lager.aktuellt():
+        lager = KursLager.fran_aktier(aktier)
+    indikatorer = lager.indikatorer()
+    
+    for namn, aktie in aktier.items():
+        yield _analysrad(namn, aktie, risk, lager, indikatorer)
+
+
+def _analysrad(namn, aktie, risk, lager, indikatorer):
+    """
+    Gör fundamental och teknisk analys av en aktie
+    
+    Args:
+        namn (str): Aktiens namn
+        aktie (Aktie): Aktien
+        risk (dict): Aktienamn -> (riskrang, betavärde)
+        lager (KursLager): Kurslager som indikatorerna räknades på
+        indikatorer (dict): Resultatet från lager.indikatorer()
+        
+    Returns:
+        dict: Rad med nycklarna i RAPPORTFALT, None för det som inte går att beräkna
+    """
+    rad = dict.fromkeys(RAPPORTFALT)
+    rad["namn"] = namn
+    rad["soliditet"] = aktie.soliditet
+    rad["p_e_tal"] = aktie.p_e_tal
+    rad["p_s_tal"] = aktie.p_s_tal
+    rad["bedomning_soliditet"] = bedom_soliditet(aktie.soliditet)
+    rad["bedomning_p_e_tal"] = bedom_p_e_tal(aktie.p_e_tal)
+    
+    if namn in risk and len(aktie.historiska_kurser) >= 2:
+        rang, beta = risk[namn]
+        avkastning = aktie.berakna_avkastning()
+        rad["period"] = periodtext(aktie)
+        rad["avkastning"] = avkastning
+        rad["betavarde"] = beta
+        rad["lagsta_kurs"] = aktie.hamta_lagsta_kurs()
+        rad["hogsta_kurs"] = aktie.hamta_hogsta_kurs()
+        rad["bedomning_avkastning"] = bedom_avkastning(avkastning)
+        rad["bedomning_risk"] = bedom_risk(beta)
+        rad["riskrang"] = rang
+    
+    if namn in lager.index:
+        varden = {n: float(v[lager.index[namn]]) for n, v in indikatorer.items()}
+        for nyckel in ("glidande_medel", "volatilitet", "rsi", "max_nedgang"):
+            if not np.isnan(varden[nyckel]):
+                rad[nyckel] = round(varden[nyckel], 2)
+        if not np.isnan(varden["glidande_medel"]):
+            rad["bedomning_trend"] = bedom_trend(varden["kurs"], varden["glidande_medel"])
+        if not np.isnan(varden["rsi"]):
+            rad["bedomning_rsi"] = bedom_rsi(varden["rsi"])
+        if not np.isnan(varden["max_nedgang"]):
+            rad["bedomning_nedgang"] = bedom_nedgang(varden["max_nedgang"])
+    return rad
+
+
+def skriv_batchrapport(aktier, marknad, utfil=None, format="csv", lager=None):
+    """
+    Strömmar batchrapporten som CSV eller JSON Lines
+    
+    Args:
+        aktier (dict): Dictionary med tillgängliga aktier
+        marknad (float): Marknadens totala avkastning som decimaltal
+        utfil (str): Fil att skriva till, None för stdout
+        format (str): "csv" eller "jsonl"
+        lager (KursLager): Kurslager för att beräkna alla betavärden i ett svep (valfritt)
+        
+    Returns:
+        int: Antal skrivna rader
     """
-    if not aktier:
-        print("Inga aktier!")
-        return
+    if format not in ("csv", "jsonl"):
+        raise ValueError(f"Okänt format: {format}")
     
-    lista = []
-    for namn, aktie in aktier.items():
-        if len(aktie.historiska_kurser) >= 2:
-            risk = aktie.berakna_betavarde(marknad)
-            lista.append((namn, risk))
+    antal = 0
+    with contextlib.ExitStack() as stack:
+        if utfil is None:
+            f = sys.stdout
+        else:
+            f = stack.enter_context(open(utfil, 'w', newline='', encoding='utf-8'))
+        
+        if format == "csv":
+            skrivare = csv.DictWriter(f, fieldnames=RAPPORTFALT)
+            skrivare.writeheader()
+            for rad in batchrapport_rader(aktier, marknad, lager):
+                skrivare.writerow(rad)
+                antal += 1
+        else:
+            for rad in batchrapport_rader(aktier, marknad, lager):
+                f.write(json.dumps(rad, ensure_ascii=False) + "\n")
+                antal += 1
+        f.flush()
+    return antal
+
+
+def tolka_villkor(text):
+    """
+    Tolkar ett screeningvillkor på formen "kolumn=lagsta:hogsta"
+
+    Båda gränserna är valfria, t.ex. "soliditet=40:" eller "p_s_tal=:2".
     
-    if not lista:
-        print("Ingen tillräcklig kursdata för att beräkna betavärden!")
-        return
+    Args:
+        text (str): Villkoret
+        
+    Returns:
+        tuple: (kolumn, (lagsta, hogsta)) med None för obegränsade gränser
+    """
+    kolumn, sep, granser = text.partition("=")
+    lagsta, sep2, hogsta = granser.partition(":")
+    if not sep or not sep2:
+        raise ValueError(f"Felaktigt villkor: {text} (använd kolumn=lagsta:hogsta)")
+    return kolumn.strip(), (float(lagsta) if lagsta.strip() else None,
+                            float(hogsta) if hogsta.strip() else None)
+
+
+def screena(aktier, villkor):
+    """
+    Skriver ut aktierna som uppfyller alla screeningvillkor
+    
+    Args:
+        aktier (dict): Dictionary med tillgängliga aktier
+        villkor (list): Villkor på formen "kolumn=lagsta:hogsta"
+        
+    Returns:
+        list: Matchande Aktie-objekt
+    """
+    index = FundamentaIndex(aktier)
+    traffar = index.sok(**dict(tolka_villkor(text) for text in villkor))
+    
+    print(f"\n{'Aktie':<15} {'Soliditet':<10} {'P/E':<10} {'P/S':<10}")
+    print("-" * 45)
+    for aktie in traffar:
+        print(f"{aktie.namn:<15} {aktie.soliditet:<10} {aktie.p_e_tal:<10} {aktie.p_s_tal:<10}")
+    print(f"\n{len(traffar)} av {len(aktier)} aktier matchar")
+    return traffar
+
+
+def tolka_vikt(text):
+    """
+    Tolkar en portföljvikt på formen "namn=vikt"
+    
+    Args:
+        text (str): T.ex. "Volvo B=0.4"
+        
+    Returns:
+        tuple: (namn, vikt)
+    """
+    namn, sep, vikt = text.rpartition("=")
+    if not sep or not namn.strip():
+        raise ValueError(f"Felaktig vikt: {text} (använd namn=vikt)")
+    return namn.strip(), float(vikt)
+
+
+def visa_portfoljrisk(aktier, lager, omx, vikter):
+    """
+    Skriver ut portföljens risk och varje akties bidrag till den
     
-    # Sortera efter risk (högst först)
-    lista.sort(key=lambda x: x[1], reverse=True)
+    Args:
+        aktier (dict): Dictionary med tillgängliga aktier
+        lager (KursLager): Kurslager med aktiernas kurser
+        omx (TidsSerie): OMX-data vars datum används som kalender
+        vikter (dict): Aktienamn -> vikt
+        
+    Returns:
+        dict: Resultatet från PortfoljRisk.riskbidrag
+    """
+    if lager is None or not lager.aktuellt():
+        lager = KursLager.fran_aktier(aktier)
+    risk = PortfoljRisk(lager, omx)
+    resultat = risk.riskbidrag(vikter)
+    volatilitet = resultat["volatilitet"]
     
     print("\n" + "_" * 50)
-    print("Rangordning av aktier med avseende på dess betavärde")
+    print("Portföljens risk")
     print("_" * 50)
+    print(f"volatilitet {_svenskt(volatilitet * 100)} % per dag")
+    print(f"\n{'Aktie':<15} {'Vikt':<10} {'Marginell':<12} {'Andel av risk':<10}")
+    print("-" * 50)
+    for i, namn in enumerate(risk.namn):
+        if namn not in vikter:
+            continue
+        andel = resultat["bidrag"][i] / volatilitet * 100 if volatilitet > 0 else 0.0
+        print(f"{namn:<15} {_svenskt(vikter[namn]):<10} "
+              f"{_svenskt(resultat['marginell'][i] * 100) + ' %':<12} {_svenskt(andel)} %")
+    return resultat
+
+
+def marknadsavkastning(omx):
+    """
+    Beräknar marknadsavkastningen från första till sista OMX-värdet i filen
     
-    for i, (namn, risk) in enumerate(lista, 1):
-        risk_str = str(risk).replace('.', ',')
-        print(f"{i}. {namn} {risk_str}")
+    Filens ordning används, precis som för aktiernas avkastning, så att
+    betavärdet jämför samma period för aktie och marknad.
+    
+    Args:
+        omx (TidsSerie): OMX-värden, minst två
+        
+    Returns:
+        float: Avkastningen i decimalform
+    """
+    _, varden = omx.i_filordning()
+    return (varden[-1] / varden[0]) - 1
 
 
-def main():
-    """Huvudfunktion som kör aktieanalysprogrammet"""
-    print("Startar aktieanalysprogram...")
+def ladda_data(fundamenta_fil, kurser_fil, omx_fil, processer=None, visa_hastighet=False):
+    """
+    Läser in alla filer och beräknar marknadsavkastningen
     
-    # 1. Definiera filnamn som vanliga variabler med små bokstäver
-    fundamenta_fil = "fundamenta.txt"
-    kurser_fil = "kurser.txt"
-    omx_fil = "omx.txt"
+    Args:
+        fundamenta_fil (str eller list): Sökväg till filen eller filerna med fundamenta
+        kurser_fil (str eller list): Sökväg till filen eller filerna med kursdata
+        omx_fil (str): Sökväg till filen med OMX-data
+        processer (int): Antal processer vid flera filer, None för en per kärna
+        visa_hastighet (bool): Skriv ut inläsningshastigheten i MB/s för en
+            kursfil och OMX-filen, som då läses från texten i stället för cachen
+        
+    Returns:
+        tuple: (aktier, lager, marknad), eller None om inga aktier hittades
+    """
+    if isinstance(fundamenta_fil, str):
+        fundamenta_fil = [fundamenta_fil]
+    if isinstance(kurser_fil, str):
+        kurser_fil = [kurser_fil]
     
-    # 2. Läs data från filer
-    aktier = las_fundamenta(fundamenta_fil)
+    aktier = las_fundamenta_filer(fundamenta_fil, processer, cache=True)
     if not aktier:
-        print(f"Inga aktier hittades i {fundamenta_fil}! Avslutar.")
-        return
+        print(f"Inga aktier hittades i {', '.join(fundamenta_fil)}! Avslutar.")
+        return None
     
-    las_kurser(kurser_fil, aktier)
-    omx = las_omx(omx_fil)
+    if len(kurser_fil) == 1:
+        lager = las_kurser_bulk(kurser_fil[0], aktier, visa_hastighet, cache=not visa_hastighet)
+    else:
+        lager = las_kurser_filer(kurser_fil, aktier, processer, cache=True)
+    omx = las_omx_bulk(omx_fil, visa_hastighet, cache=not visa_hastighet)
     
-    # 3. Beräkna marknadsavkastning
+    # Beräkna marknadsavkastning
     if len(omx) >= 2:
-        marknad = (omx[-1] / omx[0]) - 1
+        marknad = marknadsavkastning(omx)
         marknad_procent = round(marknad * 100, 2)
         marknad_str = str(marknad_procent).replace('.', ',')
         print(f"\nMarknadsavkastning (OMX): {marknad_str}%")
@@ -386,8 +3119,832 @@ def main():
         marknad = 0.05
     
     print(f"{len(aktier)} aktier laddade")
+    return aktier, lager, marknad
+
+
+# Fält i batchrapporten som hör till den fundamentala analysen
+FUNDAMENTALA_FALT = RAPPORTFALT[:6]
+
+
+def _json_varde(varde):
+    """Gör om NaN till None så att svaret blir giltig JSON"""
+    if isinstance(varde, float) and np.isnan(varde):
+        return None
+    return varde
+
+
+class KursIntag:
+    """
+    Tar emot löpande kurser som rader "aktie datum kurs" och lägger in dem
+    
+    Raderna läggs i en begränsad kö. När kön är full väntar läsarna, så
+    att t.ex. en TCP-avsändare bromsas i stället för att minnet växer. En
+    konsument tar ut raderna i små satser (högst batchstorlek rader eller
+    batchtid sekunder) och lägger in dem med Aktie.lagg_till_kurs. Mellan
+    satserna släpps händelseloopen, så att andra frågor kan besvaras.
+    """
+    def __init__(self, aktier, maxko=10000, batchstorlek=1000, batchtid=0.05, vid_batch=None):
+        """
+        Initierar intaget
+        
+        Args:
+            aktier (dict): Dictionary med Aktie-objekt som kurserna läggs till i
+            maxko (int): Största antal rader som väntar i kön
+            batchstorlek (int): Största antal rader per sats
+            batchtid (float): Längsta tid i sekunder att vänta på fler rader till en sats
+            vid_batch (callable): Anropas med mängden uppdaterade aktienamn efter varje sats
+        """
+        self.aktier = aktier
+        self.ko = asyncio.Queue(maxko)
+        self.batchstorlek = batchstorlek
+        self.batchtid = batchtid
+        self.vid_batch = vid_batch
+        self.kodning = locale.getpreferredencoding(False)
+        self.mottagna = 0
+        self.tillagda = 0
+        self.avvisade = 0
+    
+    def tolka(self, rad):
+        """
+        Tolkar en rad "aktie datum kurs", aktienamnet får innehålla mellanslag
+        
+        Args:
+            rad (str): Raden
+            
+        Returns:
+            tuple: (aktie, datum, kurs), eller None om raden inte kan tolkas
+        """
+        falt = rad.strip().rsplit(None, 2)
+        if len(falt) != 3 or falt[0] not in self.aktier:
+            return None
+        try:
+            kurs = float(falt[2])
+        except ValueError:
+            return None
+        # Som i las_kurser behålls kursen även om datumet inte går att tolka
+        return self.aktier[falt[0]], _tolka_datum([falt[1]])[0], kurs
+    
+    def tillampa(self, rader):
+        """
+        Lägger in en sats rader i aktiernas kursserier
+        
+        Args:
+            rader (list): Rader "aktie datum kurs"
+            
+        Returns:
+            set: Namnen på de aktier som fick nya kurser
+        """
+        uppdaterade = set()
+        tillagda, avvisade = self.tillagda, self.avvisade
+        for rad in rader:
+            tolkad = self.tolka(rad)
+            if tolkad is None:
+                self.avvisade += 1
+                continue
+            aktie, datum, kurs = tolkad
+            aktie.lagg_till_kurs(kurs, datum)
+            uppdaterade.add(aktie.namn)
+            self.tillagda += 1
+        _rakna_rader("KursIntag", self.tillagda - tillagda, self.avvisade - avvisade)
+        return uppdaterade
+    
+    async def lagg_i_ko(self, rad):
+        """Lägger en rad i kön, väntar om kön är full"""
+        await self.ko.put(rad)
+        self.mottagna += 1
+    
+    async def las_strom(self, reader):
+        """
+        Läser rader från en ström tills den tar slut
+        
+        Args:
+            reader (asyncio.StreamReader): Strömmen
+        """
+        async for rad in reader:
+            rad = rad.decode(self.kodning, errors='replace').strip()
+            if rad:
+                await self.lagg_i_ko(rad)
+    
+    async def _hantera_anslutning(self, reader, writer):
+        """Tar emot rader från en TCP-klient"""
+        try:
+            await self.las_strom(reader)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def lyssna(self, vard="127.0.0.1", port=8766):
+        """
+        Tar emot kurser från TCP-klienter
+        
+        Returns:
+            asyncio.Server: Servern, som körs tills den stängs
+        """
+        return await asyncio.start_server(self._hantera_anslutning, vard, port)
+    
+    async def las_stdin(self):
+        """Läser kurser från standard in, t.ex. från ett rör"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        await self.las_strom(reader)
+    
+    async def folj_fil(self, filnamn, fran_borjan=False, intervall=0.2):
+        """
+        Följer en fil som växer (som tail -f) och läser nya rader
+        
+        Args:
+            filnamn (str): Filen
+            fran_borjan (bool): Läs även raderna som redan finns i filen
+            intervall (float): Sekunder mellan kontrollerna av om filen vuxit
+        """
+        with open(filnamn, 'r', errors='replace') as f:
+            if not fran_borjan:
+                f.seek(0, os.SEEK_END)
+            delrad = ""
+            while True:
+                rad = f.readline()
+                if not rad:
+                    await asyncio.sleep(intervall)
+                    continue
+                if not rad.endswith("\n"):
+                    # Raden skrivs fortfarande, vänta på resten
+                    delrad += rad
+                    continue
+                rad = (delrad + rad).strip()
+                delrad = ""
+                if rad:
+                    await self.lagg_i_ko(rad)
+    
+    async def kor(self):
+        """Tar ut rader ur kön i satser och lägger in dem, tills uppgiften avbryts"""
+        loop = asyncio.get_running_loop()
+        while True:
+            rader = [await self.ko.get()]
+            grans = loop.time() + self.batchtid
+            while len(rader) < self.batchstorlek:
+                try:
+                    rader.append(self.ko.get_nowait())
+                except asyncio.QueueEmpty:
+                    kvar = grans - loop.time()
+                    if kvar <= 0:
+                        break
+                    try:
+                        rader.append(await asyncio.wait_for(self.ko.get(), kvar))
+                    except asyncio.TimeoutError:
+                        break
+            uppdaterade = self.tillampa(rader)
+            if uppdaterade and self.vid_batch is not None:
+                self.vid_batch(uppdaterade)
+            # Släpp fram andra uppgifter mellan satserna
+            await asyncio.sleep(0)
+
+
+async def spela_upp(filnamn, namn, vard=None, port=8766, takt=None):
+    """
+    Spelar upp en kursfil som löpande rader "aktie datum kurs"
+    
+    Filen läses på samma sätt som i las_kurser. Raderna skickas till en
+    TCP-port, eller skrivs till standard ut om ingen värd anges.
+    
+    Args:
+        filnamn (str): Kursfil i samma format som kurser.txt
+        namn (iterable): Aktienamn som räknas som rubrikrader
+        vard (str): Värd att skicka till, None för standard ut
+        port (int): Port att skicka till
+        takt (float): Högsta antal rader per sekund, None för så fort som möjligt
+        
+    Returns:
+        int: Antal skickade rader
+    """
+    namn = set(namn)
+    if vard is not None:
+        _, writer = await asyncio.open_connection(vard, port)
+    else:
+        writer = None
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    antal = 0
+    with open(filnamn, 'r') as f:
+        nuvarande = None
+        for rad in f:
+            rad = rad.strip()
+            if not rad:
+                continue
+            if rad in namn:
+                nuvarande = rad
+                continue
+            if nuvarande is None or " " not in rad:
+                continue
+            falt = rad.split()
+            text = f"{nuvarande} {falt[0]} {falt[-1]}\n"
+            if writer is not None:
+                writer.write(text.encode(locale.getpreferredencoding(False)))
+                # Väntar här om mottagaren inte hinner med
+                await writer.drain()
+            else:
+                sys.stdout.write(text)
+            antal += 1
+            if takt is not None:
+                vanta = start + antal / takt - loop.time()
+                if vanta > 0:
+                    await asyncio.sleep(vanta)
+    if writer is not None:
+        writer.close()
+        await writer.wait_closed()
+    else:
+        sys.stdout.flush()
+    return antal
+
+
+class AnalysServer:
+    """
+    Server som håller aktierna i minnet och svarar på frågor över HTTP
+    
+    Filerna läses en gång. Analysen av alla aktier, rangordningen och
+    fundamentaindexet räknas fram direkt och sparas i en ögonblicksbild
+    som frågorna sedan bara slår upp i. Ändras någon indatafil läses allt
+    in på nytt i en bakgrundstråd, och den nya ögonblicksbilden ersätter
+    den gamla först när den är klar.
+    
+    Med ett KursIntag kan löpande kurser läggas till under tiden. Aktier
+    som fått nya kurser analyseras då om vid varje fråga, och rangordningen
+    räknas om när kurserna ändrats. Kurser från intaget finns bara i minnet
+    och försvinner när filerna läses in på nytt.
+    
+    Frågor (GET, svar i JSON):
+        /status
+        /aktier
+        /aktie?namn=N, /fundamental?namn=N, /teknisk?namn=N
+        /rangordning?topp=K, ?botten=K eller ?start=S&antal=A
+        /screena?soliditet=40:&p_e_tal=0:15
+    """
+    def __init__(self, fundamenta_fil, kurser_fil, omx_fil, processer=None, intervall=2.0):
+        """
+        Initierar servern
+        
+        Args:
+            fundamenta_fil (list): Filer med fundamenta
+            kurser_fil (list): Filer med historiska kurser
+            omx_fil (str): Fil med OMX-data
+            processer (int): Antal processer vid inläsning av flera filer
+            intervall (float): Sekunder mellan kontrollerna av om filerna ändrats
+        """
+        self.fundamenta_fil = list(fundamenta_fil)
+        self.kurser_fil = list(kurser_fil)
+        self.omx_fil = omx_fil
+        self.processer = processer
+        self.intervall = intervall
+        self.data = None
+        self._signatur = None
+        self.intag = None
+        self._andrade = set()
+    
+    def _filsignatur(self):
+        """Returnerar storlek och ändringstid för alla indatafiler"""
+        signatur = []
+        for filnamn in self.fundamenta_fil + self.kurser_fil + [self.omx_fil]:
+            kalla = _kallsignatur(filnamn)
+            signatur.append(None if kalla is None else tuple(kalla.tolist()))
+        return tuple(signatur)
+    
+    def ladda(self):
+        """
+        Läser in alla filer och bygger en ny ögonblicksbild
+        
+        Returns:
+            bool: True om inläsningen lyckades, annars behålls den gamla bilden
+        """
+        signatur = self._filsignatur()
+        data = ladda_data(self.fundamenta_fil, self.kurser_fil, self.omx_fil, self.processer)
+        self._signatur = signatur
+        if data is None:
+            return False
+        aktier, lager, marknad = data
+        rang = BetaRangordning(aktier, lager)
+        rader = {rad["namn"]: {k: _json_varde(v) for k, v in rad.items()}
+                 for rad in batchrapport_rader(aktier, marknad, lager)}
+        self.data = {
+            "aktier": aktier,
+            "marknad": float(marknad),
+            "rader": rader,
+            "rang": rang,
+            "rangordning": rang.sida(marknad, 0, len(aktier)),
+            "index": FundamentaIndex(aktier),
+            "laddad": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        return True
+    
+    async def _ladda_om(self):
+        """Läser in filerna i en bakgrundstråd och kopplar intaget till den nya datan"""
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, self.ladda):
+            self._andrade = set()
+            if self.intag is not None:
+                self.intag.aktier = self.data["aktier"]
+    
+    def _kurser_andrade(self, namn):
+        """Anropas av intaget med namnen på aktier som fått nya kurser"""
+        self._andrade.update(namn)
+    
+    def _levande_rad(self, data, namn):
+        """Analyserar en aktie som fått nya kurser sedan ögonblicksbilden byggdes"""
+        aktie = data["aktier"][namn]
+        risk = {n: (r, b) for r, n, b in data["rang"].sida(data["marknad"], 0, len(data["aktier"]))}
+        lager = KursLager.fran_aktier({namn: aktie})
+        rad = _analysrad(namn, aktie, risk, lager, lager.indikatorer())
+        return {k: _json_varde(v) for k, v in rad.items()}
+    
+    def svara(self, sokvag, parametrar):
+        """
+        Besvarar en fråga mot den aktuella ögonblicksbilden
+        
+        Args:
+            sokvag (str): T.ex. "/aktie"
+            parametrar (dict): Frågeparametrar, namn -> värde
+            
+        Returns:
+            tuple: (HTTP-status, svar som går att göra om till JSON, eller
+                   text för /metrics)
+        """
+        if sokvag == "/metrics":
+            if _matning is None:
+                return 404, {"fel": "Mätningen är inte påslagen (--matning)"}
+            return 200, _matning.prometheus()
+        data = self.data
+        if data is None:
+            return 503, {"fel": "Ingen data inläst"}
+        
+        if sokvag == "/status":
+            return 200, {"laddad": data["laddad"], "aktier": len(data["aktier"]),
+                         "marknad": data["marknad"],
+                         "filer": self.fundamenta_fil + self.kurser_fil + [self.omx_fil],
+                         "intag": None if self.intag is None else {
+                             "mottagna": self.intag.mottagna, "tillagda": self.intag.tillagda,
+                             "avvisade": self.intag.avvisade, "i_ko": self.intag.ko.qsize()}}
+        if sokvag == "/aktier":
+            return 200, list(data["aktier"])
+        if sokvag in ("/aktie", "/fundamental", "/teknisk"):
+            namn = parametrar.get("namn")
+            if namn in self._andrade and namn in data["aktier"]:
+                rad = self._levande_rad(data, namn)
+            else:
+                rad = data["rader"].get(namn)
+            if rad is None:
+                return 404, {"fel": f"Okänd aktie: {parametrar.get('namn')}"}
+            if sokvag == "/fundamental":
+                return 200, {k: rad[k] for k in FUNDAMENTALA_FALT}
+            if sokvag == "/teknisk":
+                return 200, {k: v for k, v in rad.items() if k == "namn" or k not in FUNDAMENTALA_FALT}
+            return 200, rad
+        if sokvag == "/rangordning":
+            if self._andrade:
+                lista = data["rang"].sida(data["marknad"], 0, len(data["aktier"]))
+            else:
+                lista = data["rangordning"]
+            if "topp" in parametrar:
+                lista = lista[:max(0, int(parametrar["topp"]))]
+            elif "botten" in parametrar:
+                lista = lista[len(lista) - min(len(lista), max(0, int(parametrar["botten"]))):]
+            else:
+                start = int(parametrar.get("start", 0))
+                antal = int(parametrar.get("antal", len(lista)))
+                if start < 0 or antal < 0:
+                    raise ValueError("start och antal får inte vara negativa")
+                lista = lista[start:start + antal]
+            return 200, [{"rang": r, "namn": n, "betavarde": b} for r, n, b in lista]
+        if sokvag == "/screena":
+            villkor = dict(tolka_villkor(f"{k}={v}") for k, v in parametrar.items())
+            traffar = data["index"].sok(**villkor)
+            return 200, [{k: data["rader"][a.namn][k] for k in FUNDAMENTALA_FALT} for a in traffar]
+        return 404, {"fel": f"Okänd sökväg: {sokvag}"}
+    
+    async def _hantera(self, reader, writer):
+        """Läser en HTTP-förfrågan från en klient och skickar svaret"""
+        try:
+            forfragan = await reader.readline()
+            # Hoppa över rubrikerna fram till tomraden
+            while (await reader.readline()).strip():
+                pass
+            delar = forfragan.decode("latin-1").split()
+            if len(delar) < 2 or delar[0] != "GET":
+                status, svar = 405, {"fel": "Endast GET stöds"}
+            else:
+                url = urlsplit(delar[1])
+                parametrar = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                try:
+                    status, svar = self.svara(url.path, parametrar)
+                except ValueError as e:
+                    status, svar = 400, {"fel": str(e)}
+            if isinstance(svar, str):
+                kropp, typ = svar.encode("utf-8"), "text/plain; version=0.0.4"
+            else:
+                kropp, typ = json.dumps(svar, ensure_ascii=False).encode("utf-8"), "application/json"
+            text = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                    405: "Method Not Allowed", 503: "Service Unavailable"}[status]
+            writer.write(f"HTTP/1.1 {status} {text}\r\n"
+                         f"Content-Type: {typ}; charset=utf-8\r\n"
+                         f"Content-Length: {len(kropp)}\r\n"
+                         f"Connection: close\r\n\r\n".encode("latin-1") + kropp)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _bevaka(self):
+        """Läser om filerna i en bakgrundstråd när någon av dem har ändrats"""
+        while True:
+            await asyncio.sleep(self.intervall)
+            if self._filsignatur() != self._signatur:
+                print("Indatafilerna har ändrats, läser in på nytt...")
+                await self._ladda_om()
+    
+    async def kor(self, vard="127.0.0.1", port=8765, unix=None, intag_port=None, intag_fil=None):
+        """
+        Läser in data och kör servern tills den avbryts
+        
+        Args:
+            vard (str): Adress att lyssna på
+            port (int): TCP-port att lyssna på
+            unix (str): Sökväg till en Unix-socket att lyssna på i stället (valfritt)
+            intag_port (int): TCP-port för löpande kurser (valfritt)
+            intag_fil (str): Fil att följa för löpande kurser, "-" för standard in (valfritt)
+        """
+        await self._ladda_om()
+        uppgifter = []
+        if self.data is not None and (intag_port is not None or intag_fil is not None):
+            self.intag = KursIntag(self.data["aktier"], vid_batch=self._kurser_andrade)
+            uppgifter.append(asyncio.create_task(self.intag.kor()))
+            if intag_port is not None:
+                intag_server = await self.intag.lyssna(vard, intag_port)
+                uppgifter.append(asyncio.create_task(intag_server.serve_forever()))
+                print(f"Tar emot kurser på {vard}:{intag_port}")
+            if intag_fil == "-":
+                uppgifter.append(asyncio.create_task(self.intag.las_stdin()))
+            elif intag_fil is not None:
+                uppgifter.append(asyncio.create_task(self.intag.folj_fil(intag_fil)))
+        if unix is not None:
+            server = await asyncio.start_unix_server(self._hantera, path=unix)
+            print(f"Servern lyssnar på {unix}")
+        else:
+            server = await asyncio.start_server(self._hantera, vard, port)
+            print(f"Servern lyssnar på http://{vard}:{port}/")
+        uppgifter.append(asyncio.create_task(self._bevaka()))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for uppgift in uppgifter:
+                uppgift.cancel()
+
+
+def generera_data(katalog, antal_aktier=100, antal_dagar=250, fel_andel=0.01, fro=0):
+    """
+    Skriver syntetiska fundamenta.txt, kurser.txt och omx.txt
+    
+    OMX följer en slumpvandring och varje akties dagliga avkastning är
+    beta * marknadens avkastning plus eget brus. Omkring tio procent av
+    bolagen har "negativt" P/E-tal. En andel fel_andel av posterna och
+    kursraderna görs felaktiga (ogiltiga tal, saknade kurser och ogiltiga
+    datum) för att inläsningen ska testas som med riktiga filer.
+    
+    Args:
+        katalog (str): Katalog att skriva filerna i (skapas vid behov)
+        antal_aktier (int): Antal aktier
+        antal_dagar (int): Antal handelsdagar
+        fel_andel (float): Andel felaktiga poster och rader
+        fro (int): Frö till slumptalsgeneratorn
+        
+    Returns:
+        tuple: Sökvägarna till (fundamenta, kurser, omx)
+    """
+    rng = np.random.default_rng(fro)
+    os.makedirs(katalog, exist_ok=True)
+    fundamenta_fil = os.path.join(katalog, "fundamenta.txt")
+    kurser_fil = os.path.join(katalog, "kurser.txt")
+    omx_fil = os.path.join(katalog, "omx.txt")
+    
+    datum = np.busday_offset(np.datetime64("2015-01-01", "D"), np.arange(antal_dagar), roll="forward")
+    datum_text = [str(d) for d in datum]
+    marknad = rng.normal(0.0003, 0.01, antal_dagar)
+    marknad[0] = 0.0
+    omx = 2000 * np.cumprod(1 + marknad)
+    
+    with open(omx_fil, 'w') as f:
+        for text, varde in zip(datum_text, omx.tolist()):
+            if rng.random() < fel_andel:
+                f.write(f"{text} saknas\n")
+            else:
+                f.write(f"{text} {varde:.2f}\n")
+    
+    namn = [f"Bolag{i:05d} B" for i in range(antal_aktier)]
+    with open(fundamenta_fil, 'w') as f:
+        for n in namn:
+            soliditet = f"{rng.uniform(5, 80):.1f}"
+            if rng.random() < fel_andel:
+                soliditet = "okänd"
+            p_e_tal = "negativt" if rng.random() < 0.1 else f"{rng.lognormal(2.7, 0.5):.1f}"
+            f.write(f"{n}\n{soliditet}\n{p_e_tal}\n{rng.lognormal(0.5, 0.7):.2f}\n")
+    
+    with open(kurser_fil, 'w') as f:
+        for n in namn:
+            beta = rng.normal(1.0, 0.4)
+            avkastning = beta * marknad + rng.normal(0, 0.015, antal_dagar)
+            avkastning[0] = 0.0
+            kurser = rng.uniform(20, 500) * np.cumprod(1 + avkastning)
+            kurser = kurser.tolist()
+            rader = [f"{text} {kurs:.2f}" for text, kurs in zip(datum_text, kurser)]
+            for i in np.flatnonzero(rng.random(antal_dagar) < fel_andel):
+                # Ogiltigt datum men dagens riktiga kurs, priset behålls vid inläsning
+                rader[i] = rng.choice([f"{datum_text[i]} n/a", "trasigrad", f"2015-13-45 {kurser[i]:.2f}"])
+            f.write(n + "\n" + "\n".join(rader) + "\n")
+    return fundamenta_fil, kurser_fil, omx_fil
+
+
+def _mat_fas(fas, forbered=None, repetitioner=3):
+    """
+    Mäter tid och toppminne för en fas
+    
+    Tiden är den kortaste av flera körningar. Minnet mäts i en separat
+    körning med tracemalloc, eftersom tracemalloc gör koden betydligt
+    långsammare. Utskrifter från fasen tas bort.
+    
+    Args:
+        fas (callable): Fasen, anropas med resultatet från forbered
+        forbered (callable): Förberedelse som inte räknas in (valfritt)
+        repetitioner (int): Antal körningar för tidmätningen
+        
+    Returns:
+        tuple: (sekunder, toppminne i MB)
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        sekunder = float("inf")
+        for _ in range(repetitioner):
+            argument = forbered() if forbered is not None else ()
+            start = time.perf_counter()
+            fas(*argument)
+            sekunder = min(sekunder, time.perf_counter() - start)
+        
+        argument = forbered() if forbered is not None else ()
+        tracemalloc.start()
+        try:
+            fas(*argument)
+            _, topp = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return sekunder, topp / (1024 * 1024)
+
+
+def kor_benchmark(skalor, katalog, fro=0):
+    """
+    Genererar data och mäter varje fas för alla skalor
+    
+    Args:
+        skalor (list): (antal aktier, antal dagar) per skala
+        katalog (str): Katalog för genererad data
+        fro (int): Frö till slumptalsgeneratorn
+        
+    Returns:
+        list: En dict per skala och fas med tid och toppminne
+    """
+    resultat = []
+    for antal_aktier, antal_dagar in skalor:
+        fundamenta_fil, kurser_fil, omx_fil = generera_data(
+            os.path.join(katalog, f"{antal_aktier}x{antal_dagar}"), antal_aktier, antal_dagar, fro=fro)
+        
+        def inlasta():
+            with contextlib.redirect_stdout(io.StringIO()):
+                aktier = las_fundamenta(fundamenta_fil)
+                lager = las_kurser_bulk(kurser_fil, aktier)
+                omx = las_omx_bulk(omx_fil)
+            return aktier, lager, marknadsavkastning(omx)
+        
+        faser = [
+            ("las_fundamenta", lambda: las_fundamenta(fundamenta_fil), None),
+            ("las_kurser", lambda a: las_kurser(kurser_fil, a), lambda: (las_fundamenta(fundamenta_fil),)),
+            ("las_kurser_bulk", lambda a: las_kurser_bulk(kurser_fil, a), lambda: (las_fundamenta(fundamenta_fil),)),
+            ("las_omx", lambda: las_omx(omx_fil), None),
+            ("las_omx_bulk", lambda: las_omx_bulk(omx_fil), None),
+            ("berakna_betavarde", lambda a, l, m: [x.berakna_betavarde(m) for x in a.values()], inlasta),
+            ("rangordna_efter_risk", lambda a, l, m: rangordna_efter_risk(a, m), inlasta),
+            ("rangordna_efter_risk_lager", lambda a, l, m: rangordna_efter_risk(a, m, l), inlasta),
+        ]
+        for namn, fas, forbered in faser:
+            sekunder, minne = _mat_fas(fas, forbered)
+            resultat.append({"aktier": antal_aktier, "dagar": antal_dagar, "fas": namn,
+                             "sekunder": round(sekunder, 6), "topp_minne_mb": round(minne, 3)})
+            print(f"{antal_aktier:>7} aktier {antal_dagar:>6} dagar  {namn:<28} "
+                  f"{_svenskt(sekunder * 1000):>10} ms {_svenskt(minne):>9} MB")
+    return resultat
+
+
+def jamfor_benchmark(resultat, tidigare, tolerans=0.2, minsta_tid=0.01):
+    """
+    Jämför med tidigare resultat och skriver ut faser som blivit långsammare
+    
+    Args:
+        resultat (list): Nya resultat från kor_benchmark
+        tidigare (list): Tidigare resultat
+        tolerans (float): Tillåten försämring, 0.2 = 20 % långsammare
+        minsta_tid (float): Faser som tar kortare tid än så (sekunder) jämförs
+                            inte, där är mätbruset för stort
+        
+    Returns:
+        list: (skala, fas, kvot) för varje fas som blivit för långsam
+    """
+    gamla = {(r["aktier"], r["dagar"], r["fas"]): r for r in tidigare}
+    forsamringar = []
+    for r in resultat:
+        gammal = gamla.get((r["aktier"], r["dagar"], r["fas"]))
+        if gammal is None or max(gammal["sekunder"], r["sekunder"]) < minsta_tid:
+            continue
+        kvot = r["sekunder"] / gammal["sekunder"]
+        if kvot > 1 + tolerans:
+            forsamringar.append((f"{r['aktier']}x{r['dagar']}", r["fas"], kvot))
+            print(f"Försämring: {r['fas']} ({r['aktier']}x{r['dagar']}) "
+                  f"{_svenskt(kvot)} gånger långsammare")
+    if not forsamringar:
+        print("Inga försämringar jämfört med tidigare resultat")
+    return forsamringar
+
+
+def tolka_skala(text):
+    """Tolkar en skala på formen AKTIERxDAGAR, t.ex. 1000x250"""
+    aktier, sep, dagar = text.lower().partition("x")
+    if not sep or not aktier.isdigit() or not dagar.isdigit():
+        raise argparse.ArgumentTypeError(f"Felaktig skala: {text} (använd AKTIERxDAGAR)")
+    return int(aktier), int(dagar)
+
+
+def main(argv=None):
+    """Huvudfunktion som kör aktieanalysprogrammet"""
+    parser = argparse.ArgumentParser(description="Aktieanalysprogram")
+    parser.add_argument("--fundamenta", nargs="+", default=["fundamenta.txt"],
+                        help="Fil(er) med fundamenta")
+    parser.add_argument("--kurser", nargs="+", default=["kurser.txt"],
+                        help="Fil(er) med historiska kurser, flera läses parallellt")
+    parser.add_argument("--processer", type=int,
+                        help="Antal processer vid inläsning av flera filer (standard: en per kärna)")
+    parser.add_argument("--omx", default="omx.txt", help="Fil med OMX-data")
+    parser.add_argument("--visa-hastighet", action="store_true",
+                        help="Läs kurs- och OMX-filen utan cache och skriv ut hastigheten i MB/s")
+    parser.add_argument("--testa-inlasning", action="store_true",
+                        help="Jämför blockvis och radvis inläsning på kantfall och avsluta")
+    parser.add_argument("--batch", action="store_true",
+                        help="Analysera alla aktier utan meny och skriv en rapport")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv",
+                        help="Format för batchrapporten")
+    parser.add_argument("--utfil", help="Fil för batchrapporten (standard: stdout)")
+    parser.add_argument("--screena", action="append", metavar="VILLKOR",
+                        help="Screena fundamenta, t.ex. soliditet=40: p_e_tal=0:15 (kan upprepas)")
+    parser.add_argument("--topp", type=int, metavar="K",
+                        help="Visa de K aktierna med högst betavärde och avsluta")
+    parser.add_argument("--botten", type=int, metavar="K",
+                        help="Visa de K aktierna med lägst betavärde och avsluta")
+    parser.add_argument("--portfolj", action="append", metavar="NAMN=VIKT",
+                        help="Visa portföljrisk för angivna vikter och avsluta (kan upprepas)")
+    parser.add_argument("--server", action="store_true",
+                        help="Kör som server och svara på frågor över HTTP")
+    parser.add_argument("--vard", default="127.0.0.1", help="Adress för servern")
+    parser.add_argument("--port", type=int, default=8765, help="Port för servern")
+    parser.add_argument("--unix", metavar="SOCKET", help="Lyssna på en Unix-socket i stället för TCP")
+    parser.add_argument("--intag-port", type=int, metavar="PORT",
+                        help="Ta emot löpande kurser (aktie datum kurs) på en TCP-port i servern")
+    parser.add_argument("--intag-fil", metavar="FIL",
+                        help="Följ en fil med löpande kurser i servern, - för standard in")
+    parser.add_argument("--spela-upp", metavar="KURSFIL",
+                        help="Spela upp en kursfil som löpande kurser och avsluta")
+    parser.add_argument("--till", metavar="VÄRD:PORT",
+                        help="Skicka uppspelningen hit i stället för till standard ut")
+    parser.add_argument("--takt", type=float, metavar="RADER",
+                        help="Högsta antal rader per sekund vid uppspelning")
+    parser.add_argument("--generera", metavar="KATALOG",
+                        help="Skriv syntetiska indatafiler i KATALOG och avsluta")
+    parser.add_argument("--skala", type=tolka_skala, default=(100, 250), metavar="AKTIERxDAGAR",
+                        help="Storlek på genererad data (standard: 100x250)")
+    parser.add_argument("--benchmark", nargs="*", type=tolka_skala, metavar="AKTIERxDAGAR",
+                        help="Mät alla faser för skalorna (standard: 100x250 1000x250 1000x1000)")
+    parser.add_argument("--resultat", default="benchmark.json",
+                        help="Fil att spara benchmarkresultaten i")
+    parser.add_argument("--jamfor", metavar="FIL",
+                        help="Jämför benchmarken med tidigare resultat, avslutar med fel vid försämring")
+    parser.add_argument("--matning", action="store_true",
+                        help="Mät anrop och inlästa rader och skriv en sammanfattning till stderr")
+    parser.add_argument("--matning-fil", metavar="FIL",
+                        help="Spara mätningen i FIL, som JSON om FIL slutar på .json annars i Prometheus textformat")
+    args = parser.parse_args(argv)
+    
+    if not (args.matning or args.matning_fil):
+        return _kor(args, parser)
+    matning = aktivera_matning()
+    try:
+        return _kor(args, parser)
+    finally:
+        avaktivera_matning()
+        if args.matning:
+            print("\nMätning:", file=sys.stderr)
+            matning.skriv(sys.stderr)
+        if args.matning_fil:
+            matning.spara(args.matning_fil)
+
+
+def _kor(args, parser):
+    """Kör det kommando som valts på kommandoraden"""
+    if args.testa_inlasning:
+        return 0 if test_las_kurser_bulk() else 1
+    
+    if args.generera:
+        filer = generera_data(args.generera, *args.skala)
+        print("Skrev " + ", ".join(filer))
+        return
+    
+    if args.benchmark is not None:
+        skalor = args.benchmark or [(100, 250), (1000, 250), (1000, 1000)]
+        katalog = os.path.join(os.path.dirname(os.path.abspath(args.resultat)), "benchmarkdata")
+        resultat = kor_benchmark(skalor, katalog)
+        with open(args.resultat, 'w', encoding='utf-8') as f:
+            json.dump({"tid": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "python": platform.python_version(), "numpy": np.__version__,
+                       "resultat": resultat}, f, ensure_ascii=False, indent=2)
+        print(f"Resultaten sparade i {args.resultat}")
+        if args.jamfor:
+            with open(args.jamfor, encoding='utf-8') as f:
+                tidigare = json.load(f)["resultat"]
+            if jamfor_benchmark(resultat, tidigare):
+                return 1
+        return
+    
+    if args.server:
+        server = AnalysServer(args.fundamenta, args.kurser, args.omx, args.processer)
+        try:
+            asyncio.run(server.kor(args.vard, args.port, args.unix, args.intag_port, args.intag_fil))
+        except KeyboardInterrupt:
+            print("\nServern avslutad")
+        return
+    
+    if args.spela_upp:
+        vard, port = None, None
+        if args.till:
+            vard, _, port = args.till.rpartition(":")
+            if not vard or not port.isdigit():
+                parser.error(f"Felaktig adress: {args.till} (använd värd:port)")
+        with contextlib.redirect_stdout(sys.stderr):
+            namn = las_fundamenta_filer(args.fundamenta, args.processer, cache=True)
+        antal = asyncio.run(spela_upp(args.spela_upp, namn, vard, int(port or 0), args.takt))
+        print(f"{antal} kurser uppspelade", file=sys.stderr)
+        return
+    
+    if args.screena:
+        aktier = las_fundamenta_filer(args.fundamenta, args.processer, cache=True)
+        try:
+            screena(aktier, args.screena)
+        except ValueError as e:
+            parser.error(str(e))
+        return
+    
+    if args.batch:
+        # Statusutskrifter till stderr så att rapporten på stdout blir ren
+        with contextlib.redirect_stdout(sys.stderr):
+            data = ladda_data(args.fundamenta, args.kurser, args.omx, args.processer, args.visa_hastighet)
+        if data is None:
+            return
+        aktier, lager, marknad = data
+        skriv_batchrapport(aktier, marknad, args.utfil, args.format, lager)
+        return
+    
+    if args.portfolj:
+        try:
+            vikter = dict(tolka_vikt(text) for text in args.portfolj)
+        except ValueError as e:
+            parser.error(str(e))
+        data = ladda_data(args.fundamenta, args.kurser, args.omx, args.processer, args.visa_hastighet)
+        if data is not None:
+            aktier, lager, marknad = data
+            try:
+                visa_portfoljrisk(aktier, lager, las_omx_bulk(args.omx, cache=True), vikter)
+            except ValueError as e:
+                print(f"Fel: {e}")
+        return
+    
+    if args.topp is not None or args.botten is not None:
+        data = ladda_data(args.fundamenta, args.kurser, args.omx, args.processer, args.visa_hastighet)
+        if data is not None:
+            aktier, lager, marknad = data
+            rangordna_efter_risk(aktier, marknad, lager, topp=args.topp, botten=args.botten)
+        return
+    
+    print("Startar aktieanalysprogram...")
+    
+    # 1. Läs data från filer och beräkna marknadsavkastning
+    data = ladda_data(args.fundamenta, args.kurser, args.omx, args.processer, args.visa_hastighet)
+    if data is None:
+        return
+    aktier, lager, marknad = data
+    rang = BetaRangordning(aktier, lager)
     
-    # 4. Huvudloop
+    # 2. Huvudloop
     while True:
         val = visa_meny()
         
@@ -396,11 +3953,11 @@ def main():
         elif val == 2:
             gor_kortsiktig_analys(aktier, marknad)
         elif val == 3:
-            rangordna_efter_risk(aktier, marknad)
+            rangordna_efter_risk(aktier, marknad, rang=rang)
         elif val == 4:
             print("\nTack för att du använde programmet!")
             break
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -10,14 +10,30 @@ Ekvation: f(x) = (8/3)*(x/L) - 3*(x/L)^2 + (1/3)*(x/L)^3 - (2/3)*sin(πx/L) = 0
 
 @author: inez
 """
+import argparse
+import csv
+import json
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 
 def console_clear():
-    """Rensar konsolen"""
-    os.system('clear' if os.name != 'nt' else 'cls')
+    """Rensar konsolen med ANSI-koder, utan att starta ett skal"""
+    if sys.stdout.isatty():
+        print("\033[2J\033[H", end="", flush=True)
+
+
+def _pyplot():
+    """
+    Importerar matplotlib först när något ska plottas, så att lösarna kan
+    användas utan att betala för importen.
+    """
+    import matplotlib.pyplot as plt
+    return plt
 
 
 # KONSTANTER OCH FUNKTIONSDEFINITIONER
@@ -38,15 +54,166 @@ g = lambda x: (3*L/8)*(3*(x/L)**2 - (1/3)*(x/L)**3 + (2/3)*np.sin(np.pi*x/L))
 dg = lambda x: (3*L/8)*(6*(x/L)*(1/L) - (x/L)**2*(1/L) + (2/3)*(np.pi/L)*np.cos(np.pi*x/L))
 
 
+# Samma funktion och derivata med L som parameter, för parameterfortsättning.
+# Vanliga funktioner i stället för lambdas så att de kan skickas till andra processer.
+def f_L(x, L):
+    """f(x) för en given längd L"""
+    return (8/3)*(x/L) - 3*(x/L)**2 + (1/3)*(x/L)**3 - (2/3)*np.sin(np.pi*x/L)
+
+
+def df_L(x, L):
+    """f'(x) för en given längd L"""
+    return (8/3)*(1/L) - 6*(x/L)*(1/L) + (x/L)**2*(1/L) - (2/3)*(np.pi/L)*np.cos(np.pi*x/L)
+
+
+# AUTOMATISK DERIVERING MED DUALTAL
+class Dual:
+    """
+    Dualtal a + b*eps med eps^2 = 0, där a är värdet och b derivatan.
+    Räknar man ut f(Dual(x, 1)) fås f(x) och f'(x) i samma pass, så någon
+    handskriven derivata behövs inte. a och b kan vara tal eller arrayer.
+    NumPy-funktioner som np.sin fungerar via __array_ufunc__.
+    """
+    __slots__ = ("varde", "derivata")
+    
+    def __init__(self, varde, derivata=0.0):
+        self.varde = varde
+        self.derivata = derivata
+    
+    def __repr__(self):
+        return f"Dual({self.varde!r}, {self.derivata!r})"
+    
+    def __add__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.varde + other.varde, self.derivata + other.derivata)
+        return Dual(self.varde + other, self.derivata)
+    
+    __radd__ = __add__
+    
+    def __sub__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.varde - other.varde, self.derivata - other.derivata)
+        return Dual(self.varde - other, self.derivata)
+    
+    def __rsub__(self, other):
+        return Dual(other - self.varde, -self.derivata)
+    
+    def __mul__(self, other):
+        if isinstance(other, Dual):
+            return Dual(self.varde * other.varde,
+                        self.derivata * other.varde + self.varde * other.derivata)
+        return Dual(self.varde * other, self.derivata * other)
+    
+    __rmul__ = __mul__
+    
+    def __truediv__(self, other):
+        if isinstance(other, Dual):
+            kvot = self.varde / other.varde
+            return Dual(kvot, (self.derivata - kvot * other.derivata) / other.varde)
+        return Dual(self.varde / other, self.derivata / other)
+    
+    def __rtruediv__(self, other):
+        kvot = other / self.varde
+        return Dual(kvot, -kvot * self.derivata / self.varde)
+    
+    def __pow__(self, exponent):
+        if isinstance(exponent, Dual):
+            return np.exp(exponent * np.log(self))
+        if exponent == 2:
+            return Dual(self.varde * self.varde, 2 * self.varde * self.derivata)
+        potens = self.varde ** (exponent - 1)
+        return Dual(potens * self.varde, exponent * potens * self.derivata)
+    
+    def __rpow__(self, bas):
+        potens = bas ** self.varde
+        return Dual(potens, potens * np.log(bas) * self.derivata)
+    
+    def __neg__(self):
+        return Dual(-self.varde, -self.derivata)
+    
+    def __pos__(self):
+        return self
+    
+    def __abs__(self):
+        return Dual(np.abs(self.varde), np.sign(self.varde) * self.derivata)
+    
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != "__call__" or kwargs:
+            return NotImplemented
+        if ufunc in _DUAL_OPERATORER:
+            a, b = inputs
+            return _DUAL_OPERATORER[ufunc](a, b)
+        if ufunc in _DUAL_FUNKTIONER:
+            (x,) = inputs
+            varde, derivata = _DUAL_FUNKTIONER[ufunc](x.varde)
+            return Dual(varde, derivata * x.derivata)
+        return NotImplemented
+
+
+# Binära NumPy-funktioner, t.ex. np.float64 * Dual, och deras motsvarighet
+_DUAL_OPERATORER = {
+    np.add: lambda a, b: a + b if isinstance(a, Dual) else b + a,
+    np.subtract: lambda a, b: a - b if isinstance(a, Dual) else b.__rsub__(a),
+    np.multiply: lambda a, b: a * b if isinstance(a, Dual) else b * a,
+    np.true_divide: lambda a, b: a / b if isinstance(a, Dual) else b.__rtruediv__(a),
+    np.power: lambda a, b: a ** b if isinstance(a, Dual) else b.__rpow__(a),
+}
+
+# Envariabelfunktioner: värde -> (f(värde), f'(värde))
+_DUAL_FUNKTIONER = {
+    np.sin: lambda a: (np.sin(a), np.cos(a)),
+    np.cos: lambda a: (np.cos(a), -np.sin(a)),
+    np.tan: lambda a: (np.tan(a), 1 + np.tan(a)**2),
+    np.exp: lambda a: (np.exp(a), np.exp(a)),
+    np.log: lambda a: (np.log(a), 1 / a),
+    np.sqrt: lambda a: (np.sqrt(a), 0.5 / np.sqrt(a)),
+    np.arctan: lambda a: (np.arctan(a), 1 / (1 + a**2)),
+    np.sinh: lambda a: (np.sinh(a), np.cosh(a)),
+    np.cosh: lambda a: (np.cosh(a), np.sinh(a)),
+    np.tanh: lambda a: (np.tanh(a), 1 - np.tanh(a)**2),
+    np.negative: lambda a: (-a, -1.0),
+    np.absolute: lambda a: (np.abs(a), np.sign(a)),
+}
+
+
+def varde_och_derivata(f, x):
+    """
+    Beräknar f(x) och f'(x) i ett enda pass med dualtal.
+    Fungerar för både tal och arrayer av x. Derivatan börjar som talet 1 även
+    för arrayer och blir en array först när den måste, så linjära deluttryck
+    som x/L inte kostar någon extra arrayräkning.
+    """
+    y = f(Dual(x, 1.0))
+    if not isinstance(y, Dual):
+        # f beror inte på x
+        y = Dual(y, 0.0)
+    if np.shape(y.derivata) != np.shape(y.varde):
+        return y.varde, np.broadcast_to(y.derivata, np.shape(y.varde)).copy()
+    return y.varde, y.derivata
+
+
 # UPPGIFT 1a: PLOTTA FUNKTIONEN OCH IDENTIFIERA NOLLSTÄLLEN
+def ungefarliga_nollstallen(punkter=1000):
+    """
+    Beräknar f(x) på [0, L] och hittar nollställena genom teckenbyte.
+    Returnerar (x, y, ungefärliga nollställen) utan att plotta.
+    """
+    x = np.linspace(0, L, punkter)
+    y = f(x)
+    
+    # Hitta nollställen genom teckenbyte
+    i = teckenbyten(y)
+    return x, y, ((x[i] + x[i+1]) / 2).tolist()
+
+
 def plot_function():
     """
     Plottar funktionen f(x) för att visualisera nollställena.
     Returnerar ungefärliga positioner för nollställena.
     """
-    x = np.linspace(0, L, 1000)
-    y = f(x)
+    x, y, zeros_approx = ungefarliga_nollstallen()
     
+    plt = _pyplot()
     plt.figure(figsize=(10, 6))
     plt.plot(x, y, 'b-', linewidth=2, label='f(x)')
     plt.axhline(0, color='r', linestyle='--', linewidth=1, label='y = 0')
@@ -57,12 +224,6 @@ def plot_function():
     plt.grid(True, alpha=0.3)
     plt.xlim(0, L)
     
-    # Hitta nollställen genom teckenbyte
-    zeros_approx = []
-    for i in range(len(y)-1):
-        if y[i] * y[i+1] < 0:
-            zeros_approx.append((x[i] + x[i+1]) / 2)
-    
     # Markera nollställena med vertikala linjer
     for zero in zeros_approx:
         plt.axvline(zero, color='g', linestyle=':', alpha=0.5, linewidth=2)
@@ -77,14 +238,181 @@ def plot_function():
     return zeros_approx
 
 
+def teckenbyten(y):
+    """
+    Returnerar index i där y byter tecken mellan y[i] och y[i+1].
+    """
+    return np.flatnonzero(y[:-1] * y[1:] < 0)
+
+
+# ALLA NOLLSTÄLLEN PÅ ETT INTERVALL
+def _misstankt_par(x, y, dy):
+    """
+    Markerar delintervall utan teckenbyte där |f| minskar in från båda
+    ändpunkterna, dvs där två nära nollställen kan gömma sig.
+    Tangenterna i ändpunkterna skär varandra i en punkt; om den ligger på
+    samma sida om noll som f kan f inte byta tecken om den är konvex
+    (konkav) där, och intervallet behöver inte delas.
+    """
+    ya, yb, dya, dyb = y[:-1], y[1:], dy[:-1], dy[1:]
+    vander = (ya * yb > 0) & (ya * dya < 0) & (yb * dyb > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xs = (yb - ya + dya * x[:-1] - dyb * x[1:]) / (dya - dyb)
+        skarning = ya + dya * (xs - x[:-1])
+    return vander & ~(ya * skarning > 0)
+
+
+def hitta_nollstallen(f, df, a, b, tol, punkter=64, max_djup=60, max_iter=100):
+    """
+    Hittar alla nollställen till f på [a, b] utan att plotta.
+    
+    1. f och f' beräknas på ett grovt rutnät och teckenbyten söks vektoriserat.
+       Där f är noll i en rutnätspunkt avgör f' tecknet strax intill.
+    2. Delintervall där |f| minskar in från båda ändarna utan teckenbyte, och
+       där tangenterna inte utesluter ett nollställe, halveras tills det är
+       avgjort, så att nära liggande nollställen inte missas.
+    3. Alla intervall med teckenbyte förfinas samtidigt med Newtons metod
+       skyddad av bisektion, där första steget tas med de redan beräknade
+       värdena i den ändpunkt där |f| är minst.
+    
+    Returnerar (nollställen, konvergerade, antal beräkningar av f och f'),
+    där konvergerade är en mask som är False för nollställen som inte nått
+    toleransen inom max_iter iterationer.
+    """
+    x = np.linspace(a, b, punkter + 1)
+    y, dy = f(x), df(x)
+    antal = x.size
+    
+    # Adaptiv förfining av rutnätet
+    for _ in range(max_djup):
+        i = np.flatnonzero(_misstankt_par(x, y, dy) & (np.diff(x) > tol))
+        if i.size == 0:
+            break
+        xm = (x[i] + x[i+1]) / 2
+        ym, dym = f(xm), df(xm)
+        antal += xm.size
+        x = np.insert(x, i + 1, xm)
+        y = np.insert(y, i + 1, ym)
+        dy = np.insert(dy, i + 1, dym)
+    
+    # Ett nollställe i en rutnätspunkt är en intervallgräns: tecknet på f
+    # strax intill ges av f' där, så ett nära nollställe bredvid hittas ändå
+    rotter = [x[y == 0]]
+    tecken_a = np.where(y[:-1] == 0, np.sign(dy[:-1]), np.sign(y[:-1]))
+    tecken_b = np.where(y[1:] == 0, -np.sign(dy[1:]), np.sign(y[1:]))
+    i = np.flatnonzero(tecken_a * tecken_b < 0)
+    lo, hi = x[i], x[i+1]
+    flo = np.where(y[i] == 0, tecken_a[i], y[i])
+    
+    # Första Newtonsteget från ändpunkten med minst |f|, med sparade värden
+    vanster = np.abs(y[i]) <= np.abs(y[i+1])
+    x0 = np.where(vanster, lo, hi)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xn = x0 - np.where(vanster, y[i], y[i+1]) / np.where(vanster, dy[i], dy[i+1])
+    xn = np.where((xn > lo) & (xn < hi), xn, (lo + hi) / 2)
+    
+    aktiva = np.arange(xn.size)
+    for _ in range(max_iter):
+        if aktiva.size == 0:
+            break
+        xa = xn[aktiva]
+        fx, dfx = f(xa), df(xa)
+        antal += xa.size
+        
+        # Krymp intervallet så att det fortfarande innehåller teckenbytet
+        samma = np.sign(fx) == np.sign(flo[aktiva])
+        lo[aktiva] = np.where(samma, xa, lo[aktiva])
+        flo[aktiva] = np.where(samma, fx, flo[aktiva])
+        hi[aktiva] = np.where(samma, hi[aktiva], xa)
+        
+        # Newtonsteg om det hamnar i intervallet, annars bisektion
+        with np.errstate(divide='ignore', invalid='ignore'):
+            steg = xa - fx / dfx
+        inne = (steg > lo[aktiva]) & (steg < hi[aktiva])
+        xny = np.where(inne, steg, (lo[aktiva] + hi[aktiva]) / 2)
+        xn[aktiva] = xny
+        
+        klar = (np.abs(xny - xa) <= tol) | (fx == 0) | (hi[aktiva] - lo[aktiva] <= tol)
+        xn[aktiva[fx == 0]] = xa[fx == 0]
+        aktiva = aktiva[~klar]
+    
+    rotter.append(xn)
+    konvergerade = np.ones(xn.size, dtype=bool)
+    konvergerade[aktiva] = False
+    konvergerade = np.concatenate([np.ones(rotter[0].size, dtype=bool), konvergerade])
+    rotter = np.concatenate(rotter)
+    ordning = np.argsort(rotter, kind='stable')
+    return rotter[ordning], konvergerade[ordning], antal
+
+
+def test_hitta_nollstallen():
+    """
+    Testar hitta_nollstallen på nära nollställen, även när ett av dem
+    ligger exakt i en rutnätspunkt (0.5 med 64 delintervall på [0, 1]).
+    Returnerar True om alla fall ger rätt nollställen.
+    """
+    fall = {
+        "(x-0.5)(x-0.5001)": [0.5, 0.5001],
+        "(x-0.5)(x-0.4999)": [0.4999, 0.5],
+        "(x-0.5)(x-0.5001)(x-0.2)": [0.2, 0.5, 0.5001],
+        "(x-0.3)(x-0.3001)": [0.3, 0.3001],
+    }
+    
+    print("\nTest av hitta_nollstallen")
+    alla_ok = True
+    for namn, forvantade in fall.items():
+        r = np.array(forvantade)
+        polynom = lambda x: np.prod([x - z for z in r], axis=0)
+        derivata = lambda x: sum(np.prod([x - z for j, z in enumerate(r) if j != i], axis=0)
+                                 for i in range(len(r)))
+        rotter, konvergerade, _ = hitta_nollstallen(polynom, derivata, 0.0, 1.0, 1e-12)
+        ok = (len(rotter) == len(r) and np.allclose(rotter, r, atol=1e-10)
+              and konvergerade.all())
+        print(f"Verifiering {namn}: {ok}")
+        alla_ok &= ok
+    return alla_ok
+
+
+def test_fortsattning():
+    """
+    Testar fortsattning när ett parametervärde hamnar exakt i en korsning:
+    för (x-0.5)(x-p) med p = 0.1, 0.11, ..., 0.9 ska svepet följa x = p,
+    och vid p = 0.5 är prediktorn själv nollstället.
+    Returnerar True om svepet stannar på grenen och korsningen rapporteras.
+    """
+    p = np.linspace(0.1, 0.9, 81)
+    x, n, handelser = fortsattning(lambda t, q: (t - 0.5) * (t - q),
+                                   lambda t, q: 2 * t - 0.5 - q, 0.1, p)
+    resultat = {
+        "följer x = p": np.allclose(x, p, atol=1e-10),
+        "nollställe i korsningen": x[40] == 0.5 and n[40] == 0,
+        "en korsning vid p = 0.5": [(h[0], h[1]) for h in handelser] == [("korsning", 40)],
+    }
+    
+    print("\nTest av fortsattning")
+    for namn, ok in resultat.items():
+        print(f"Verifiering {namn}: {ok}")
+    return all(resultat.values())
+
+
 # UPPGIFT 1b: KONVERGENSANALYS FÖR FIXPUNKTSMETODEN
+def konvergensomrade(zeros_approx, punkter=1000):
+    """
+    Beräknar |g'(x)| på [0, L] och i nollställena. Fixpunktsmetoden kan
+    konvergera där |g'(x)| < 1.
+    Returnerar (x, |g'(x)|, |g'| i varje nollställe) utan att plotta.
+    """
+    x = np.linspace(0, L, punkter)
+    return x, np.abs(dg(x)), [np.abs(dg(z)) for z in zeros_approx]
+
+
 def analyze_convergence(zeros_approx):
     """
     Analyserar var fixpunktsmetoden kan konvergera genom att plotta |g'(x)|.
     """
-    x = np.linspace(0, L, 1000)
-    dg_vals = np.abs(dg(x))
+    x, dg_vals, dg_nollstallen = konvergensomrade(zeros_approx)
     
+    plt = _pyplot()
     plt.figure(figsize=(10, 6))
     plt.plot(x, dg_vals, 'purple', linewidth=2, label="|g'(x)|")
     plt.axhline(1, color='r', linestyle='--', linewidth=1.5, label="|g'(x)| = 1")
@@ -102,8 +430,7 @@ def analyze_convergence(zeros_approx):
                      color='green', label='Konvergensområde')
     
     # Markera nollställena
-    for i, z in enumerate(zeros_approx, 1):
-        dg_val = np.abs(dg(z))
+    for z, dg_val in zip(zeros_approx, dg_nollstallen):
         color = 'green' if dg_val < 1 else 'red'
         plt.scatter(z, dg_val, s=100, color=color, zorder=5)
     
@@ -111,108 +438,516 @@ def analyze_convergence(zeros_approx):
     plt.show()
     
     print("\nKvantitativ analys:")
-    for i, z in enumerate(zeros_approx, 1):
-        dg_val = np.abs(dg(z))
+    for i, (z, dg_val) in enumerate(zip(zeros_approx, dg_nollstallen), 1):
         status = "Ja" if dg_val < 1 else "Nej"
         print(f"  Nollställe {i} (x≈{z:.3f}): |g'(x)| = {dg_val:.3f} → {status}")
 
 
 # UPPGIFT 1c: FIXPUNKTSMETODEN
-def fixpunktsmetoden(g, x0, tol, max_iter, verbose=True):
+def _steffensen_steg(g, x):
+    """
+    Ett Steffensensteg: Aitkens Δ²-extrapolation av två fixpunktssteg.
+    x_{n+1} = x_n - (g(x_n) - x_n)^2 / (g(g(x_n)) - 2*g(x_n) + x_n)
+    """
+    x1 = g(x)
+    x2 = g(x1)
+    namnare = x2 - 2*x1 + x
+    if namnare == 0:
+        return x2
+    return x - (x1 - x)**2 / namnare
+
+
+def _historik(historik, verbose, x0, max_iter):
+    """
+    Förbereder historiken för en lösare.
+    historik=True ger en lista, en NumPy-array används som förallokerad
+    buffert och False ger ingen historik. Utskrifterna behöver iteraten,
+    så med verbose=True sparas de alltid.
+    Bufferten måste rymma x0 och max_iter + 1 iterat, annars ValueError.
+    Returnerar (lista eller None, buffert eller None).
+    """
+    if isinstance(historik, np.ndarray):
+        if historik.ndim != 1 or len(historik) < max_iter + 2:
+            raise ValueError(f"Historikbufferten måste vara en vektor med minst "
+                             f"max_iter + 2 = {max_iter + 2} element, fick formen {historik.shape}")
+        historik[0] = x0
+        return None, historik
+    if historik or verbose:
+        return [x0], None
+    return None, None
+
+
+def _skriv_iterationer(history):
+    """
+    Skriver iterationstabellen i efterhand, så att utskrifterna inte
+    ligger i själva iterationsloopen.
+    """
+    print(f"\n{'Iteration':<12} {'x_n':<22} {'|x_n+1 - x_n|':<18}")
+    print("-" * 52)
+    for n in range(1, len(history)):
+        print(f"{n:<12} {history[n]:<22.15f} {np.abs(history[n] - history[n-1]):<18.2e}")
+
+
+def fixpunktsmetoden(g, x0, tol, max_iter, verbose=True, accelerera=False, historik=True):
     """
     Implementerar fixpunktsiteration enligt bokens metod.
     Algoritm: x_{n+1} = g(x_n)
+    Med accelerera=True används Steffensens metod (Aitken Δ²), som
+    konvergerar kvadratiskt och även där |g'(x)| >= 1. Varje iteration
+    kostar då två anrop av g.
+    historik styr vad som returneras som history: True ger en lista med
+    alla iterat, False ger None och en array med minst max_iter + 2
+    element fylls i och returneras som vy, utan allokering per iteration.
     """
+    lista, buffert = _historik(historik, verbose, x0, max_iter)
     x = x0
-    history = [x]
     DeltaX = tol + 1.0
     n = 0
     
-    if verbose:
-        print(f"\n{'Iteration':<12} {'x_n':<22} {'|x_n+1 - x_n|':<18}")
-        print("-" * 52)
-    
-    while DeltaX > tol:
-        n += 1
-        xold = x
-        x = g(xold)
-        DeltaX = np.abs(x - xold)
-        history.append(x)
-        
+    try:
+        while DeltaX > tol:
+            n += 1
+            xold = x
+            x = _steffensen_steg(g, xold) if accelerera else g(xold)
+            DeltaX = abs(x - xold)
+            if lista is not None:
+                lista.append(x)
+            elif buffert is not None:
+                buffert[n] = x
+            
+            if n > max_iter:
+                raise RuntimeError("Fixpunktsiteration konvergerade inte")
+    finally:
         if verbose:
-            print(f"{n:<12} {x:<22.15f} {DeltaX:<18.2e}")
-        
-        if n > max_iter:
-            raise RuntimeError("Fixpunktsiteration konvergerade inte")
+            _skriv_iterationer(lista if buffert is None else buffert[:n+1])
     
     if verbose:
         print(f"\n  Nollställe: x = {x:.15f}")
         print(f"  Verifiering: f(x) = {f(x):.2e}")
     
-    return x, n, history
+    if buffert is not None:
+        return x, n, buffert[:n+1]
+    return x, n, lista if historik is True else None
 
 
 # UPPGIFT 1d: NEWTONS METOD
-def newtons_metod(f, df, x0, tol, max_iter, verbose=True):
+def newtons_metod(f, df, x0, tol, max_iter, verbose=True, historik=True):
     """
     Implementerar Newtons metod enligt bokens metod.
     Algoritm: x_{n+1} = x_n - f(x_n)/f'(x_n)
+    Med df=None beräknas f och f' i samma pass med dualtal.
+    historik fungerar som i fixpunktsmetoden.
     """
+    lista, buffert = _historik(historik, verbose, x0, max_iter)
     x = x0
-    history = [x]
     DeltaX = tol + 1.0
     n = 0
     
+    try:
+        while DeltaX > tol:
+            n += 1
+            if df is None:
+                fx, dfx = varde_och_derivata(f, x)
+            else:
+                dfx = df(x)
+            
+            if abs(dfx) < 1e-15:
+                n -= 1      # steget togs aldrig
+                raise RuntimeError("Derivatan är nästan noll")
+            
+            xold = x
+            if df is not None:
+                fx = f(xold)
+            x = xold - fx / dfx
+            DeltaX = abs(x - xold)
+            if lista is not None:
+                lista.append(x)
+            elif buffert is not None:
+                buffert[n] = x
+            
+            if n > max_iter:
+                raise RuntimeError("Newtons metod konvergerade inte")
+    finally:
+        if verbose:
+            _skriv_iterationer(lista if buffert is None else buffert[:n+1])
+    
     if verbose:
-        print(f"\n{'Iteration':<12} {'x_n':<22} {'|x_n+1 - x_n|':<18}")
-        print("-" * 52)
+        print(f"\n  Nollställe: x = {x:.15f}")
+        print(f"  Verifiering: f(x) = {f(x):.2e}")
     
-    while DeltaX > tol:
-        n += 1
-        dfx = df(x)
+    if buffert is not None:
+        return x, n, buffert[:n+1]
+    return x, n, lista if historik is True else None
+
+
+# BATCHVARIANTER: MÅNGA STARTVÄRDEN SAMTIDIGT
+# Statuskoder per element
+KONVERGERAD = 0
+EJ_KONVERGENS = 1
+NOLLDERIVATA = 2
+EJ_ANDLIG = 3
+
+STATUSTEXT = {
+    KONVERGERAD: "Konvergerade",
+    EJ_KONVERGENS: "Konvergerade inte",
+    NOLLDERIVATA: "Derivatan är nästan noll",
+    EJ_ANDLIG: "Iterationen gav ett icke ändligt värde",
+}
+
+
+def _batch_iteration(steg, x0, tol, max_iter, parametrar):
+    """
+    Gemensam loop för batchvarianterna.
+    steg(x, *p) returnerar (nytt x, mask för element som inte kan fortsätta).
+    Bara element som inte konvergerat räknas om i varje iteration.
+    """
+    # Startvärden och parametrar sänds ut mot varandra, så en parameter-
+    # array med ett skalärt x0 ger en ekvation per parametervärde
+    x, *parametrar = np.broadcast_arrays(np.asarray(x0, dtype=float), *parametrar)
+    form = x.shape
+    parametrar = [np.ravel(p) for p in parametrar]
+    x = x.astype(float).ravel()
+    n = np.zeros(x.size, dtype=int)
+    status = np.full(x.size, EJ_KONVERGENS)
+    aktiva = np.arange(x.size)
+    
+    for _ in range(max_iter):
+        if aktiva.size == 0:
+            break
+        xold = x[aktiva]
+        xny, stopp = steg(xold, *[p[aktiva] for p in parametrar])
         
-        if np.abs(dfx) < 1e-15:
-            raise RuntimeError("Derivatan är nästan noll")
+        # Element där steget inte går att ta behåller sitt gamla värde
+        status[aktiva[stopp]] = NOLLDERIVATA
+        xny = np.where(stopp, xold, xny)
+        x[aktiva] = xny
+        n[aktiva] += ~stopp
         
-        xold = x
-        x = xold - f(xold) / dfx
-        DeltaX = np.abs(x - xold)
-        history.append(x)
+        DeltaX = np.abs(xny - xold)
+        klar = DeltaX <= tol
+        status[aktiva[klar & ~stopp]] = KONVERGERAD
+        ej_andlig = ~np.isfinite(xny)
+        status[aktiva[ej_andlig]] = EJ_ANDLIG
+        aktiva = aktiva[~(klar | stopp | ej_andlig)]
+    
+    return x.reshape(form), n.reshape(form), status.reshape(form)
+
+
+def fixpunktsmetoden_batch(g, x0, tol, max_iter, parametrar=()):
+    """
+    Fixpunktsiteration för en array av startvärden samtidigt.
+    Algoritm: x_{n+1} = g(x_n) elementvis, konvergerade element uppdateras inte.
+    parametrar skickas vidare till g och sänds ut mot x0, så att även många
+    ekvationer kan lösas på en gång.
+    Returnerar (x, n, status) med formen av x0 utsänt mot parametrarna,
+    se STATUSTEXT.
+    """
+    def steg(x, *p):
+        return g(x, *p), np.zeros(x.shape, dtype=bool)
+    
+    return _batch_iteration(steg, x0, tol, max_iter, parametrar)
+
+
+def newtons_metod_batch(f, df, x0, tol, max_iter, parametrar=()):
+    """
+    Newtons metod för en array av startvärden samtidigt.
+    Algoritm: x_{n+1} = x_n - f(x_n)/f'(x_n) elementvis, konvergerade element
+    uppdateras inte. parametrar skickas vidare till f och df och sänds ut
+    mot x0.
+    Med df=None beräknas f och f' i samma pass med dualtal.
+    Returnerar (x, n, status) med formen av x0 utsänt mot parametrarna,
+    se STATUSTEXT.
+    """
+    def steg(x, *p):
+        if df is None:
+            fx, dfx = varde_och_derivata(lambda t: f(t, *p), x)
+        else:
+            fx, dfx = f(x, *p), df(x, *p)
+        nollderivata = np.abs(dfx) < 1e-15
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return x - fx / dfx, nollderivata
+    
+    return _batch_iteration(steg, x0, tol, max_iter, parametrar)
+
+
+# PARAMETERFORTSÄTTNING: FÖLJ ETT NOLLSTÄLLE NÄR EN PARAMETER ÄNDRAS
+def _svep(f, df, x0, parametervarden, tol, max_iter):
+    """
+    Följer ett nollställe till f(x, p) genom parametervärdena i tur och ordning.
+    Varje Newtonlösning startar från en prediktor: sekanten genom de två
+    senaste lösningarna, annars förra lösningen, och för första värdet x0.
+    Returnerar (x, n, händelser), se fortsattning.
+    """
+    x = np.full(len(parametervarden), np.nan)
+    n = np.zeros(len(parametervarden), dtype=int)
+    handelser = []
+    forra = []          # (p, x, f_x) för de senaste lyckade lösningarna
+    korsad = False      # korsningen vid förra värdet är redan rapporterad
+    
+    for k, p in enumerate(parametervarden):
+        if len(forra) >= 2:
+            (p1, x1, _), (p2, x2, _) = forra
+            x_pred = x2 + (x2 - x1) * (p - p2) / (p2 - p1)
+        elif forra:
+            x_pred = forra[-1][1]
+        else:
+            x_pred = x0
         
-        if verbose:
-            print(f"{n:<12} {x:<22.15f} {DeltaX:<18.2e}")
+        try:
+            xk, n[k], _ = newtons_metod(lambda t: f(t, p), lambda t: df(t, p),
+                                        x_pred, tol, max_iter, verbose=False, historik=False)
+        except RuntimeError:
+            n[k] = max_iter
+            xk = np.nan
+            if len(forra) == 2 and abs(df(x_pred, p)) < 1e-15:
+                # Prediktorn från en jämn gren hamnade precis där en annan
+                # gren korsar (f' = 0). Svepet fortsätter med sekanten genom
+                # samma lösningar i stället för att starta om från x0.
+                handelser.append(("korsning", k, p, x_pred))
+                korsad = True
+                if abs(f(x_pred, p)) <= tol:
+                    # Prediktorn är själv ett nollställe (dubbelrot i korsningen)
+                    x[k] = x_pred
+                    n[k] = 0
+                continue
+        if not np.isfinite(xk):
+            # Nollstället finns inte längre nära prediktorn, t.ex. efter en vändpunkt
+            if forra:
+                handelser.append(("vändpunkt", k, p, forra[-1][1]))
+            forra = []
+            continue
         
-        if n > max_iter:
-            raise RuntimeError("Newtons metod konvergerade inte")
+        dfx = df(xk, p)
+        if forra:
+            _, x_forra, df_forra = forra[-1]
+            # Ett steg som är mycket längre än förra steget räknas som ett hopp
+            hopp = (len(forra) == 2 and
+                    np.abs(xk - x_forra) > max(10 * np.abs(x_forra - forra[0][1]), 1e3 * tol))
+            if hopp:
+                # Newton hamnade på en annan gren: den följda grenen tog slut
+                handelser.append(("vändpunkt", k, p, x_forra))
+                forra = []
+            elif np.sign(dfx) != np.sign(df_forra) and not korsad:
+                # f' byter tecken längs en jämn gren: en annan gren korsar
+                handelser.append(("korsning", k, p, xk))
+        
+        korsad = False
+        x[k] = xk
+        forra = (forra + [(p, xk, dfx)])[-2:]
     
-    if verbose:
-        print(f"\n  Nollställe: x = {x:.15f}")
-        print(f"  Verifiering: f(x) = {f(x):.2e}")
+    return x, n, handelser
+
+
+# Avstånd mellan värdena i det grova svepet som ger startvärden till segmenten
+GROVSTEG = 16
+
+
+def fortsattning(f, df, x0, parametervarden, tol=1e-10, max_iter=50, processer=1):
+    """
+    Följer ett nollställe till f(x, p) när parametern p sveps, t.ex. L.
+    Varje lösning warm-startas från de föregående med en sekantprediktor,
+    vilket kräver betydligt färre Newtoniterationer än att starta om från
+    x0 för varje parametervärde.
+    
+    Med processer > 1 delas svepet i lika många segment. Segmentens
+    startvärden tas fram med ett grovt svep över vart GROVSTEG:e
+    parametervärde, och segmenten löses sedan parallellt. f och df måste
+    då vara vanliga funktioner på modulnivå (t.ex. f_L och df_L), inte lambdas.
+    
+    Returnerar (x, n, händelser) där x är nollstället per parametervärde
+    (NaN där inget nollställe hittades), n antalet iterationer (max_iter
+    där inget nollställe hittades) och händelser en lista med
+    (typ, index, p, x) för vändpunkter och korsningar.
+    """
+    parametervarden = np.asarray(parametervarden, dtype=float)
+    if processer is None:
+        processer = os.cpu_count() or 1
+    processer = max(1, min(processer, len(parametervarden) // (2 * GROVSTEG)))
+    if processer == 1:
+        return _svep(f, df, x0, parametervarden, tol, max_iter)
+    
+    # Grovt svep över vart GROVSTEG:e värde ger startvärden för segmenten,
+    # som börjar i värden som finns med i det grova svepet
+    grov = parametervarden[::GROVSTEG]
+    x_grov, _, _ = _svep(f, df, x0, grov, tol, max_iter)
+    forsta = [int(d[0]) * GROVSTEG for d in np.array_split(np.arange(len(grov)), processer)]
+    segment = np.split(parametervarden, forsta[1:])
+    starter = [x_grov[i // GROVSTEG] if np.isfinite(x_grov[i // GROVSTEG]) else x0 for i in forsta]
+    
+    with ProcessPoolExecutor(processer) as pool:
+        delar = list(pool.map(_svep, repeat(f), repeat(df), starter, segment,
+                              repeat(tol), repeat(max_iter)))
     
-    return x, n, history
+    handelser = []
+    forskjutning = 0
+    for s, (_, _, h) in zip(segment, delar):
+        handelser.extend((typ, k + forskjutning, p, xk) for typ, k, p, xk in h)
+        forskjutning += len(s)
+    return (np.concatenate([d[0] for d in delar]),
+            np.concatenate([d[1] for d in delar]), handelser)
+
+
+# BENCHMARK AV LÖSARNA
+# Lösarna som jämförs: namn -> anrop med (f, df, g, x0, tol, max_iter, historik)
+LOSARE = {
+    "fixpunkt": lambda f, df, g, x0, tol, max_iter, historik:
+        fixpunktsmetoden(g, x0, tol, max_iter, verbose=False, historik=historik),
+    "steffensen": lambda f, df, g, x0, tol, max_iter, historik:
+        fixpunktsmetoden(g, x0, tol, max_iter, verbose=False, accelerera=True, historik=historik),
+    "newton": lambda f, df, g, x0, tol, max_iter, historik:
+        newtons_metod(f, df, x0, tol, max_iter, verbose=False, historik=historik),
+    "newton_dual": lambda f, df, g, x0, tol, max_iter, historik:
+        newtons_metod(f, None, x0, tol, max_iter, verbose=False, historik=historik),
+}
+
+BENCHMARKFALT = ["losare", "x0", "tol", "status", "rot", "iterationer",
+                 "anrop_f", "anrop_df", "anrop_g", "sekunder", "ordning"]
+
+
+def _raknad(funktion, raknare, nyckel):
+    """Returnerar en variant av funktionen som räknar sina anrop i raknare[nyckel]"""
+    def raknad(x):
+        raknare[nyckel] += 1
+        return funktion(x)
+    return raknad
+
+
+def uppskatta_ordning(history):
+    """
+    Uppskattar konvergensordningen q ur de tre sista stegen:
+    q ≈ log(e_{n+1}/e_n) / log(e_n/e_{n-1}) med e_n = |x_{n+1} - x_n|.
+    Returnerar NaN om det finns för få steg.
+    """
+    e = np.abs(np.diff(np.asarray(history, dtype=float)))
+    e = e[e > 0]
+    if len(e) < 3:
+        return np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.log(e[-1] / e[-2]) / np.log(e[-2] / e[-3]))
+
+
+def kor_losarbenchmark(startvarden, toleranser, losare=None, upprepningar=3):
+    """
+    Kör lösarna för alla kombinationer av startvärde och tolerans.
+    Antal anrop, rot och konvergensordning tas från en körning med historik,
+    tiden är den kortaste av flera körningar utan historik.
+    Returnerar en lista med en dict per körning, med fälten i BENCHMARKFALT.
+    """
+    losare = losare or list(LOSARE)
+    rader = []
+    for namn in losare:
+        losa = LOSARE[namn]
+        for tol_ in toleranser:
+            for x0 in startvarden:
+                raknare = {"f": 0, "df": 0, "g": 0}
+                rad = {"losare": namn, "x0": float(x0), "tol": float(tol_),
+                       "status": "ok", "rot": np.nan, "iterationer": 0, "sekunder": np.nan}
+                with np.errstate(all='ignore'):
+                    try:
+                        x, n, history = losa(_raknad(f, raknare, "f"), _raknad(df, raknare, "df"),
+                                             _raknad(g, raknare, "g"), x0, tol_, max_iter, True)
+                        rad.update(rot=float(x), iterationer=n, ordning=uppskatta_ordning(history))
+                        if not np.isfinite(x):
+                            rad["status"] = "icke ändligt värde"
+                    except (RuntimeError, OverflowError, ZeroDivisionError) as e:
+                        rad.update(status=str(e), ordning=np.nan)
+                    
+                    if rad["status"] == "ok":
+                        sekunder = float("inf")
+                        for _ in range(upprepningar):
+                            start = time.perf_counter()
+                            losa(f, df, g, x0, tol_, max_iter, False)
+                            sekunder = min(sekunder, time.perf_counter() - start)
+                        rad["sekunder"] = sekunder
+                rad.update(anrop_f=raknare["f"], anrop_df=raknare["df"], anrop_g=raknare["g"])
+                rader.append(rad)
+    return rader
+
+
+def sammanfatta_benchmark(rader):
+    """
+    Sammanfattar benchmarkraderna per lösare: andel lyckade körningar,
+    median av iterationer, anrop, tid och ordning för de lyckade samt
+    antal körningar per felorsak.
+    """
+    sammanfattning = {}
+    for namn in dict.fromkeys(r["losare"] for r in rader):
+        egna = [r for r in rader if r["losare"] == namn]
+        ok = [r for r in egna if r["status"] == "ok"]
+        fel = {}
+        for r in egna:
+            if r["status"] != "ok":
+                fel[r["status"]] = fel.get(r["status"], 0) + 1
+        median = lambda falt: float(np.median([r[falt] for r in ok])) if ok else None
+        sammanfattning[namn] = {
+            "korningar": len(egna),
+            "lyckade": len(ok),
+            "iterationer": median("iterationer"),
+            "anrop": float(np.median([r["anrop_f"] + r["anrop_df"] + r["anrop_g"] for r in ok])) if ok else None,
+            "sekunder": median("sekunder"),
+            "ordning": float(np.nanmedian([r["ordning"] for r in ok])) if ok else None,
+            "fel": fel,
+        }
+    return sammanfattning
+
+
+def spara_benchmark(rader, filnamn):
+    """
+    Sparar benchmarken som JSON (med sammanfattning) eller, om filnamnet
+    slutar på .csv, som CSV med en rad per körning.
+    """
+    if filnamn.endswith(".csv"):
+        with open(filnamn, 'w', newline='', encoding='utf-8') as fil:
+            skrivare = csv.DictWriter(fil, fieldnames=BENCHMARKFALT)
+            skrivare.writeheader()
+            skrivare.writerows(rader)
+        return
+    # NaN är inte giltig JSON, skriv null i stället
+    rena = [{k: (None if isinstance(v, float) and not np.isfinite(v) else v) for k, v in r.items()}
+            for r in rader]
+    with open(filnamn, 'w', encoding='utf-8') as fil:
+        json.dump({"tid": time.strftime("%Y-%m-%d %H:%M:%S"), "numpy": np.__version__,
+                   "sammanfattning": sammanfatta_benchmark(rader), "korningar": rena},
+                  fil, ensure_ascii=False, indent=2)
 
 
 # UPPGIFT 1e: JÄMFÖRELSE AV KONVERGENSHASTIGHET
+def konvergensjamforelse(x0_compare):
+    """
+    Löser från samma startvärde med fixpunktsmetoden, Steffensen och Newton.
+    Returnerar {metod: (x, n, |x_n+1 - x_n| per iteration)} utan att plotta.
+    """
+    resultat = {}
+    for metod, losa in (
+            ("fixpunkt", lambda: fixpunktsmetoden(g, x0_compare, tol, max_iter, verbose=False)),
+            ("steffensen", lambda: fixpunktsmetoden(g, x0_compare, tol, max_iter, verbose=False, accelerera=True)),
+            ("newton", lambda: newtons_metod(f, df, x0_compare, tol, max_iter, verbose=False))):
+        x, n, history = losa()
+        resultat[metod] = (x, n, np.abs(np.diff(history)))
+    return resultat
+
+
 def compare_convergence(x0_compare):
     """
     Jämför konvergenshastigheten mellan fixpunkt och Newton.
     """
-    print(f"\nStartvärde för båda metoderna: x0 = {x0_compare}")
-    
-    # Fixpunktsmetoden
-    x_fp, n_fp, hist_fp = fixpunktsmetoden(g, x0_compare, tol, max_iter, verbose=False)
-    err_fp = [np.abs(hist_fp[i+1] - hist_fp[i]) for i in range(len(hist_fp)-1)]
+    print(f"\nStartvärde för alla metoder: x0 = {x0_compare}")
     
-    # Newtons metod
-    x_n, n_n, hist_n = newtons_metod(f, df, x0_compare, tol, max_iter, verbose=False)
-    err_n = [np.abs(hist_n[i+1] - hist_n[i]) for i in range(len(hist_n)-1)]
+    resultat = konvergensjamforelse(x0_compare)
+    x_fp, n_fp, err_fp = resultat["fixpunkt"]
+    x_st, n_st, err_st = resultat["steffensen"]
+    x_n, n_n, err_n = resultat["newton"]
     
     print(f"\nFixpunktsmetoden: {n_fp} iterationer, x = {x_fp:.10f}")
+    print(f"Steffensen (Aitken Δ²): {n_st} iterationer ({2*n_st} anrop av g), x = {x_st:.10f}")
     print(f"Newtons metod: {n_n} iterationer, x = {x_n:.10f}")
     
+    plt = _pyplot()
     plt.figure(figsize=(10, 6))
     plt.semilogy(range(len(err_fp)), err_fp, 'o-', color='red', 
                  linewidth=2, markersize=6, label='Fixpunktsmetoden')
+    plt.semilogy(range(len(err_st)), err_st, '^-', color='green', 
+                 linewidth=2, markersize=6, label='Steffensen (Aitken Δ²)')
     plt.semilogy(range(len(err_n)), err_n, 's-', color='blue', 
                  linewidth=2, markersize=6, label='Newtons metod')
     plt.xlabel('Iteration n', fontsize=12)
@@ -224,10 +959,37 @@ def compare_convergence(x0_compare):
     plt.show()
     
     print(f"\nKvot: {n_fp / n_n:.1f}x fler iterationer för fixpunkt")
+    print(f"Kvot: {n_fp / n_st:.1f}x fler iterationer för fixpunkt än för Steffensen")
 
 
 # HUVUDPROGRAM
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Uppgift 1: Numerisk beräkning av nollställen")
+    parser.add_argument("--benchmark", metavar="FIL",
+                        help="Kör benchmark av lösarna utan plottar och spara i FIL (.json eller .csv)")
+    parser.add_argument("--startvarden", type=int, default=19,
+                        help="Antal startvärden jämnt fördelade på (0, L) i benchmarken")
+    parser.add_argument("--toleranser", type=float, nargs="+", default=[1e-6, 1e-10, 1e-14],
+                        help="Toleranser i benchmarken")
+    parser.add_argument("--testa", action="store_true",
+                        help="Kör testerna utan plottar och avsluta")
+    args = parser.parse_args(argv)
+    
+    if args.testa:
+        ok = test_hitta_nollstallen()
+        ok &= test_fortsattning()
+        return 0 if ok else 1
+    
+    if args.benchmark:
+        startvarden = np.linspace(0, L, args.startvarden + 2)[1:-1]
+        rader = kor_losarbenchmark(startvarden, args.toleranser)
+        spara_benchmark(rader, args.benchmark)
+        for namn, s in sammanfatta_benchmark(rader).items():
+            print(f"{namn:<12} {s['lyckade']}/{s['korningar']} lyckade, "
+                  f"median {s['iterationer']} iterationer, {s['anrop']} anrop")
+        print(f"Resultaten sparade i {args.benchmark}")
+        return
+    
     console_clear()
     
     print("UPPGIFT 1: NUMERISK BERÄKNING AV NOLLSTÄLLEN\n")
@@ -265,4 +1027,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
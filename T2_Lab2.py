@@ -10,13 +10,21 @@ Finita differensmetoden för: k*d²T/dx² = q(x)
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.sparse import diags
 from scipy.sparse.linalg import spsolve
 
 
 # HJÄLPFUNKTIONER
 
+def _pyplot():
+    """
+    Importerar matplotlib först när något ska plottas, så att beräkningarna
+    kan användas utan att betala för importen.
+    """
+    import matplotlib.pyplot as plt
+    return plt
+
+
 def q(x):
     """
     Källterm för värmetillförsel.
@@ -150,11 +158,18 @@ def test_T2a():
     print(f"Verifiering HL: {np.allclose(HL, HL_expected, atol=1)}")
 
 
-def solve_T2d():
+def berakna_T2d(N=100):
     """
-    T2.d) Lös för N=100 och plotta.
+    T2.d) Löser för N=100 utan att plotta.
+    
+    Parameters:
+        N : int - antal delintervall
+    
+    Returns:
+        x : array - alla punkter
+        T : array - temperaturen i alla punkter
+        T_02 : float - temperaturen vid x = 0.2
     """
-    N = 100
     k = 2.0
     TL = 2.0
     TR = 2.0
@@ -164,12 +179,21 @@ def solve_T2d():
     
     # Temperatur vid x = 0.2
     idx_02 = int(0.2 / (L / N))
-    T_02 = T[idx_02]
+    return x, T, T[idx_02]
+
+
+def solve_T2d():
+    """
+    T2.d) Lös för N=100 och plotta.
+    """
+    N = 100
+    x, T, T_02 = berakna_T2d(N)
     
     print(f"\n T2.d) Lösning för N={N}")
     print(f"Temperatur vid x = 0.2: T ≈ {T_02:.6f}")
     
     # Plotta
+    plt = _pyplot()
     plt.figure(figsize=(10, 6))
     plt.plot(x, T, 'b-', linewidth=2)
     plt.plot(0.2, T_02, 'ro', markersize=10, label=f'T(0.2) ≈ {T_02:.4f}')
@@ -183,9 +207,16 @@ def solve_T2d():
     return T_02
 
 
-def solve_T2e():
+def berakna_T2e(N_values=(50, 100, 200, 400, 800)):
     """
-    T2.e) Konvergensstudie - temperatur vid x = 0.7.
+    T2.e) Konvergensstudie vid x = 0.7 utan utskrifter och plottar.
+    
+    Parameters:
+        N_values : list - antal delintervall att jämföra
+    
+    Returns:
+        dict med N, h, T(0.7), fel mot konvergensvärdet och
+        noggrannhetsordningen p mellan varje par av N
     """
     k = 2.0
     TL = 2.0
@@ -194,15 +225,10 @@ def solve_T2e():
     x_target = 0.7
     T_converged = 1.6379544  # Konvergensvärde
     
-    N_values = [50, 100, 200, 400, 800]
     T_values = []
     h_values = []
     errors = []
     
-    print(f"\n T2.e) Konvergensstudie vid x = {x_target} ")
-    print(f"{'N':<6} {'h':<10} {'T(0.7)':<15} {'Fel':<15}")
-    print("-" * 50)
-    
     for N in N_values:
         h = L / N
         x, T = solve_temperature(N, q, k, TL, TR, L)
@@ -210,12 +236,34 @@ def solve_T2e():
         # Hitta närmaste punkt till x = 0.7
         idx = np.argmin(np.abs(x - x_target))
         T_07 = T[idx]
-        error = np.abs(T_07 - T_converged)
         
         T_values.append(T_07)
         h_values.append(h)
-        errors.append(error)
-        
+        errors.append(np.abs(T_07 - T_converged))
+    
+    # p ≈ log(e(h)/e(h/2)) / log(2)
+    errors = np.array(errors)
+    orders = np.log(errors[:-1] / errors[1:]) / np.log(2)
+    
+    return {"x_target": x_target, "N": list(N_values), "h": h_values,
+            "T": T_values, "errors": errors, "orders": orders}
+
+
+def solve_T2e():
+    """
+    T2.e) Konvergensstudie - temperatur vid x = 0.7.
+    """
+    studie = berakna_T2e()
+    N_values = studie["N"]
+    h_values = studie["h"]
+    errors = studie["errors"]
+    orders = studie["orders"]
+    
+    print(f"\n T2.e) Konvergensstudie vid x = {studie['x_target']} ")
+    print(f"{'N':<6} {'h':<10} {'T(0.7)':<15} {'Fel':<15}")
+    print("-" * 50)
+    
+    for N, h, T_07, error in zip(N_values, h_values, studie["T"], errors):
         print(f"{N:<6} {h:<10.5f} {T_07:<15.8f} {error:<15.6e}")
     
     # Beräkna noggrannhetsordning
@@ -223,25 +271,14 @@ def solve_T2e():
     print(f"{'N':<6} {'N*2':<6} {'e(h)':<15} {'e(h/2)':<15} {'p':<10}")
     print("-" * 60)
     
-    errors = np.array(errors)
-    orders = []
-    
-    for i in range(len(N_values) - 1):
-        N1 = N_values[i]
-        N2 = N_values[i + 1]
-        e1 = errors[i]
-        e2 = errors[i + 1]
-        
-        # p ≈ log(e(h)/e(h/2)) / log(2)
-        p = np.log(e1 / e2) / np.log(2)
-        orders.append(p)
-        
-        print(f"{N1:<6} {N2:<6} {e1:<15.6e} {e2:<15.6e} {p:<10.3f}")
+    for i, p in enumerate(orders):
+        print(f"{N_values[i]:<6} {N_values[i + 1]:<6} {errors[i]:<15.6e} {errors[i + 1]:<15.6e} {p:<10.3f}")
     
     print(f"\nMedel noggrannhetsordning: {np.mean(orders):.3f}")
     print(f"Teoretisk ordning för centrala differenser: 2")
     
     # Plotta konvergens
+    plt = _pyplot()
     plt.figure(figsize=(10, 6))
     plt.loglog(h_values, errors, 'bo-', label='Beräknade fel', markersize=8)
     plt.loglog(h_values, np.array(h_values)**2 * errors[0] / h_values[0]**2, 
@@ -254,11 +291,16 @@ def solve_T2e():
     plt.show()
 
 
-def solve_T2f():
+def berakna_T2f(N=100):
     """
-    T2.f) Testa olika randvillkor.
+    T2.f) Löser för olika randvillkor utan att plotta.
+    
+    Parameters:
+        N : int - antal delintervall
+    
+    Returns:
+        list - (etikett, x, T) för varje fall
     """
-    N = 100
     k = 2.0
     L = 1.0
     
@@ -270,11 +312,17 @@ def solve_T2f():
         (0.0, 20.0, "TL = 0°C, TR = 20°C")
     ]
     
+    return [(label, *solve_temperature(N, q, k, TL, TR, L)) for TL, TR, label in cases]
+
+
+def solve_T2f():
+    """
+    T2.f) Testa olika randvillkor.
+    """
+    plt = _pyplot()
     plt.figure(figsize=(12, 8))
     
-    for i, (TL, TR, label) in enumerate(cases, 1):
-        x, T = solve_temperature(N, q, k, TL, TR, L)
-        
+    for i, (label, x, T) in enumerate(berakna_T2f(), 1):
         plt.subplot(2, 2, i)
         plt.plot(x, T, 'b-', linewidth=2)
         plt.xlabel('Position x (m)')